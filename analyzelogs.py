@@ -0,0 +1,538 @@
+#Offline analysis of captures (capturelogs.py output, text or .mblog)
+#
+# For every session in every file:
+#   stats       sample count, rate, gaps, per axis mean/std/min/max, mounting roll/pitch
+#   spectrum    averaged (Welch style) power spectrum of the gravity free acceleration:
+#               the strongest vibration frequencies and how the energy splits into bands
+#   events      braking, accelerating, turning and turbulence, with hysteresis and a
+#               minimum duration, each with its start, length and peak
+#   gain        percentiles of the lateral acceleration the overlay shows and the
+#               Overlay.gain that puts the p99 at the edge of the dot's travel
+#   preview     downsampled track (one row per --preview-seconds), written as CSV
+#               with --preview DIR and drawn as a sparkline in the text report
+#
+# Files are read --chunk-mb at a time and every statistic is updated per chunk
+# with running sums/histograms, so memory doesn't grow with the length of a
+# capture. Sessions don't depend on each other: their byte ranges come from the
+# log's sidecar index (logindex.py, built on the first run), then every session
+# range is analysed in a process pool (--jobs, default all cores). --session N
+# and --from/--to (seconds from the first sample of the file or of session N)
+# only read the blocks of the log that hold them. Sessions are numbered the way
+# the index counts them (START to START), like --session, logindex.py and
+# replay.py, and one without samples is still listed.
+#
+# Axes are the sensor's, like the overlay: x forward, y left. Turning and
+# turbulence use the measured gravity direction, so they don't depend on how the
+# board is mounted. The motion filter takes the FILTER_* settings of config.json.
+#
+# Usage:
+#   python analyzelogs.py [--json] [--jobs N] [--preview DIR] [--preview-seconds S]
+#                         [--chunk-mb M] [--events N] [--session N] [--from S] [--to S]
+#                         logs.txt [more.mblog ...]
+
+import concurrent.futures
+import json
+import os
+import sys
+
+import numpy as np
+
+import binlogs
+import calibration
+import configstore
+import imulogs
+import logindex
+import motionfilter
+
+ACCEL_LSB_PER_G = calibration.ACCEL_LSB_PER_G
+GYRO_LSB_PER_DPS = motionfilter.GYRO_LSB_PER_DPS
+
+OVERLAY_MAX_OFFSET = 36  # Overlay.max_offset, pixels
+
+SEGMENT = 256  # samples per FFT
+BANDS = ((0.0, 1.0), (1.0, 5.0), (5.0, 20.0), (20.0, float("inf")))
+MAX_RATE = 2000.0  # bursts of buffered samples arrive all at once, don't take that as the rate
+GAP_INTERVALS = 5  # a gap is a step of more than this many sample intervals
+LATERAL_EDGES = np.linspace(0.0, 4.0, 1601)  # |lateral accel| histogram, g
+
+# name: (threshold, release, minimum seconds). Braking/accelerating in g along x,
+# turning in deg/s around the gravity axis, turbulence in g RMS along it.
+EVENTS = {
+    "braking": (0.15, 0.08, 0.5),
+    "accelerating": (0.15, 0.08, 0.5),
+    "turning": (10.0, 5.0, 1.0),
+    "turbulence": (0.08, 0.05, 0.5),
+}
+TURBULENCE_WINDOW = 0.5  # seconds, RMS time constant
+# Braking/accelerating last seconds, longer than the fusion filter's time constant
+# lets through, so they're measured against a slow baseline of the accel instead
+BASELINE_SECONDS = 10.0
+LONGITUDINAL_CUTOFF_HZ = 1.0
+
+RECORDS_PER_CHUNK = 1 << 18  # .mblog records per pass
+SPARK = " .:-=+*#%@"
+
+
+class EventDetector:
+    """Runs where a signal goes over threshold until it drops under release, across chunks."""
+
+    def __init__(self, name, threshold, release, min_seconds):
+        self.name = name
+        self.threshold = threshold
+        self.release = release
+        self.min_seconds = min_seconds
+        self.active = False
+        self.start_time = None
+        self.peak = -np.inf
+        self.count = 0
+        self.seconds = 0.0
+
+    def feed(self, times, values):
+        """Returns the events that ended in this chunk as (start, seconds, peak)."""
+        n = len(values)
+        if n == 0:
+            return []
+        marks = np.full(n, -1, dtype=np.int8)
+        marks[values < self.release] = 0
+        marks[values > self.threshold] = 1
+        # Hysteresis: every sample takes the last decisive mark at or before it
+        known = np.flatnonzero(marks >= 0)
+        last = np.searchsorted(known, np.arange(n), side="right") - 1
+        state = np.where(last >= 0, marks[known[np.maximum(last, 0)]], int(self.active)).astype(np.int8)
+        edges = np.diff(state, prepend=np.int8(self.active))
+        starts = np.flatnonzero(edges == 1).tolist()
+        ends = np.flatnonzero(edges == -1).tolist()
+        if self.active:
+            starts.insert(0, None)
+        if state[-1]:
+            ends.append(n)
+
+        events = []
+        for start, end in zip(starts, ends):
+            first = 0 if start is None else start
+            peak = float(values[first:end].max()) if end > first else -np.inf
+            if start is None:
+                start_time, peak = self.start_time, max(peak, self.peak)
+            else:
+                start_time = float(times[start])
+            if end == n:
+                self.start_time, self.peak = start_time, peak  # Still going at the end of the chunk
+                continue
+            events += self.close(start_time, float(times[end]), peak)
+        self.active = bool(state[-1])
+        return events
+
+    def finish(self, end_time):
+        if not self.active:
+            return []
+        self.active = False
+        return self.close(self.start_time, end_time, self.peak)
+
+    def close(self, start_time, end_time, peak):
+        if end_time - start_time < self.min_seconds:
+            return []
+        self.count += 1
+        self.seconds += end_time - start_time
+        return [(start_time, end_time - start_time, peak)]
+
+
+class SessionAnalysis:
+    def __init__(self, start=None, preview_seconds=1.0, max_events=50, filter_settings=None):
+        self.start = start
+        self.end = None
+        self.errors = 0
+        self.preview_seconds = preview_seconds
+        self.max_events = max_events
+        self.filter_settings = filter_settings or {}
+
+        self.count = 0
+        self.first_time = None
+        self.last_time = None
+        self.stats = calibration.RunningStats(6)
+        self.low = np.full(6, np.inf)
+        self.high = np.full(6, -np.inf)
+        self.gaps = 0
+        self.gap_seconds = 0.0
+
+        self.filter = None
+        self.rate = None
+        self.tilt = calibration.RunningStats(2)
+        self.lateral = np.zeros(len(LATERAL_EDGES) - 1, dtype=np.int64)
+        self.power = np.zeros(SEGMENT // 2 + 1)
+        self.segments = 0
+        self.pending = np.zeros((0, 3))
+        self.window = np.hanning(SEGMENT)[:, None]
+        self.turbulence = np.zeros(1)
+        self.baseline = None
+        self.smooth = None
+        self.detectors = [EventDetector(name, *settings) for name, settings in EVENTS.items()]
+        self.events = []
+        self.buckets = {}
+
+    def feed(self, times, imu):
+        times = np.asarray(times, dtype=np.float64)
+        imu = np.asarray(imu, dtype=np.float64)
+        n = len(times)
+        if n == 0:
+            return
+        if self.filter is None:
+            # The rate comes from the data, the first chunk is plenty to estimate it
+            span = times[-1] - times[0]
+            self.rate = min((n - 1) / span, MAX_RATE) if n > 1 and span > 0 else 100.0
+            self.filter = motionfilter.MotionFilter(self.rate, **self.filter_settings)
+            self.first_time = times[0]
+            self.baseline = imu[0, 0:3].copy()
+            self.smooth = imu[0, 0:3].copy()
+
+        previous = self.last_time if self.last_time is not None else times[0]
+        dt = np.diff(times, prepend=previous)
+        gaps = dt > GAP_INTERVALS / self.rate
+        self.gaps += int(gaps.sum())
+        self.gap_seconds += float(dt[gaps].sum())
+        self.count += n
+        self.last_time = times[-1]
+        self.stats.update_batch(imu)
+        np.minimum(self.low, imu.min(axis=0), out=self.low)
+        np.maximum(self.high, imu.max(axis=0), out=self.high)
+
+        linear, gravity, roll, pitch = self.filter.process(times, imu)
+        self.tilt.update_batch(np.column_stack((roll, pitch)))
+        up = gravity / np.maximum(np.linalg.norm(gravity, axis=1, keepdims=True), 1.0)
+        dynamic = imu[:, 0:3] - gravity  # not low passed, for the spectrum and turbulence
+
+        lateral = np.max(np.abs(linear[:, 0:2]), axis=1) / ACCEL_LSB_PER_G
+        self.lateral += np.histogram(lateral, LATERAL_EDGES)[0]
+        self.lateral[-1] += int((lateral >= LATERAL_EDGES[-1]).sum())
+
+        self.feed_spectrum(dynamic)
+
+        vertical = np.einsum("ij,ij->i", dynamic, up) / ACCEL_LSB_PER_G
+        a = np.exp(-1.0 / (TURBULENCE_WINDOW * self.rate))
+        mean_square, self.turbulence = motionfilter.first_order_iir((1 - a) * vertical[:, None] ** 2, a, self.turbulence)
+        yaw = np.einsum("ij,ij->i", imu[:, 3:6], up) / GYRO_LSB_PER_DPS
+        a = np.exp(-1.0 / (BASELINE_SECONDS * self.rate))
+        baseline, self.baseline = motionfilter.first_order_iir((1 - a) * imu[:, 0:3], a, self.baseline)
+        a = motionfilter.smoothing_factor(LONGITUDINAL_CUTOFF_HZ, self.rate)
+        smooth, self.smooth = motionfilter.first_order_iir((1 - a) * imu[:, 0:3], a, self.smooth)
+        forward = (smooth[:, 0] - baseline[:, 0]) / ACCEL_LSB_PER_G
+        signals = {
+            "braking": -forward,
+            "accelerating": forward,
+            "turning": np.abs(yaw),
+            "turbulence": np.sqrt(mean_square[:, 0]),
+        }
+        for detector in self.detectors:
+            self.add_events(detector.name, detector.feed(times, signals[detector.name]))
+
+        self.feed_preview(times, linear, lateral, roll, pitch)
+
+    def feed_spectrum(self, dynamic):
+        data = np.concatenate((self.pending, dynamic)) if len(self.pending) else dynamic
+        usable = len(data) // SEGMENT * SEGMENT
+        if usable:
+            segments = data[:usable].reshape(-1, SEGMENT, 3)
+            segments = (segments - segments.mean(axis=1, keepdims=True)) * self.window
+            self.power += (np.abs(np.fft.rfft(segments, axis=1)) ** 2).sum(axis=(0, 2))
+            self.segments += len(segments)
+        self.pending = data[usable:].copy()
+
+    def feed_preview(self, times, linear, lateral, roll, pitch):
+        index = ((times - self.first_time) // self.preview_seconds).astype(np.int64)
+        buckets, inverse = np.unique(index, return_inverse=True)
+        counts = np.bincount(inverse)
+        sums = np.stack([np.bincount(inverse, weights=column) for column in (linear[:, 0], linear[:, 1], linear[:, 2], roll, pitch)], axis=1)
+        peaks = np.full(len(buckets), -np.inf)
+        np.maximum.at(peaks, inverse, lateral)
+        for bucket, count, total, peak in zip(buckets.tolist(), counts.tolist(), sums.tolist(), peaks.tolist()):
+            row = self.buckets.get(bucket)
+            if row is None:
+                self.buckets[bucket] = [count, total, peak]
+            else:
+                row[0] += count
+                row[1] = [x + y for x, y in zip(row[1], total)]
+                row[2] = max(row[2], peak)
+
+    def add_events(self, name, events):
+        for start, seconds, peak in events:
+            self.events.append({"type": name, "start": round(start - self.first_time, 3),
+                                "seconds": round(seconds, 3), "peak": round(peak, 3)})
+        if len(self.events) > 2 * self.max_events:
+            # Keep the earliest ones, whatever order the detectors closed them in
+            self.events.sort(key=lambda event: event["start"])
+            del self.events[self.max_events:]
+
+    def finish(self):
+        if self.count == 0:
+            # Kept so results stay numbered like the log's sessions
+            return {"start": self.start, "end": self.end, "errors": self.errors, "samples": 0}
+        for detector in self.detectors:
+            self.add_events(detector.name, detector.finish(self.last_time))
+        self.events.sort(key=lambda event: event["start"])
+        del self.events[self.max_events:]
+        duration = self.last_time - self.first_time
+        rate = (self.count - 1) / duration if self.count > 1 and duration > 0 else self.rate
+
+        cumulative = np.cumsum(self.lateral)
+        percentiles = {}
+        for q in (50, 95, 99):
+            index = int(np.searchsorted(cumulative, q / 100 * cumulative[-1]))
+            percentiles[f"p{q}"] = round(float(LATERAL_EDGES[min(index + 1, len(LATERAL_EDGES) - 1)]), 3)
+        p99_counts = percentiles["p99"] * ACCEL_LSB_PER_G
+
+        rate = min(rate, MAX_RATE)
+        return {
+            "start": self.start,
+            "end": self.end,
+            "errors": self.errors,
+            "samples": self.count,
+            "seconds": round(duration, 3),
+            "rate": round(rate, 2),
+            "gaps": self.gaps,
+            "gap_seconds": round(self.gap_seconds, 3),
+            "mean": self.stats.mean.round(1).tolist(),
+            "std": self.stats.std.round(1).tolist(),
+            "min": self.low.astype(int).tolist(),
+            "max": self.high.astype(int).tolist(),
+            "roll": round(float(self.tilt.mean[0]), 2),
+            "pitch": round(float(self.tilt.mean[1]), 2),
+            "spectrum": self.spectrum(rate),
+            "lateral_g": percentiles,
+            "suggested_gain": round(OVERLAY_MAX_OFFSET / p99_counts, 5) if p99_counts > 0 else None,
+            "event_counts": {d.name: d.count for d in self.detectors},
+            "event_seconds": {d.name: round(d.seconds, 2) for d in self.detectors},
+            "events": self.events,
+            "preview": self.preview(),
+        }
+
+    def spectrum(self, rate):
+        if self.segments == 0:
+            return None
+        power = self.power / self.segments
+        frequencies = np.fft.rfftfreq(SEGMENT, 1.0 / rate)
+        # Peaks are local maxima, leaving out DC and the lowest bin (what's left of the tilt)
+        inner = power[1:-1]
+        local = np.flatnonzero((inner > power[:-2]) & (inner >= power[2:])) + 1
+        local = local[local > 1]
+        top = local[np.argsort(power[local])[::-1][:5]]
+        total = power[1:].sum() or 1.0
+        # Amplitude of a sine at the bin, for a Hann window over 3 axes summed
+        scale = 2.0 / (np.hanning(SEGMENT).sum() * ACCEL_LSB_PER_G)
+        return {
+            "resolution_hz": round(rate / SEGMENT, 3),
+            "peaks": [{"hz": round(float(frequencies[i]), 2), "g": round(float(np.sqrt(power[i]) * scale), 4)} for i in top],
+            "bands": {
+                f"{low:g}-{high:g}Hz": round(float(power[(frequencies >= low) & (frequencies < high) & (frequencies > 0)].sum() / total), 3)
+                for low, high in BANDS
+            },
+        }
+
+    def preview(self):
+        rows = []
+        for bucket in sorted(self.buckets):
+            count, total, peak = self.buckets[bucket]
+            mean = [x / count for x in total]
+            rows.append([round(bucket * self.preview_seconds, 3)]
+                        + [round(x / ACCEL_LSB_PER_G, 4) for x in mean[0:3]]
+                        + [round(peak, 4), round(mean[3], 2), round(mean[4], 2)])
+        return rows
+
+
+PREVIEW_COLUMNS = ["t", "linear_x_g", "linear_y_g", "linear_z_g", "lateral_peak_g", "roll", "pitch"]
+
+
+def session_ranges(path, session=None, window=None):
+    """(begin, stop, limits, number) of every session to analyse, byte offsets for text logs
+    and record numbers for .mblog, found through the log's sidecar index. number is the
+    session's place in the index (from 0), the one --session, logindex and replay.load_part
+    count. With a window (start, end in seconds from the first sample of the file, or of the
+    session) only the blocks holding it are read and limits is the window as absolute times."""
+    index = logindex.LogIndex(path)
+    if session is not None and not 0 <= session < len(index.sessions):
+        raise ValueError(f"{path} has {len(index.sessions)} sessions, there is no session {session + 1}")
+    numbers = range(len(index.sessions)) if session is None else [session]
+    if window is None:
+        ranges = [index.session_range(number) + (None, number) for number in numbers]
+    else:
+        origin = index.first_time if session is None else index.sessions[session]["first"]
+        limits = (origin + window[0], origin + window[1]) if origin is not None else (0.0, -1.0)
+        ranges = []
+        for number in numbers:
+            blocks = index.block_ranges(*limits, *index.session_range(number))
+            if blocks:
+                ranges.append((blocks[0][0], blocks[-1][1], limits, number))
+    if path.endswith(".mblog"):
+        size = binlogs.RECORD_DTYPE.itemsize
+        ranges = [((begin - binlogs.HEADER.size) // size, (stop - binlogs.HEADER.size) // size, limits, number)
+                  for begin, stop, limits, number in ranges]
+    return ranges
+
+
+def iter_text_range(path, begin, stop, chunk_bytes):
+    """(start, end, errors, times, imu) per piece of a session's byte range."""
+    for chunk in imulogs.iter_chunks(path, begin, stop, chunk_bytes):
+        for session in chunk.sessions:
+            yield session.start, session.end, len(session.errors), session.times, session.imu
+
+
+def iter_binary_range(path, begin, stop):
+    records = binlogs.BinaryLog(path).records
+    for first in range(begin, stop, RECORDS_PER_CHUNK):
+        chunk = records[first:min(first + RECORDS_PER_CHUNK, stop)]
+        kinds = chunk["kind"]
+        samples = kinds == binlogs.SAMPLE
+        start = float(chunk["time"][0]) if first == begin and kinds[0] == binlogs.START else None
+        ends = chunk["time"][kinds == binlogs.END]
+        yield (start, float(ends[-1]) if len(ends) else None, int((kinds == binlogs.ERROR).sum()),
+               chunk["time"][samples], chunk["imu"][samples])
+
+
+def analyze_range(path, begin, stop, options, limits=None, number=0):
+    """Analyses one session's range of a file (everything from its START to the next one, like
+    the index counts it). limits (start, end) leaves out the samples outside that time window.
+    The result says which session it is ("session", counted from 1 like --session)."""
+    settings = {key: options[key] for key in ("preview_seconds", "max_events", "filter_settings")}
+    if path.endswith(".mblog"):
+        pieces = iter_binary_range(path, begin, stop)
+    else:
+        pieces = iter_text_range(path, begin, stop, options["chunk_bytes"])
+    current = None
+    for start, end, errors, times, imu in pieces:
+        if current is None:
+            current = SessionAnalysis(start, **settings)
+        if limits is not None:
+            keep = (times >= limits[0]) & (times <= limits[1])
+            times, imu = times[keep], imu[keep]
+        current.feed(times, imu)
+        current.errors += errors
+        if end is not None:
+            current.end = end
+    result = (current or SessionAnalysis(**settings)).finish()
+    result["session"] = number + 1
+    return result
+
+
+def analyze(paths, jobs=None, chunk_mb=8, preview_seconds=1.0, max_events=50, session=None, window=None):
+    """Results for every session of every file, {path: [session, ...]}, in file order.
+    session (counted from 0) and window (see session_ranges) narrow it down."""
+    settings = configstore.ConfigStore("config.json").current
+    options = {
+        "chunk_bytes": int(chunk_mb * (1 << 20)),
+        "preview_seconds": preview_seconds,
+        "max_events": max_events,
+        "filter_settings": {
+            "fusion_time_constant": settings.filter_fusion_time_constant,
+            "cutoff_hz": settings.filter_cutoff_hz,
+        },
+    }
+    tasks = []
+    for path in paths:
+        tasks += [(path,) + part for part in session_ranges(path, session, window)]
+
+    if (jobs or os.cpu_count() or 1) > 1 and len(tasks) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(analyze_range, path, begin, stop, options, limits, number)
+                       for path, begin, stop, limits, number in tasks]
+            outputs = [future.result() for future in futures]
+    else:
+        outputs = [analyze_range(path, begin, stop, options, limits, number) for path, begin, stop, limits, number in tasks]
+
+    results = {path: [] for path in paths}
+    for (path, *_), session in zip(tasks, outputs):
+        results[path].append(session)
+    return results
+
+
+def sparkline(rows, width=60):
+    if not rows:
+        return ""
+    peaks = np.array([row[4] for row in rows])
+    groups = np.array_split(peaks, min(width, len(peaks)))
+    values = np.array([group.max() for group in groups])
+    top = values.max() or 1.0
+    return "".join(SPARK[int(v / top * (len(SPARK) - 1))] for v in values)
+
+
+def write_previews(results, directory):
+    os.makedirs(directory, exist_ok=True)
+    for path, sessions in results.items():
+        name = os.path.splitext(os.path.basename(path))[0]
+        for session in sessions:
+            if not session["samples"]:
+                continue
+            out = os.path.join(directory, f"{name}_session{session['session']}.csv")
+            with open(out, "w") as f:
+                f.write(",".join(PREVIEW_COLUMNS) + "\n")
+                f.write("".join(",".join(map(str, row)) + "\n" for row in session["preview"]))
+            session["preview_file"] = out
+
+
+def print_report(results):
+    for path, sessions in results.items():
+        print(f"{path}: {len(sessions)} sessions")
+        for s in sessions:
+            if not s["samples"]:
+                print(f"  Session {s['session']}: no samples, {s['errors']} errors")
+                continue
+            print(f"  Session {s['session']}: {s['samples']} samples, {s['seconds']:.1f} s at {s['rate']:.1f} Hz, "
+                  f"{s['gaps']} gaps ({s['gap_seconds']:.1f} s), {s['errors']} errors")
+            print(f"    mean {s['mean']}  std {s['std']}")
+            print(f"    mounting roll {s['roll']:.1f} pitch {s['pitch']:.1f} deg")
+            if s["spectrum"]:
+                peaks = ", ".join(f"{p['hz']:.1f} Hz ({p['g']:.3f} g)" for p in s["spectrum"]["peaks"])
+                bands = ", ".join(f"{band} {share:.0%}" for band, share in s["spectrum"]["bands"].items())
+                print(f"    vibration peaks: {peaks or 'none'}")
+                print(f"    energy by band: {bands}")
+            lateral = s["lateral_g"]
+            print(f"    lateral accel p50 {lateral['p50']:.3f} g, p95 {lateral['p95']:.3f} g, p99 {lateral['p99']:.3f} g"
+                  f" -> suggested gain {s['suggested_gain']}")
+            counts = ", ".join(f"{name} {count} ({s['event_seconds'][name]:.0f} s)" for name, count in s["event_counts"].items())
+            print(f"    events: {counts}")
+            for event in s["events"]:
+                print(f"      {event['start']:9.2f} s  {event['type']:<13} {event['seconds']:6.2f} s  peak {event['peak']:.2f}")
+            print(f"    |{sparkline(s['preview'])}|")
+            if "preview_file" in s:
+                print(f"    preview written to {s['preview_file']}")
+
+
+def option(args, flag, cast, default):
+    if flag not in args:
+        return default
+    index = args.index(flag)
+    value = cast(args[index + 1])
+    del args[index:index + 2]
+    return value
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    as_json = "--json" in args
+    if as_json:
+        args.remove("--json")
+    jobs = option(args, "--jobs", int, None)
+    chunk_mb = option(args, "--chunk-mb", float, 8)
+    preview_dir = option(args, "--preview", str, None)
+    preview_seconds = option(args, "--preview-seconds", float, 1.0)
+    max_events = option(args, "--events", int, 50)
+    session = option(args, "--session", int, None)
+    start = option(args, "--from", float, None)
+    end = option(args, "--to", float, None)
+    if not args:
+        print("Usage: python analyzelogs.py [--json] [--jobs N] [--preview DIR] [--preview-seconds S] "
+              "[--chunk-mb M] [--events N] [--session N] [--from S] [--to S] logs.txt [more.mblog ...]")
+        sys.exit(1)
+    window = None
+    if start is not None or end is not None:
+        window = (start or 0.0, end if end is not None else float("inf"))
+
+    results = analyze(args, jobs, chunk_mb, preview_seconds, max_events,
+                      session - 1 if session else None, window)
+    if preview_dir:
+        write_previews(results, preview_dir)
+    if as_json:
+        if not preview_dir:
+            for sessions in results.values():
+                for session in sessions:
+                    session.pop("preview", None)
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
@@ -0,0 +1,70 @@
+#asyncio backend core
+#
+# Owns the backend subsystems as tasks on one event loop. run() keeps them all
+# running until a stop is requested or any of them exits, then cancels the rest
+# and waits for them (structured shutdown), then runs the shutdown callbacks.
+# Blocking libraries (Flask's WSGI server, websocket-client) are wrapped by the
+# tasks themselves with asyncio.to_thread.
+#
+# The core can run on the main thread (headless) or on its own thread next to a
+# Qt event loop, request_stop() is safe to call from any thread.
+
+import asyncio
+import threading
+
+
+class BackendCore:
+    def __init__(self):
+        self.task_factories = []  # (name, coroutine function)
+        self.shutdown_callbacks = []
+        self.loop = None
+        self.stopping = None
+        self.thread = None
+        self.stop_requested = False
+
+    def add_task(self, name, coroutine_function):
+        self.task_factories.append((name, coroutine_function))
+
+    def on_shutdown(self, callback):
+        self.shutdown_callbacks.append(callback)
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        tasks = [asyncio.create_task(factory(), name=name) for name, factory in self.task_factories]
+        if self.stop_requested:
+            self.stopping.set()
+        stop_waiter = asyncio.create_task(self.stopping.wait(), name="stop")
+        try:
+            done, _ = await asyncio.wait(tasks + [stop_waiter], return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is stop_waiter or task.cancelled():
+                    continue
+                if task.exception() is not None:
+                    print(f"Backend task {task.get_name()} crashed: {task.exception()!r}")
+                else:
+                    print(f"Backend task {task.get_name()} exited")
+        finally:
+            print("Shutting down backend tasks")
+            for task in tasks + [stop_waiter]:
+                task.cancel()
+            await asyncio.gather(*tasks, stop_waiter, return_exceptions=True)
+            for callback in self.shutdown_callbacks:
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"Error during shutdown: {e}")
+
+    def request_stop(self):
+        self.stop_requested = True
+        if self.loop is None or self.loop.is_closed():
+            return
+        try:
+            self.loop.call_soon_threadsafe(self.stopping.set)
+        except RuntimeError:
+            pass  # Loop closed in the meantime, nothing left to stop
+
+    def start_in_thread(self):
+        self.thread = threading.Thread(target=asyncio.run, args=(self.run(),), name="backend-core")
+        self.thread.start()
+        return self.thread
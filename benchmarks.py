@@ -0,0 +1,282 @@
+#Benchmark suite, results as JSON so runs can be compared across commits
+#
+# Every stage is timed per call on realistic batches (batch samples per call,
+# like one serial read or one main loop pass) using synthetic data:
+#   parse_text     serialreader.TextDecoder on tab separated lines
+#   parse_binary   serialframes.FrameDecoder on binary frames
+#   parse_log      imulogs.load_log on a text capture
+#   filter         motionfilter.MotionFilter.process
+#   ring           SampleRing.push_batch + since
+#   pipeline       overlay.py source -> imu_ring -> filter -> motion_ring, latency
+#                  from the sample's timestamp to the main loop
+#   api            GET /imu_data through the Flask app
+#   overlay_frame  one overlay update + repaint (Qt offscreen platform)
+#   overlay_4k     a frame on three 3840x2160 overlays sharing one ring, painted
+#                  the way the app does it (dirty regions through the event loop)
+#   capture        capturelogs.py replaying a synthetic capture at full speed
+#
+# For each: samples/sec, p50/p99/max ms per call, batch size and iterations.
+#
+# Usage:
+#   python benchmarks.py [--quick] [--out results.json] [stage ...]
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np
+
+import synthetic
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def summarize(durations, batch):
+    durations = np.asarray(durations)
+    return {
+        "samples_per_sec": round(batch * len(durations) / durations.sum(), 1) if durations.sum() > 0 else None,
+        "p50_ms": round(float(np.percentile(durations, 50)) * 1000, 4),
+        "p99_ms": round(float(np.percentile(durations, 99)) * 1000, 4),
+        "max_ms": round(float(durations.max()) * 1000, 4),
+        "batch": batch,
+        "iterations": len(durations),
+    }
+
+
+def timed(function, inputs, batch):
+    durations = []
+    for item in inputs:
+        started = time.perf_counter()
+        function(item)
+        durations.append(time.perf_counter() - started)
+    return summarize(durations, batch)
+
+
+def synthetic_samples(count, rate=1000.0):
+    times, imu = synthetic.SyntheticIMU("drive", rate).generate(count)
+    return times, np.rint(imu).astype(np.int64)
+
+
+def bench_parse_text(iterations, batch):
+    import serialreader
+    times, imu = synthetic_samples(iterations * batch)
+    chunks = [
+        "".join("\t".join(map(str, row)) + "\r\n" for row in imu[i:i + batch].tolist()).encode()
+        for i in range(0, len(imu), batch)
+    ]
+    decoder = serialreader.TextDecoder()
+    return timed(lambda chunk: decoder.feed(chunk, 0.0), chunks, batch)
+
+
+def bench_parse_binary(iterations, batch):
+    import serialframes
+    times, imu = synthetic_samples(iterations * batch)
+    frames = [serialframes.encode_frame(i, i * 1000, row) for i, row in enumerate(imu.tolist())]
+    chunks = [b"".join(frames[i:i + batch]) for i in range(0, len(frames), batch)]
+    decoder = serialframes.FrameDecoder()
+    return timed(lambda chunk: decoder.feed(chunk, 0.0), chunks, batch)
+
+
+def bench_parse_log(iterations, batch):
+    import imulogs
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "capture.txt")
+        synthetic.write_capture(path, *synthetic.SyntheticIMU("drive", 1000.0).generate(batch), start=1.7e9)
+        with open(path, "rb") as f:
+            data = f.read()
+    return timed(imulogs.load_log, [data] * max(1, iterations // 20), batch)
+
+
+def bench_filter(iterations, batch):
+    import motionfilter
+    times, imu = synthetic_samples(iterations * batch)
+    motion = motionfilter.MotionFilter(1000.0)
+    batches = [(times[i:i + batch], imu[i:i + batch]) for i in range(0, len(times), batch)]
+    return timed(lambda b: motion.process(*b), batches, batch)
+
+
+def bench_ring(iterations, batch):
+    import samplering
+    times, imu = synthetic_samples(iterations * batch)
+    ring = samplering.SampleRing()
+    cursor = [0]
+
+    def push_and_read(b):
+        ring.push_batch(*b)
+        first_seq, cursor[0], t, data = ring.since(cursor[0])
+
+    batches = [(times[i:i + batch], imu[i:i + batch]) for i in range(0, len(times), batch)]
+    return timed(push_and_read, batches, batch)
+
+
+def bench_pipeline(seconds, rate=1000.0):
+    import asyncio
+    import configstore
+    import imusources
+    import motionfilter
+    import overlay
+    overlay.config.current = configstore.Snapshot({"IMU_TYPE": "Synthetic", "SYNTHETIC_RATE": rate})
+    overlay.motion_filter = motionfilter.MotionFilter(rate)
+
+    async def run():
+        latencies, durations, counts = [], [], []
+        overlay.imu_source = imusources.create("Synthetic", overlay.config.current)
+        await overlay.imu_source.open()
+        stop = time.monotonic() + seconds
+        while time.monotonic() < stop:
+            before = overlay.imu_ring.seq
+            started = time.perf_counter()
+            if await overlay.phisical_conenction_update():
+                overlay.process_new_samples()
+                durations.append(time.perf_counter() - started)
+                latencies.append(overlay.sample_latency)
+                counts.append(overlay.imu_ring.seq - before)
+        overlay.release_sources()
+        return latencies, durations, counts
+
+    latencies, durations, counts = asyncio.run(run())
+    result = summarize(np.asarray(latencies), round(float(np.mean(counts)), 2))
+    result["samples_per_sec"] = round(sum(counts) / seconds, 1)
+    result["rate"] = rate
+    result["note"] = "p50/p99/max are sample age when the main loop picks it up"
+    return result
+
+
+def bench_api(iterations, batch):
+    import overlay
+    times, imu = synthetic_samples(batch)
+    overlay.imu_ring.push_batch(times, imu)
+    client = overlay.app.test_client()
+    return timed(lambda _: client.get("/imu_data"), range(iterations), 1)
+
+
+def bench_overlay_frame(iterations, batch):
+    from PyQt5 import QtWidgets
+    import overlay
+    import samplering
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv)
+    ring = samplering.SampleRing(width=5)
+    widget = overlay.Overlay(ring)
+    widget.idle_timer.stop()
+    widget.show()
+    app.processEvents()
+    rng = np.random.default_rng(0)
+
+    def frame(i):
+        ring.push_batch(np.full(batch, float(i)), rng.normal(0, 2000, size=(batch, 5)))
+        widget.update_overlay_data()
+        widget.repaint()
+
+    result = timed(frame, range(iterations), batch)
+    widget.close()
+    return result
+
+
+def bench_overlay_4k(iterations, batch, screens=3):
+    from PyQt5 import QtWidgets
+    import overlay
+    import samplering
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv)
+    ring = samplering.SampleRing(width=5)
+    widgets = []
+    for index in range(screens):
+        widget = overlay.Overlay(ring)
+        widget.idle_timer.stop()
+        widget.setGeometry(index * 3840, 0, 3840, 2160)
+        widget.show()
+        widgets.append(widget)
+    app.processEvents()
+    rng = np.random.default_rng(0)
+
+    def frame(i):
+        ring.push_batch(np.full(batch, float(i)), rng.normal(0, 2000, size=(batch, 5)))
+        for widget in widgets:
+            widget.update_overlay_data()
+        app.processEvents()
+
+    result = timed(frame, range(iterations), batch)
+    result["screens"] = screens
+    result["paint_ms_avg"] = [round(widget.frame_stats()["paint_ms_avg"], 4) for widget in widgets]
+    result["note"] = "per call is one frame on every screen, budget is one refresh (16.7 ms at 60 Hz)"
+    for widget in widgets:
+        widget.close()
+    return result
+
+
+def bench_capture(seconds):
+    with tempfile.TemporaryDirectory() as directory:
+        times, imu = synthetic.SyntheticIMU("drive", 1000.0).seconds(seconds)
+        synthetic.write_capture(os.path.join(directory, "capture.txt"), times, imu, start=1.7e9)
+        with open(os.path.join(directory, "config.json"), "w") as f:
+            json.dump({"REPLAY_FILE": "capture.txt", "REPLAY_SPEED": 0, "REPLAY_LOOP": False}, f)
+        started = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(HERE, "capturelogs.py"), "--source", "Replay"],
+                       cwd=directory, stdout=subprocess.DEVNULL, check=True)
+        elapsed = time.perf_counter() - started
+        import imulogs
+        written = imulogs.load_log(os.path.join(directory, "logs.txt")).sample_count
+    return {"samples_per_sec": round(written / elapsed, 1), "seconds": round(elapsed, 3),
+            "samples": written, "note": "whole process, including startup"}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=HERE, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(stages=None, quick=False):
+    iterations = 200 if quick else 2000
+    seconds = 1.0 if quick else 5.0
+    benchmarks = {
+        "parse_text": lambda: bench_parse_text(iterations, 10),
+        "parse_binary": lambda: bench_parse_binary(iterations, 10),
+        "parse_log": lambda: bench_parse_log(iterations, 100000),
+        "filter": lambda: bench_filter(iterations, 10),
+        "ring": lambda: bench_ring(iterations, 10),
+        "pipeline": lambda: bench_pipeline(seconds),
+        "api": lambda: bench_api(iterations // 4, 10),
+        "overlay_frame": lambda: bench_overlay_frame(iterations // 4, 10),
+        "overlay_4k": lambda: bench_overlay_4k(iterations // 4, 10),
+        "capture": lambda: bench_capture(20.0 if quick else 100.0),
+    }
+    results = {}
+    for name in stages or benchmarks:
+        if name not in benchmarks:
+            raise ValueError(f"Unknown stage {name}, available: {', '.join(benchmarks)}")
+        print(f"Running {name}...", file=sys.stderr)
+        results[name] = benchmarks[name]()
+    return {
+        "commit": git_commit(),
+        "time": time.time(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "quick": quick,
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    quick = "--quick" in args
+    out = None
+    if quick:
+        args.remove("--quick")
+    if "--out" in args:
+        index = args.index("--out")
+        out = args[index + 1]
+        del args[index:index + 2]
+    report = json.dumps(run(args, quick), indent=2)
+    if out:
+        with open(out, "w") as f:
+            f.write(report + "\n")
+        print(f"Results written to {out}", file=sys.stderr)
+    else:
+        print(report)
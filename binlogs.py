@@ -0,0 +1,181 @@
+#Compact binary IMU log format + memory mapped reader
+#
+# Layout: a 16 byte header followed by fixed 24 byte records.
+#   header: magic (8s) | version (uint16) | record size (uint16) | reserved (4x)
+#   record: time (float64) | ax ay az gx gy gz (6x int16) | kind (uint16) | reserved (2x)
+# kind is SAMPLE for readings, START/END/ERROR records frame the sessions the
+# same way the lines in the text logs do (the imu values are zero on those).
+#
+# Usage:
+#   python binlogs.py convert example_data/drivelogs.txt [out.mblog]
+#   python binlogs.py info logs.mblog
+
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+import imulogs
+
+MAGIC = b"MBLOGBIN"
+VERSION = 1
+HEADER = struct.Struct("<8sHH4x")
+RECORD = struct.Struct("<d6hH2x")
+
+SAMPLE = 0
+START = 1
+END = 2
+ERROR = 3
+
+RECORD_DTYPE = np.dtype([
+    ("time", "<f8"),
+    ("imu", "<i2", (6,)),
+    ("kind", "<u2"),
+    ("reserved", "V2"),
+])
+assert RECORD_DTYPE.itemsize == RECORD.size == 24
+
+
+class BinaryLogWriter:
+    def __init__(self, path):
+        self.path = path
+        self.f = open(path, "ab")
+        if self.f.tell() == 0:
+            self.f.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+            self.f.flush()
+
+    def marker(self, kind, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        self.f.write(RECORD.pack(timestamp, 0, 0, 0, 0, 0, 0, kind))
+        self.f.flush()
+
+    def write_samples(self, samples):
+        # samples: iterable of (ax, ay, az, gx, gy, gz, timestamp)
+        buf = bytearray()
+        for ax, ay, az, gx, gy, gz, t in samples:
+            buf += RECORD.pack(t, ax, ay, az, gx, gy, gz, SAMPLE)
+        self.f.write(buf)
+        self.f.flush()
+
+    def write_array(self, records):
+        # records: numpy array with RECORD_DTYPE
+        self.f.write(np.ascontiguousarray(records, dtype=RECORD_DTYPE).tobytes())
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+class BinaryLog:
+    """Read only view of a binary capture. All arrays are views into the memory map."""
+
+    def __init__(self, path):
+        self.path = path
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            magic, version, record_size = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a motionblob binary log")
+        if version != VERSION or record_size != RECORD_DTYPE.itemsize:
+            raise ValueError(f"Unsupported binary log version {version} (record size {record_size})")
+        # A crash can leave a partial record at the end, just ignore it
+        count = (size - HEADER.size) // record_size
+        if count > 0:
+            self.records = np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=HEADER.size, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=RECORD_DTYPE)
+
+    @property
+    def times(self):
+        return self.records["time"]
+
+    @property
+    def imu(self):
+        return self.records["imu"]
+
+    @property
+    def kinds(self):
+        return self.records["kind"]
+
+    def markers(self):
+        idx = np.flatnonzero(self.kinds != SAMPLE)
+        return [(int(i), int(self.kinds[i]), float(self.times[i])) for i in idx]
+
+    def sessions(self):
+        """Returns the samples of each START..START span, like imulogs.load_log and logindex.py
+        count them: a START without samples is an empty session, the span before the first
+        START only counts if it has samples. Spans without inner END/ERROR markers are views,
+        the rest have their markers masked out."""
+        kinds = self.kinds
+        starts = np.flatnonzero(kinds == START)
+        bounds = [0] + [int(i) for i in starts] + [len(kinds)]
+        out = []
+        for begin, stop in zip(bounds[:-1], bounds[1:]):
+            chunk = self.records[begin:stop]
+            if len(chunk) and chunk["kind"][0] == START:
+                chunk = chunk[1:]
+            if len(chunk) and chunk["kind"][-1] == END:
+                chunk = chunk[:-1]
+            inner = chunk["kind"] != SAMPLE
+            if inner.any():
+                chunk = chunk[~inner]
+            if len(chunk) or begin in starts:
+                out.append(chunk)
+        return out
+
+    def __len__(self):
+        return len(self.records)
+
+
+def load_binary_log(path):
+    return BinaryLog(path)
+
+
+# --- Text log conversion ---
+
+def convert_text_log(src, dst, chunk_size=65536):
+    kinds = {imulogs.START: START, imulogs.END: END, imulogs.ERROR: ERROR}
+    if os.path.exists(dst):
+        os.remove(dst)
+    writer = BinaryLogWriter(dst)
+    records = np.zeros(chunk_size, dtype=RECORD_DTYPE)
+    count = used = 0
+    for event in imulogs.iter_log(src):
+        if event.kind == imulogs.HEADER:
+            continue
+        record = records[used]
+        record["time"] = event.time
+        if event.kind == imulogs.SAMPLE:
+            record["imu"] = event.values
+            record["kind"] = SAMPLE
+        else:
+            record["imu"] = 0
+            record["kind"] = kinds[event.kind]
+        used += 1
+        if used == chunk_size:
+            writer.write_array(records)
+            count += used
+            used = 0
+    writer.write_array(records[:used])
+    writer.close()
+    return count + used
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "convert":
+        src = sys.argv[2]
+        dst = sys.argv[3] if len(sys.argv) > 3 else os.path.splitext(src)[0] + ".mblog"
+        count = convert_text_log(src, dst)
+        print(f"Wrote {count} records to {dst} ({os.path.getsize(src)} -> {os.path.getsize(dst)} bytes)")
+    elif len(sys.argv) >= 3 and sys.argv[1] == "info":
+        start = time.perf_counter()
+        log = load_binary_log(sys.argv[2])
+        sessions = log.sessions()
+        elapsed = time.perf_counter() - start
+        print(f"{len(log)} records, {sum(len(s) for s in sessions)} samples in {len(sessions)} sessions")
+        print(f"Loaded in {elapsed * 1000:.2f} ms")
+    else:
+        print("Usage: python binlogs.py convert <logs.txt> [out.mblog] | info <logs.mblog>")
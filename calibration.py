@@ -0,0 +1,207 @@
+#Streaming ESP32 calibration
+#
+# While calibration runs, every sample goes through a stillness detector
+# (exponentially weighted variance of each axis). Still samples are folded into
+# Welford running mean/variance accumulators, so no sample list is ever kept.
+# The estimate has converged once the standard error of the mean (std / sqrt(n))
+# is under tolerance on every axis, how long that takes depends on the noise.
+# The tolerance is a fraction of the stillness threshold, so it scales with what
+# the detector lets through: a sensor right at the threshold needs 1 / 0.02^2 =
+# 2500 still samples, the MPU6050 on a desk (gyro std ~140 counts) about 500.
+# Moving for too long in a row fails the calibration instead.
+# When the calibration is finished:
+#   - gyro bias is the mean gyro reading at rest
+#   - accel scale maps the measured gravity magnitude to ACCEL_LSB_PER_G
+# Accel bias needs the device in several orientations, a single resting
+# position can't tell it apart from gravity, so it stays 0 for now.
+#
+# Usage:
+#   python calibration.py example_data/desklogs.txt
+
+import sys
+
+import numpy as np
+
+import motionfilter
+
+ACCEL_LSB_PER_G = 16384.0  # MPU6050 default +-2g range
+
+
+class RunningStats:
+    """Welford mean/variance over vectors, batches are merged with Chan's formula."""
+
+    def __init__(self, width):
+        self.count = 0
+        self.mean = np.zeros(width)
+        self.m2 = np.zeros(width)
+
+    def update(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+
+    def update_batch(self, xs):
+        n = len(xs)
+        if n == 0:
+            return
+        batch_mean = xs.mean(axis=0)
+        batch_m2 = ((xs - batch_mean) ** 2).sum(axis=0)
+        total = self.count + n
+        delta = batch_mean - self.mean
+        self.mean = self.mean + delta * (n / total)
+        self.m2 = self.m2 + batch_m2 + delta ** 2 * (self.count * n / total)
+        self.count = total
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else np.zeros_like(self.m2)
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+
+class StillnessDetector:
+    """Exponentially weighted per axis variance, still when every axis is under its threshold."""
+
+    def __init__(self, accel_threshold=300.0, gyro_threshold=300.0, weight=0.2, warmup=10):
+        self.threshold = np.array([accel_threshold] * 3 + [gyro_threshold] * 3) ** 2
+        self.weight = weight
+        self.warmup = warmup
+        self.reset()
+
+    def reset(self):
+        self.mean = None
+        self.variance = np.zeros(6)
+        self.seen = 0
+
+    def update(self, imu):
+        """Returns a bool per sample of imu (n, 6)."""
+        imu = np.asarray(imu, dtype=np.float64)
+        n = len(imu)
+        if n == 0:
+            return np.zeros(0, dtype=bool)
+        if self.mean is None:
+            self.mean = imu[0].copy()
+        w = self.weight
+        # mean[n] = (1 - w) * mean[n-1] + w * x[n]
+        mean, last_mean = motionfilter.first_order_iir(w * imu, 1 - w, self.mean)
+        previous = np.vstack((self.mean, mean[:-1]))
+        # var[n] = (1 - w) * (var[n-1] + w * (x[n] - mean[n-1])^2)
+        variance, self.variance = motionfilter.first_order_iir((1 - w) * w * (imu - previous) ** 2, 1 - w, self.variance)
+        self.mean = last_mean
+        warmed = self.seen + np.arange(1, n + 1) > self.warmup
+        self.seen += n
+        return warmed & (variance < self.threshold).all(axis=1)
+
+
+def looks_still(imu, accel_threshold=300.0, gyro_threshold=300.0):
+    """Quick check on a recent window of raw samples (n, 6): every axis' std under its threshold."""
+    imu = np.asarray(imu, dtype=np.float64)
+    if len(imu) < 2:
+        return False
+    std = imu.std(axis=0)
+    return bool((std[0:3] < accel_threshold).all() and (std[3:6] < gyro_threshold).all())
+
+
+class Calibration:
+    def __init__(self, bias=None, scale=None):
+        self.bias = np.zeros(6) if bias is None else np.asarray(bias, dtype=np.float64)
+        self.scale = np.ones(6) if scale is None else np.asarray(scale, dtype=np.float64)
+
+    def apply(self, imu):
+        return (np.asarray(imu, dtype=np.float64) - self.bias) * self.scale
+
+    def to_config(self):
+        return {"bias": self.bias.round(3).tolist(), "scale": self.scale.round(6).tolist()}
+
+    @classmethod
+    def from_config(cls, value):
+        if not value:
+            return cls()
+        try:
+            return cls(value["bias"], value["scale"])
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"Ignoring invalid calibration in config.json: {e}")
+            return cls()
+
+
+class Calibrator:
+    def __init__(self, min_samples=50, tolerance=0.02, max_moving=200, **stillness):
+        self.detector = StillnessDetector(**stillness)
+        self.stats = RunningStats(6)
+        self.min_samples = min_samples
+        # Standard error of the mean needed on each axis, counts
+        self.tolerance = np.sqrt(self.detector.threshold) * tolerance
+        self.max_moving = max_moving
+        self.rejected = 0
+        self.moving_run = 0  # moving samples in a row, up to the newest
+        self.moved = False
+
+    def feed(self, imu):
+        """Adds a batch of raw samples (n, 6), only the still ones count."""
+        imu = np.asarray(imu, dtype=np.float64)
+        still = self.detector.update(imu)
+        self.stats.update_batch(imu[still])
+        self.rejected += int(len(imu) - still.sum())
+        if len(imu):
+            # Lengths of the moving stretches between still samples, the first one carries on from the last batch
+            bounds = np.concatenate(([-1 - self.moving_run], np.flatnonzero(still), [len(imu)]))
+            runs = np.diff(bounds) - 1
+            self.moving_run = int(runs[-1])
+            if runs.max() > self.max_moving:
+                self.moved = True
+
+    @property
+    def ready(self):
+        return self.stats.count >= self.min_samples
+
+    @property
+    def standard_error(self):
+        if self.stats.count < 2:
+            return np.full(6, np.inf)
+        return self.stats.std / np.sqrt(self.stats.count)
+
+    @property
+    def converged(self):
+        return self.ready and bool((self.standard_error < self.tolerance).all())
+
+    @property
+    def progress(self):
+        """0..1, roughly linear in time: the error shrinks with sqrt(n), so (tolerance / error)^2 is
+        the part of the samples needed that we have."""
+        if self.stats.count < 2:
+            return 0.0
+        error = np.maximum(self.standard_error, 1e-9)
+        needed = float(np.min((self.tolerance / error) ** 2))
+        return min(1.0, self.stats.count / self.min_samples, needed)
+
+    def result(self):
+        if not self.ready:
+            raise ValueError(f"Not enough still samples ({self.stats.count}/{self.min_samples})")
+        mean = self.stats.mean
+        bias = np.zeros(6)
+        bias[3:6] = mean[3:6]
+        scale = np.ones(6)
+        scale[0:3] = ACCEL_LSB_PER_G / np.linalg.norm(mean[0:3])
+        return Calibration(bias, scale)
+
+
+if __name__ == "__main__":
+    import imulogs
+    if len(sys.argv) < 2:
+        print("Usage: python calibration.py <logs.txt>")
+        sys.exit(1)
+    for number, session in enumerate(imulogs.load_log(sys.argv[1]).sessions, 1):  # numbered like replay.py --session
+        calibrator = Calibrator()
+        calibrator.feed(session.imu)
+        still = calibrator.stats.count
+        print(f"Session {number}: {len(session)} samples, {still} still, {calibrator.rejected} moving")
+        if calibrator.ready:
+            result = calibrator.result()
+            print(f"  bias {result.bias.round(1).tolist()}  scale {result.scale.round(4).tolist()}")
+            print(f"  std at rest {calibrator.stats.std.round(1).tolist()}")
+            print(f"  standard error {calibrator.standard_error.round(2).tolist()}, {'converged' if calibrator.converged else f'{calibrator.progress:.0%} of the way'}")
+        elif still:
+            print(f"  not enough still samples to calibrate (need {calibrator.min_samples})")
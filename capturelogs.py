@@ -1,107 +1,213 @@
 #very patchy script to log IMU data
 
-import serial
-import serial.tools.list_ports
+import asyncio
 import time
 import sys
+import threading
+import queue
 
-baud_rate = 38400  # IMU baud rate
-ax = ay = az = gx = gy = gz = 0
-s = None
-retryconenction = True
+import configstore
+import imusources
 
-# Write new log note
-print(f"START {time.time()}")
-with open("logs.txt", "a") as f:
-    f.write(f"START {time.time()}\n")
-
-def phisical_conenction_connect():
-    global s
-    ports = list(serial.tools.list_ports.comports())
-    for p in ports:
-        if "USB" in p.description or "UART" in p.description or "serial" in p.description.lower() or "CP210x" in p.description or "CH340" in p.description:
-            try:
-                s = serial.Serial(p.device, baud_rate, timeout=1)
-                print(f"Connected to ESP32 on {p.device}")
-                return True
-            except serial.SerialException as e:
-                print(f"Could not open serial port {p.device}: {e}")
-                return False
-    print("No ESP32 serial port found.")
-    return False
-
-def phisical_conenction_update():
-    global ax, ay, az, gx, gy, gz
-    if s and s.is_open:
+# Flush policy: a batch goes to disk once it holds flush_samples samples or is
+# older than flush_interval seconds, whichever comes first. A crash loses at most
+# that window. Both can be changed with --flush-samples N / --flush-interval SECONDS
+flush_samples = 1000
+flush_interval = 1.0
+writer_queue_size = 64  # batches waiting for the writer thread
+
+def read_flag(name, default, cast):
+    if name in sys.argv:
         try:
-            if s.in_waiting > 0:
-                line = s.readline().decode('utf-8').strip()
-                if line:
-                    data = line.split('\t')
-                    if len(data) == 6:
-                        try:
-                            ax = int(data[0])
-                            ay = int(data[1])
-                            az = int(data[2])
-                            gx = int(data[3])
-                            gy = int(data[4])
-                            gz = int(data[5])
-                            return True
-                        except ValueError:
-                            print(f"Error parsing data: {line}")
-                    else:
-                        print(f"Received malformed line or incomplete: {line}")
-                        pass
-            return False
-        except serial.SerialException as e:
-            print(f"Serial communication error: {e}")
-            with open("logs.txt", "a") as f:
-                f.write(f"ERROR: {e}, {time.time()}\n")
-            s.close()
-            return False
-    return False
-
-if phisical_conenction_connect():
-    backlog_memory = []
+            return cast(sys.argv[sys.argv.index(name) + 1])
+        except (IndexError, ValueError):
+            print(f"Invalid value for {name}, using {default}")
+    return default
+
+flush_samples = read_flag("--flush-samples", flush_samples, int)
+flush_interval = read_flag("--flush-interval", flush_interval, float)
+
+# Any source from imusources.py works (--source, ESP32 by default), its settings
+# come from config.json when there is one.
+# --protocol binary reads the firmware's binary frames (BINARY_FRAMES in esp32.ino),
+# --port skips the port search (e.g. the pty of fakeesp32.py)
+settings = configstore.ConfigStore("config.json").current
+source_name = read_flag("--source", "ESP32", str)
+source_config = settings.replace(
+    SERIAL_PROTOCOL=read_flag("--protocol", settings.serial_protocol, str),
+    SERIAL_PORT=read_flag("--port", settings.serial_port, str),
+)
+
+# Sources stamp samples from the monotonic clock, anchored to wall time once so
+# the logs keep using epoch timestamps.
+clock_offset = time.time() - time.monotonic()
+
+def capture_time():
+    return clock_offset + time.monotonic()
+
+# Optional compact binary recording, see binlogs.py
+binary_mode = "--binary" in sys.argv
+if binary_mode:
+    import binlogs
+
+# --store DIR writes rotating, compressed segments with an index instead of one
+# ever growing logs.txt/logs.mblog, see capturestore.py. A segment is closed after
+# --segment-mb megabytes or --segment-minutes minutes, --compression picks
+# zstd, gzip or none (zstd when the zstandard package is installed).
+store_directory = read_flag("--store", None, str)
+if store_directory is not None:
+    import capturestore
+
+class LogWriter(threading.Thread):
+    """Owns the log file and does all disk I/O so the serial loop never waits on it."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.queue = queue.Queue(maxsize=writer_queue_size)
+        self.store = None
+        self.binary_writer = None
+        if store_directory is not None:
+            self.store = capturestore.CaptureStore(
+                store_directory,
+                binary=binary_mode,
+                max_bytes=int(read_flag("--segment-mb", 64.0, float) * (1 << 20)),
+                max_seconds=read_flag("--segment-minutes", 60.0, float) * 60,
+                compression=read_flag("--compression", None, str),
+            )
+        elif binary_mode:
+            self.binary_writer = binlogs.BinaryLogWriter("logs.mblog")
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            kind, payload = item
+            try:
+                if kind == "SAMPLES":
+                    self.write_samples(payload)
+                else:
+                    self.write_marker(kind, *payload)
+            except Exception as e:
+                print(f"Error writing logs: {e}")
+        if self.binary_writer is not None:
+            self.binary_writer.close()
+        if self.store is not None:
+            print("Waiting for segment compression...")
+            self.store.close()
+
+    def write_marker(self, kind, timestamp, message=None):
+        if self.store is not None:
+            self.store.write_marker(kind, timestamp, message)
+            return
+        if self.binary_writer is not None:
+            self.binary_writer.marker({"START": binlogs.START, "END": binlogs.END, "ERROR": binlogs.ERROR}[kind], timestamp)
+            return
+        with open("logs.txt", "a") as f:
+            if kind == "ERROR":
+                f.write(f"ERROR: {message}, {timestamp}\n")
+            else:
+                f.write(f"{kind} {timestamp}\n")
+
+    def write_samples(self, samples):
+        if self.store is not None:
+            self.store.write_samples(samples)
+            return
+        if self.binary_writer is not None:
+            self.binary_writer.write_samples(samples)
+            return
+        with open("logs.txt", "a") as f:
+            f.write("".join(
+                f"Accel(x,y,z): ({line[0]}, {line[1]}, {line[2]})  Gyro(x,y,z): ({line[3]}, {line[4]}, {line[5]}), Time: {line[6]}\n"
+                for line in samples
+            ))
+
+log_writer = LogWriter()
+log_writer.start()
+
+def write_marker(kind, message=None):
+    # Markers are rare, so it's fine to wait for room in the queue
+    log_writer.queue.put((kind, (capture_time(), message)))
+
+def write_samples(samples):
+    # Never block the serial loop, the caller keeps the batch and retries if the writer is behind
+    try:
+        log_writer.queue.put_nowait(("SAMPLES", samples))
+        return True
+    except queue.Full:
+        return False
+
+def stop_writer():
+    log_writer.queue.put(None)
+    log_writer.join()
+
+# Write new log note
+print(f"START {capture_time()}")
+write_marker("START")
+
+backlog_memory = []
+
+async def connect(source):
+    while not await source.open():
+        print("Failed to reconnect. Retrying in 5 seconds...")
+        await asyncio.sleep(5)
+
+async def capture(source):
+    global backlog_memory
+    batch_started = capture_time()
     while True:
-        try:
-            if phisical_conenction_update():
-                print(f"Accel(x,y,z): ({ax}, {ay}, {az})  Gyro(x,y,z): ({gx}, {gy}, {gz}), Time: {time.time()}")
-                print("Memory size:", len(backlog_memory))
-                #Load into memory
-                backlog_memory.append((ax, ay, az, gx, gy, gz))
-                
-                #Load memory to logs.txt
-                if len(backlog_memory) >= 1000:
-                    print("Dumping memory to logs.txt...")
-                    with open("logs.txt", "a") as f:
-                        for line in backlog_memory:
-                            f.write(f"Accel(x,y,z): ({line[0]}, {line[1]}, {line[2]})  Gyro(x,y,z): ({line[3]}, {line[4]}, {line[5]}), Time: {time.time()}\n")
-                    backlog_memory = []
-
-        
-        except KeyboardInterrupt:
-            print("\nKeyboardInterrupt detected. Exiting...")
-            
-            if len(backlog_memory) > 0:
-                print("Dumping memory to logs.txt...")
-                with open("logs.txt", "a") as f:
-                    for line in backlog_memory:
-                        f.write(f"Accel(x,y,z): ({line[0]}, {line[1]}, {line[2]})  Gyro(x,y,z): ({line[3]}, {line[4]}, {line[5]}), Time: {time.time()}\n")
+        times, samples = await source.read_batch(timeout=flush_interval)
+        if len(samples):
+            if not backlog_memory:
+                batch_started = clock_offset + times[0]
+            #Load into memory
+            backlog_memory.extend(
+                tuple(int(v) for v in row) + (t,)
+                for row, t in zip(samples.tolist(), (times + clock_offset).tolist())
+            )
+            # Printing every sample would be the bottleneck at high rates, show the newest one
+            line = backlog_memory[-1]
+            print(f"Accel(x,y,z): ({line[0]}, {line[1]}, {line[2]})  Gyro(x,y,z): ({line[3]}, {line[4]}, {line[5]}), Time: {line[6]}")
+        elif not source.is_open:
+            if "finite" in source.capabilities:
+                print(f"{source.name} source finished")
+                return
+            print("Lost connection to the IMU. Attempting to reconnect...")
+            write_marker("ERROR", f"{source.name} connection lost")
+            await connect(source)
+
+        #Hand memory to the writer thread
+        if backlog_memory and (len(backlog_memory) >= flush_samples or capture_time() - batch_started >= flush_interval):
+            if write_samples(backlog_memory):
                 backlog_memory = []
+            else:
+                print("Log writer is behind, holding", len(backlog_memory), "samples in memory")
+
+async def main():
+    source = imusources.create(source_name, source_config)
+    if not await source.open():
+        print(f"Failed to connect to {source_name}. Exiting...")
+        return
+    try:
+        await capture(source)
+        return True
+    finally:
+        if source.dropped:
+            print(f"{source.dropped} samples were dropped on the way from the device")
+        source.close()
+
+def finish():
+    global backlog_memory
+    if len(backlog_memory) > 0:
+        print("Dumping memory to logs...")
+        log_writer.queue.put(("SAMPLES", backlog_memory))
+        backlog_memory = []
+    write_marker("END")
 
-            with open("logs.txt", "a") as f:
-                f.write(f"END {time.time()}\n")
-            break
-
-        except Exception as e:
-            print("Error while reading serial data. error:", e)
-            with open("logs.txt", "a") as f:
-                f.write(f"ERROR: {e}, {time.time()}\n")
-            print("Attempting to reconnect...")
-            while not phisical_conenction_connect():
-                print("Failed to reconnect. Retrying in 5 seconds...")
-                time.sleep(5)
-else:
-    print("Failed to connect to ESP32. Exiting...")
-    
\ No newline at end of file
+try:
+    if asyncio.run(main()):
+        finish()
+except KeyboardInterrupt:
+    print("\nKeyboardInterrupt detected. Exiting...")
+    finish()
+stop_writer()
@@ -0,0 +1,536 @@
+#Rotating, crash safe capture storage for long recordings
+#
+# A store is a directory of numbered segments plus an index:
+#   capture-000000.txt.gz    closed segments, compressed in the background
+#   capture-000001.txt       the segment being written (.mblog in binary mode)
+#   index.json               every segment's file, format, first/last sample
+#                            time, sample count and size, so a time window can
+#                            be found without opening anything else
+#
+# The writer starts a new segment before a write would take the current one
+# past max_bytes or max_seconds, splitting a batch where needed, so a segment
+# only goes over max_bytes if a single sample or marker is bigger than that.
+# Closed segments go to a compressor thread (zstd when the zstandard package is
+# installed, gzip otherwise) which writes to a temporary file, renames it into
+# place and only then deletes the original, so a crash at any point leaves one
+# readable copy. Every batch (or part of one, per segment) is written with a
+# single write() and the files are fsynced every fsync_interval seconds.
+#
+# Opening a store for writing after a crash repairs it: a partial last line (or
+# record) of the segment that was open is cut off, segments missing from the
+# index are scanned and added, and anything still uncompressed is queued again.
+# The writer holds an flock on the directory's .lock file while it's open, so a
+# second writer waits instead of "repairing" a live store. Opening with
+# writable=False only reads index.json and never touches a file.
+#
+# Usage:
+#   python capturestore.py info <dir>
+#   python capturestore.py window <dir> <start> <end>
+#   python capturestore.py import <dir> <logs.txt> [--binary]
+
+import gzip
+import json
+import os
+import queue
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+import binlogs
+import imulogs
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # gzip it is
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows, no cross process lock
+
+INDEX_FILE = "index.json"
+LOCK_FILE = ".lock"
+SEGMENT_PATTERN = re.compile(r"^(?P<prefix>.+)-(?P<number>\d{6})\.(?P<ext>txt|mblog)(?P<compressed>\.gz|\.zst)?$")
+COMPRESSORS = {"gzip": ".gz", "zstd": ".zst"}
+MARKER_KINDS = {"START": binlogs.START, "END": binlogs.END, "ERROR": binlogs.ERROR}
+
+
+def default_compression():
+    return "zstd" if zstandard is not None else "gzip"
+
+
+def format_lines(samples):
+    return [
+        f"Accel(x,y,z): ({line[0]}, {line[1]}, {line[2]})  Gyro(x,y,z): ({line[3]}, {line[4]}, {line[5]}), Time: {line[6]}\n"
+        for line in samples
+    ]
+
+
+def format_text(samples):
+    return "".join(format_lines(samples))
+
+
+def marker_line(kind, timestamp, message=None):
+    return f"ERROR: {message}, {timestamp}\n" if kind == "ERROR" else f"{kind} {timestamp}\n"
+
+
+def sample_records(samples):
+    """(ax, ay, az, gx, gy, gz, t) tuples to binlogs records, in one go."""
+    values = np.array(samples, dtype=np.float64).reshape(-1, 7)
+    records = np.zeros(len(values), dtype=binlogs.RECORD_DTYPE)
+    records["time"] = values[:, 6]
+    records["imu"] = values[:, 0:6]
+    records["kind"] = binlogs.SAMPLE
+    return records
+
+
+def compress_file(path, compression):
+    """Compresses path next to itself, returns the new path. The original is removed last."""
+    target = path + COMPRESSORS[compression]
+    handle, temp_path = tempfile.mkstemp(prefix=".compress-", dir=os.path.dirname(path) or ".")
+    try:
+        with open(path, "rb") as src, os.fdopen(handle, "wb") as dst:
+            if compression == "zstd":
+                zstandard.ZstdCompressor(level=3).copy_stream(src, dst)
+            else:
+                with gzip.GzipFile(fileobj=dst, mode="wb", compresslevel=6) as zipped:
+                    shutil.copyfileobj(src, zipped, 1 << 20)
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.replace(temp_path, target)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+    os.unlink(path)
+    return target
+
+
+def read_file(path):
+    """Whole (decompressed) contents of a segment."""
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"{path} is zstd compressed, install the zstandard package to read it")
+        with open(path, "rb") as f:
+            return zstandard.ZstdDecompressor().stream_reader(f).read()
+    if path.endswith(".gz"):
+        with gzip.open(path, "rb") as f:
+            return f.read()
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def load_segment(path):
+    """(times, imu) of every sample in a segment, markers left out."""
+    data = read_file(path)
+    if ".mblog" in os.path.basename(path):
+        records = np.frombuffer(data, dtype=binlogs.RECORD_DTYPE, offset=binlogs.HEADER.size,
+                                count=(len(data) - binlogs.HEADER.size) // binlogs.RECORD_DTYPE.itemsize)
+        samples = records[records["kind"] == binlogs.SAMPLE]
+        return samples["time"].astype(np.float64), samples["imu"].astype(np.float64)
+    log = imulogs.load_log(data)
+    if not log.sessions:
+        return np.zeros(0), np.zeros((0, 6))
+    return (np.concatenate([s.times for s in log.sessions]),
+            np.concatenate([s.imu for s in log.sessions]).astype(np.float64))
+
+
+def repair_segment(path):
+    """Cuts a partial last line/record left by a crash. Returns the bytes removed."""
+    size = os.path.getsize(path)
+    if path.endswith(".mblog"):
+        whole = binlogs.HEADER.size + max(0, size - binlogs.HEADER.size) // binlogs.RECORD_DTYPE.itemsize * binlogs.RECORD_DTYPE.itemsize
+        keep = whole if size >= binlogs.HEADER.size else 0
+    else:
+        with open(path, "rb") as f:
+            f.seek(max(0, size - 65536))
+            tail = f.read()
+        cut = tail.rfind(b"\n")
+        keep = size - len(tail) + cut + 1 if cut != -1 else (0 if size <= 65536 else size)
+    if keep < size:
+        with open(path, "r+b") as f:
+            f.truncate(keep)
+            f.flush()
+            os.fsync(f.fileno())
+    return size - keep
+
+
+class Segment:
+    """The segment being written."""
+
+    def __init__(self, path, binary):
+        self.path = path
+        self.binary = binary
+        if binary:
+            self.writer = binlogs.BinaryLogWriter(path)
+            self.f = self.writer.f
+        else:
+            self.writer = None
+            self.f = open(path, "a")
+        self.bytes = self.f.tell()
+        self.header_bytes = binlogs.HEADER.size if binary else 0
+
+    def encode(self, samples):
+        """What write() takes for these samples and the size of each one on disk."""
+        if self.binary:
+            records = sample_records(samples)
+            return records, np.full(len(records), binlogs.RECORD_DTYPE.itemsize)
+        lines = format_lines(samples)
+        return lines, np.fromiter(map(len, lines), dtype=np.int64, count=len(lines))
+
+    def write(self, encoded, size):
+        if self.binary:
+            self.writer.write_array(encoded)
+        else:
+            self.f.write("".join(encoded))
+            self.f.flush()
+        self.bytes += size
+
+    def write_marker(self, kind, timestamp, message=None):
+        if self.binary:
+            self.writer.marker(MARKER_KINDS[kind], timestamp)
+            self.bytes += binlogs.RECORD.size
+        else:
+            line = marker_line(kind, timestamp, message)
+            self.f.write(line)
+            self.f.flush()
+            self.bytes += len(line)
+
+    def sync(self):
+        os.fsync(self.f.fileno())
+
+    def close(self):
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.f.close()
+
+
+def lock_directory(directory):
+    """Exclusive flock on the store's lock file, held by the writer until it closes."""
+    handle = open(os.path.join(directory, LOCK_FILE), "a")
+    if fcntl is not None:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            print(f"Another capture is writing to {directory}, waiting for it to finish")
+            fcntl.flock(handle, fcntl.LOCK_EX)
+    return handle
+
+
+class CaptureStore:
+    def __init__(self, directory, binary=False, max_bytes=64 << 20, max_seconds=3600.0, compression=None,
+                 prefix="capture", fsync_interval=5.0, writable=True):
+        self.directory = directory
+        self.writable = writable
+        self.binary = binary
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.compression = compression if compression is not None else default_compression()
+        if self.compression not in COMPRESSORS and self.compression != "none":
+            raise ValueError(f"Unknown compression {self.compression}, use {', '.join(COMPRESSORS)} or none")
+        if self.compression == "zstd" and zstandard is None:
+            print("zstandard is not installed, compressing with gzip")
+            self.compression = "gzip"
+        self.prefix = prefix
+        self.fsync_interval = fsync_interval
+        self.lock = threading.Lock()        # entries
+        self.index_lock = threading.Lock()  # index.json, written by the writer and the compressor
+        self.entries = []
+        self.segment = None
+        self.entry = None
+        self.last_sync = time.monotonic()
+        self.last_index_write = 0.0
+        self.pending = queue.Queue()
+        self.compressor = None
+        self.lock_handle = None
+
+        if not writable:
+            self.entries = self.read_index()
+            return
+        os.makedirs(directory, exist_ok=True)
+        self.lock_handle = lock_directory(directory)
+        self.recover()
+        self.compressor = threading.Thread(target=self.compress_loop, daemon=True)
+        self.compressor.start()
+
+    # --- index ---
+
+    def index_path(self):
+        return os.path.join(self.directory, INDEX_FILE)
+
+    def read_index(self):
+        try:
+            with open(self.index_path(), "r") as f:
+                return json.load(f)["segments"]
+        except FileNotFoundError:
+            return []
+        except (ValueError, KeyError) as e:
+            print(f"Unreadable {self.index_path()}{', rebuilding it' if self.writable else ''}: {e}")
+            return []
+
+    def write_index(self):
+        # The snapshot is taken inside index_lock too, so a later snapshot can't be overwritten by an older one
+        with self.index_lock:
+            with self.lock:
+                segments = [dict(entry) for entry in self.entries]
+            handle, temp_path = tempfile.mkstemp(prefix=".index-", suffix=".json", dir=self.directory)
+            with os.fdopen(handle, "w") as f:
+                json.dump({"version": 1, "segments": segments}, f, indent=1)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.index_path())
+            self.last_index_write = time.monotonic()
+
+    def scan(self, path):
+        """Rebuilds an index entry from the file itself (after a crash)."""
+        times, imu = load_segment(path)
+        match = SEGMENT_PATTERN.match(os.path.basename(path))
+        return {
+            "number": int(match["number"]),
+            "file": os.path.basename(path),
+            "format": "binary" if match["ext"] == "mblog" else "text",
+            "start": float(times[0]) if len(times) else None,
+            "end": float(times[-1]) if len(times) else None,
+            "samples": len(times),
+            "bytes": len(read_file(path)) if match["compressed"] else os.path.getsize(path),
+            "closed": True,
+            "compression": {".gz": "gzip", ".zst": "zstd"}.get(match["compressed"]),
+        }
+
+    def recover(self):
+        entries = {entry["number"]: entry for entry in self.read_index()}
+        files = {}
+        for name in sorted(os.listdir(self.directory)):
+            if name.startswith(".compress-") or name.startswith(".index-"):
+                os.unlink(os.path.join(self.directory, name))  # Half written by a crash, the original is still there
+                continue
+            match = SEGMENT_PATTERN.match(name)
+            if match is None or match["prefix"] != self.prefix:
+                continue
+            number = int(match["number"])
+            # A crash between writing the compressed copy and deleting the original leaves both
+            if number in files and not match["compressed"]:
+                os.unlink(os.path.join(self.directory, files[number]))
+            elif number in files:
+                os.unlink(os.path.join(self.directory, name))
+                continue
+            files[number] = name
+
+        changed = False
+        for number, name in files.items():
+            path = os.path.join(self.directory, name)
+            entry = entries.get(number)
+            if entry is not None and entry["file"] == name and entry["closed"]:
+                continue
+            if not SEGMENT_PATTERN.match(name)["compressed"]:
+                removed = repair_segment(path)
+                if removed:
+                    print(f"Cut {removed} bytes of an unfinished write from {name}")
+            entries[number] = self.scan(path)
+            changed = True
+        for number in [n for n in entries if n not in files]:
+            del entries[number]
+            changed = True
+
+        self.entries = [entries[n] for n in sorted(entries)]
+        if changed:
+            self.write_index()
+        for entry in self.entries:
+            if entry["compression"] is None and self.compression != "none":
+                self.pending.put(entry["number"])
+
+    # --- writing ---
+
+    def open_segment(self, first_time):
+        number = self.entries[-1]["number"] + 1 if self.entries else 0
+        name = f"{self.prefix}-{number:06d}.{'mblog' if self.binary else 'txt'}"
+        self.segment = Segment(os.path.join(self.directory, name), self.binary)
+        self.entry = {
+            "number": number, "file": name, "format": "binary" if self.binary else "text",
+            "start": first_time, "end": first_time, "samples": 0, "bytes": self.segment.bytes,
+            "closed": False, "compression": None,
+        }
+        with self.lock:
+            self.entries.append(self.entry)
+        self.write_index()
+
+    def close_segment(self):
+        if self.segment is None:
+            return
+        self.segment.close()
+        with self.lock:
+            self.entry["bytes"] = self.segment.bytes
+            self.entry["closed"] = True
+        number = self.entry["number"]
+        self.segment = None
+        self.entry = None
+        self.write_index()
+        if self.compression != "none":
+            self.pending.put(number)
+
+    def prepare(self, timestamp, size=0):
+        """Rotates if size more bytes at timestamp wouldn't fit the open segment, opens one if
+        there is none. An empty segment takes anything, so an oversized write still lands."""
+        if not self.writable:
+            raise ValueError(f"{self.directory} was opened read only")
+        if self.segment is not None and self.segment.bytes > self.segment.header_bytes:
+            too_big = self.segment.bytes + size > self.max_bytes
+            too_long = self.entry["start"] is not None and timestamp - self.entry["start"] >= self.max_seconds
+            if too_big or too_long:
+                self.close_segment()
+        if self.segment is None:
+            self.open_segment(timestamp)
+
+    def write_samples(self, samples):
+        """samples: list of (ax, ay, az, gx, gy, gz, timestamp). A batch is split where it
+        reaches max_bytes or max_seconds, so segments never go over either."""
+        while samples:
+            self.prepare(samples[0][6])
+            encoded, sizes = self.segment.encode(samples)
+            times = np.array([sample[6] for sample in samples])
+            room = self.max_bytes - self.segment.bytes
+            count = int(np.searchsorted(np.cumsum(sizes), room, side="right"))
+            if self.entry["start"] is not None:
+                count = min(count, int(np.searchsorted(times - self.entry["start"], self.max_seconds, side="left")))
+            if count == 0:
+                if self.segment.bytes > self.segment.header_bytes:
+                    self.close_segment()
+                    continue
+                count = 1  # a fresh segment that can't even hold one sample still takes it
+            self.segment.write(encoded[:count], int(sizes[:count].sum()))
+            with self.lock:
+                if self.entry["start"] is None:
+                    self.entry["start"] = samples[0][6]
+                self.entry["end"] = samples[count - 1][6]
+                self.entry["samples"] += count
+                self.entry["bytes"] = self.segment.bytes
+            samples = samples[count:]
+        self.maybe_sync()
+
+    def write_marker(self, kind, timestamp, message=None):
+        self.prepare(timestamp, binlogs.RECORD.size if self.binary else len(marker_line(kind, timestamp, message)))
+        self.segment.write_marker(kind, timestamp, message)
+        self.maybe_sync()
+
+    def maybe_sync(self):
+        now = time.monotonic()
+        if now - self.last_sync >= self.fsync_interval:
+            self.segment.sync()
+            self.last_sync = now
+            self.write_index()
+
+    def close(self, wait=True):
+        """Closes the open segment. wait=True also waits for every compression to finish."""
+        if not self.writable:
+            return
+        self.close_segment()
+        self.pending.put(None)
+        if wait:
+            self.compressor.join()
+        if self.lock_handle is not None:
+            self.lock_handle.close()  # releases the flock
+            self.lock_handle = None
+
+    # --- compression ---
+
+    def compress_loop(self):
+        while True:
+            number = self.pending.get()
+            if number is None:
+                break
+            with self.lock:
+                entry = next((e for e in self.entries if e["number"] == number), None)
+            if entry is None or entry["compression"] is not None or not entry["closed"]:
+                continue
+            path = os.path.join(self.directory, entry["file"])
+            try:
+                started = time.perf_counter()
+                target = compress_file(path, self.compression)
+                with self.lock:
+                    entry["file"] = os.path.basename(target)
+                    entry["compression"] = self.compression
+                    entry["compressed_bytes"] = os.path.getsize(target)
+                self.write_index()
+                print(f"Compressed {os.path.basename(path)}: {entry['bytes']} -> {entry['compressed_bytes']} bytes "
+                      f"in {time.perf_counter() - started:.2f} s")
+            except Exception as e:
+                print(f"Error compressing {path}: {e}")
+
+    # --- reading ---
+
+    def segments(self, start=None, end=None):
+        """Index entries of the segments holding samples between start and end (either can be None)."""
+        if not self.writable:
+            self.entries = self.read_index()  # A live writer may have rotated or compressed since
+        with self.lock:
+            entries = [dict(entry) for entry in self.entries]
+        return [
+            entry for entry in entries
+            if entry["samples"] and (start is None or entry["end"] >= start) and (end is None or entry["start"] <= end)
+        ]
+
+    def read_window(self, start, end):
+        """(times, imu) of the samples with start <= time <= end, only the segments that overlap are read."""
+        times, imu = [np.zeros(0)], [np.zeros((0, 6))]
+        for entry in self.segments(start, end):
+            try:
+                segment_times, segment_imu = load_segment(os.path.join(self.directory, entry["file"]))
+            except FileNotFoundError:
+                # Compressed by the writer in the meantime, the compressed copy is in the index by now
+                entry = next(e for e in self.segments() if e["number"] == entry["number"])
+                segment_times, segment_imu = load_segment(os.path.join(self.directory, entry["file"]))
+            keep = (segment_times >= start) & (segment_times <= end)
+            times.append(segment_times[keep])
+            imu.append(segment_imu[keep])
+        return np.concatenate(times), np.concatenate(imu)
+
+
+def import_log(directory, path, binary=False, batch=10000, **options):
+    """Copies an existing text capture into a store, mostly to try rotation and compression on real data."""
+    store = CaptureStore(directory, binary=binary, **options)
+    samples = []
+    for event in imulogs.iter_log(path):
+        if event.kind == imulogs.SAMPLE:
+            samples.append(tuple(event.values) + (event.time,))
+            if len(samples) >= batch:
+                store.write_samples(samples)
+                samples = []
+        elif event.kind in (imulogs.START, imulogs.END, imulogs.ERROR):
+            store.write_samples(samples)
+            samples = []
+            kind = {imulogs.START: "START", imulogs.END: "END", imulogs.ERROR: "ERROR"}[event.kind]
+            store.write_marker(kind, event.time, event.message)
+    store.write_samples(samples)
+    store.close()
+    return store
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "info":
+        store = CaptureStore(sys.argv[2], writable=False)
+        for entry in store.segments():
+            size = entry.get("compressed_bytes", entry["bytes"])
+            print(f"{entry['file']:<28} {entry['start']:.3f} - {entry['end']:.3f}  {entry['samples']:>9} samples  "
+                  f"{size:>11} bytes{' (' + entry['compression'] + ')' if entry['compression'] else ''}")
+        store.close()
+    elif len(sys.argv) >= 5 and sys.argv[1] == "window":
+        store = CaptureStore(sys.argv[2], writable=False)
+        started = time.perf_counter()
+        times, imu = store.read_window(float(sys.argv[3]), float(sys.argv[4]))
+        segments = store.segments(float(sys.argv[3]), float(sys.argv[4]))
+        print(f"{len(times)} samples from {len(segments)} segments in {(time.perf_counter() - started) * 1000:.1f} ms")
+        store.close()
+    elif len(sys.argv) >= 4 and sys.argv[1] == "import":
+        started = time.perf_counter()
+        store = import_log(sys.argv[2], sys.argv[3], binary="--binary" in sys.argv, max_bytes=4 << 20)
+        print(f"Imported {sys.argv[3]} into {len(store.segments())} segments in {time.perf_counter() - started:.2f} s")
+    else:
+        print("Usage: python capturestore.py info <dir> | window <dir> <start> <end> | import <dir> <logs> [--binary]")
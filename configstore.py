@@ -0,0 +1,192 @@
+#Shared config.json handling for the backend, the GUI and the scripts
+#
+# ConfigStore keeps a parsed, typed snapshot of the file in memory. Reading a
+# setting is attribute access on that snapshot (store.current.imu_type), the
+# file is only parsed again when its mtime/size changes (reload_if_changed(),
+# polled by whoever cares, e.g. the backend's config task).
+#
+# Writes merge into the file as it is on disk, go to a temp file in the same
+# directory and are renamed over config.json, so a reader never sees half a
+# file. On posix an flock on config.json.lock also serializes the backend and
+# the GUI writing at the same time.
+#
+# Snapshots are immutable, swapping store.current is atomic, so any thread can
+# read it without a lock.
+
+import json
+import os
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows, renames are still atomic, just no cross process lock
+
+# key in config.json: (type, default). Keys not listed here are kept as they are.
+FIELDS = {
+    "IMU_TYPE": (str, "ESP32"),
+    "PHONE_IP": (str, ""),
+    "SERIAL_PROTOCOL": (str, "text"),
+    "SERIAL_PORT": (str, ""),
+    "REPLAY_FILE": (str, "example_data/drivelogs.txt"),
+    "REPLAY_SPEED": (float, 1.0),
+    "REPLAY_LOOP": (bool, True),
+    "REPLAY_SESSION": (int, 0),
+    "REPLAY_FROM": (float, 0.0),
+    "REPLAY_TO": (float, 0.0),
+    "SYNTHETIC_PROFILE": (str, "drive"),
+    "SYNTHETIC_RATE": (float, 100.0),
+    "OVERLAY_STATS": (bool, False),
+    "OVERLAY_SCREENS": (str, "all"),
+    "FILTER_SAMPLE_RATE": (float, 100.0),
+    "FILTER_FUSION_TIME_CONSTANT": (float, 0.5),
+    "FILTER_CUTOFF_HZ": (float, 5.0),
+    "LOG_FILE": (str, ""),
+    "CALIBRATION": (dict, None),
+}
+
+BOOL_STRINGS = {"true": True, "yes": True, "on": True, "1": True,
+                "false": False, "no": False, "off": False, "0": False}
+
+
+def parse_bool(value):
+    """bool("false") is True, so strings and numbers are matched explicitly."""
+    if isinstance(value, str) and value.strip().lower() in BOOL_STRINGS:
+        return BOOL_STRINGS[value.strip().lower()]
+    if isinstance(value, (int, float)) and value in (0, 1):
+        return bool(value)
+    raise ValueError(f"not a boolean: {value!r}")
+
+
+# How a value of the wrong type is converted, the type itself unless listed
+PARSERS = {bool: parse_bool}
+
+
+class Snapshot:
+    """One parsed version of config.json, every FIELDS key is an attribute (lower case)."""
+
+    def __init__(self, raw):
+        self.raw = dict(raw)
+        self.values = {}
+        for key, (cast, default) in FIELDS.items():
+            value = self.raw.get(key, default)
+            if value is not None and not isinstance(value, cast):
+                try:
+                    value = PARSERS.get(cast, cast)(value)
+                except (TypeError, ValueError):
+                    print(f"Invalid {key} in config.json: {value!r}, using {default!r}")
+                    value = default
+            self.values[key] = value
+            setattr(self, key.lower(), value)
+
+    def get(self, key, default=None):
+        """dict style access with the defaults applied, for code that takes a mapping."""
+        if key in self.values:
+            return self.values[key]
+        return self.raw.get(key, default)
+
+    def __getitem__(self, key):
+        return self.get(key)
+
+    def replace(self, **updates):
+        """New snapshot with some keys changed (not written anywhere)."""
+        raw = dict(self.raw)
+        raw.update(updates)
+        return Snapshot(raw)
+
+
+class ConfigStore:
+    def __init__(self, path="config.json"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.stamp = None
+        self.current = Snapshot({})
+        self.reload_if_changed()
+
+    def file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def read_file(self):
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            print(f"Error reading {self.path}: {e}")
+            return None
+
+    def reload_if_changed(self):
+        """Re-reads the file if it changed since the last look. True if there is a new snapshot."""
+        stamp = self.file_stamp()
+        if stamp == self.stamp and stamp is not None:
+            return False
+        with self.lock:
+            raw = self.read_file()
+            self.stamp = stamp
+            if raw is None:
+                return False  # Broken file (mid edit by hand?), keep the last good snapshot
+            self.current = Snapshot(raw)
+        return True
+
+    def update(self, **updates):
+        """Atomically writes the given keys, merged into what's on disk right now."""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with self.lock, self.file_lock():
+            raw = self.read_file()
+            if raw is None:
+                raw = dict(self.current.raw)
+            raw.update(updates)
+            handle, temp_path = tempfile.mkstemp(prefix=".config-", suffix=".json", dir=directory)
+            try:
+                try:
+                    # mkstemp makes the file private, keep the permissions config.json had
+                    os.chmod(temp_path, os.stat(self.path).st_mode & 0o777)
+                except OSError:
+                    pass
+                with os.fdopen(handle, "w") as f:
+                    json.dump(raw, f, indent=4)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.path)
+            except Exception as e:
+                print(f"Error writing {self.path}: {e}")
+                try:
+                    os.unlink(temp_path)
+                except OSError:
+                    pass
+                return False
+            self.current = Snapshot(raw)
+            self.stamp = self.file_stamp()
+        return True
+
+    def set(self, key, value):
+        return self.update(**{key: value})
+
+    def file_lock(self):
+        return _FileLock(self.path + ".lock")
+
+
+class _FileLock:
+    def __init__(self, path):
+        self.path = path
+        self.handle = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            try:
+                self.handle = open(self.path, "a")
+                fcntl.flock(self.handle, fcntl.LOCK_EX)
+            except OSError:
+                self.handle = None  # Read only directory or similar, go without
+        return self
+
+    def __exit__(self, *exc):
+        if self.handle is not None:
+            fcntl.flock(self.handle, fcntl.LOCK_UN)
+            self.handle.close()
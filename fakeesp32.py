@@ -0,0 +1,118 @@
+#Fake ESP32 on a pseudo terminal, for running the serial readers without hardware
+#
+# Creates a pty and writes a capture to it the way esp32.ino would, either as
+# tab separated text lines or as binary frames (serialframes.py). Point the
+# overlay at the printed device with SERIAL_PORT (and SERIAL_PROTOCOL "binary")
+# or pass it to capturelogs.py with --port.
+#
+# Usage:
+#   python fakeesp32.py example_data/drivelogs.txt [--binary] [--rate N] [--drop-every N] [--drift-ppm N]
+#   python fakeesp32.py bench [--binary] [seconds]
+#
+# bench pushes samples through the pty into serialreader.SerialReader as fast as
+# the pty takes them and reports what arrived.
+
+import os
+import sys
+import time
+import tty
+
+import numpy as np
+
+import replay
+import serialframes
+import serialreader
+
+
+def open_pty():
+    """Returns (master fd, slave device path)."""
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    return master, os.ttyname(slave)
+
+
+def encode(samples, first_seq, first_micros, interval_us, binary):
+    if binary:
+        return b"".join(
+            serialframes.encode_frame(first_seq + i, first_micros + i * interval_us, sample)
+            for i, sample in enumerate(samples)
+        )
+    return "".join("\t".join(str(v) for v in sample) + "\r\n" for sample in samples).encode()
+
+
+def play(master, imu, rate, binary, drop_every=0, loop=True, drift_ppm=0.0, started=None):
+    """Writes the samples at rate per second (of the host clock). drift_ppm makes the
+    device's micros() run that much fast (negative: slow) like an off crystal would."""
+    samples = [tuple(row) for row in np.asarray(imu, dtype=np.int64).clip(-32768, 32767).tolist()]
+    interval_us = int(1e6 / rate)
+    os.write(master, b"Initializing MPU...\r\nMPU6050 connection successful\r\n")
+    started = time.perf_counter() if started is None else started
+    clock = 1.0 + drift_ppm * 1e-6
+    seq = 0
+    while True:
+        for i in range(len(samples)):
+            delay = started + seq / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if not (drop_every and seq % drop_every == drop_every - 1):
+                os.write(master, encode([samples[i]], seq, int(seq * interval_us * clock), interval_us, binary))
+            seq += 1
+        if not loop:
+            return
+
+
+def benchmark(binary=True, seconds=5.0, batch=256):
+    master, device = open_pty()
+    baud = serialframes.BAUD_RATE if binary else 38400  # a pty ignores the baud rate
+    reader = serialreader.SerialReader(device, baud, protocol="binary" if binary else "text")
+    reader.start()
+    rng = np.random.default_rng(0)
+    stop = time.perf_counter() + seconds
+    sent = 0
+    while time.perf_counter() < stop:
+        chunk = rng.integers(-32768, 32767, size=(batch, 6)).tolist()
+        os.write(master, encode(chunk, sent, sent * 1000, 1000, binary))
+        sent += batch
+    time.sleep(0.5)
+    reader.stop()
+    received = reader.ring.seq
+    protocol = "binary" if binary else "text"
+    print(f"{protocol}: sent {sent / seconds:.0f} samples/sec, received {received} of {sent}")
+    print(f"malformed {reader.malformed}, dropped {reader.decoder.dropped}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    binary = "--binary" in args
+    if binary:
+        args.remove("--binary")
+
+    def flag(name, default):
+        if name in args:
+            index = args.index(name)
+            value = float(args[index + 1])
+            del args[index:index + 2]
+            return value
+        return default
+
+    rate = flag("--rate", 0)
+    drop_every = int(flag("--drop-every", 0))
+    drift_ppm = flag("--drift-ppm", 0.0)
+    if not args:
+        print("Usage: python fakeesp32.py <capture> [--binary] [--rate N] [--drop-every N] [--drift-ppm N]")
+        print("       python fakeesp32.py bench [--binary] [seconds]")
+        sys.exit(1)
+    if args[0] == "bench":
+        benchmark(binary, float(args[1]) if len(args) > 1 else 5.0)
+        sys.exit(0)
+
+    times, imu = replay.load_capture(args[0])
+    if not rate:
+        # Recorded rate, the text protocol can't go much faster at 38400 baud anyway
+        rate = (len(times) - 1) / (times[-1] - times[0]) if len(times) > 1 else 100
+    master, device = open_pty()
+    print(f"Fake ESP32 on {device}, {'binary frames' if binary else 'text'} at {rate:.0f} samples/sec")
+    try:
+        play(master, imu, rate, binary, drop_every, drift_ppm=drift_ppm)
+    except KeyboardInterrupt:
+        pass
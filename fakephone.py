@@ -0,0 +1,141 @@
+#Stand-in for the SensorServer phone app, replays a capture over a websocket
+#
+# Minimal RFC 6455 server on the standard library, good enough for
+# phoneclient.py and overlay.py (IMU_TYPE "Phone", PHONE_IP "127.0.0.1:8080").
+# Serves /sensors/connect?types=[...] and the single sensor /sensor/connect?type=...
+# Raw ESP32 counts from the capture are converted back to m/s^2 and rad/s, the
+# linear acceleration comes from motionfilter. Timestamps are nanoseconds like
+# on the phone. Every client gets its own playback from the start.
+#
+# Usage:
+#   python fakephone.py example_data/drivelogs.txt [port] [speed]
+
+import base64
+import hashlib
+import json
+import socketserver
+import struct
+import sys
+import time
+import urllib.parse
+
+import motionfilter
+import phoneclient
+import replay
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def accept_key(key):
+    return base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+
+
+def text_frame(payload):
+    """Unmasked, unfragmented text frame (servers never mask)."""
+    data = payload.encode()
+    if len(data) < 126:
+        header = struct.pack("!BB", 0x81, len(data))
+    elif len(data) < 65536:
+        header = struct.pack("!BBH", 0x81, 126, len(data))
+    else:
+        header = struct.pack("!BBQ", 0x81, 127, len(data))
+    return header + data
+
+
+def requested_sensors(path):
+    url = urllib.parse.urlparse(path)
+    query = urllib.parse.parse_qs(url.query)
+    if url.path == "/sensors/connect" and "types" in query:
+        return json.loads(query["types"][0]), True
+    if url.path == "/sensor/connect" and "type" in query:
+        return [query["type"][0]], False
+    return None, False
+
+
+def load_events(path):
+    """Returns (times, {sensor: values}) of a capture in phone units."""
+    times, imu = replay.load_capture(path)
+    linear, gravity, roll, pitch = motionfilter.MotionFilter().process(times, imu)
+    return times, {
+        phoneclient.ACCELEROMETER: imu[:, 0:3] / phoneclient.ACCEL_COUNTS,
+        phoneclient.GYROSCOPE: imu[:, 3:6] / phoneclient.GYRO_COUNTS,
+        phoneclient.LINEAR_ACCELERATION: linear / phoneclient.ACCEL_COUNTS,
+    }
+
+
+class PhoneHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request_line = self.rfile.readline().decode("latin-1").split()
+        headers = {}
+        while True:
+            line = self.rfile.readline().decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        sensors, multiple = requested_sensors(request_line[1]) if len(request_line) > 1 else (None, False)
+        if not sensors or "sec-websocket-key" not in headers:
+            self.wfile.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n")
+            return
+        self.wfile.write((
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept_key(headers['sec-websocket-key'])}\r\n\r\n"
+        ).encode())
+        print(f"Client {self.client_address[0]} subscribed to {', '.join(sensors)}")
+        try:
+            self.play(sensors, multiple)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        print(f"Client {self.client_address[0]} gone")
+
+    def play(self, sensors, multiple):
+        times, values = self.server.times, self.server.values
+        # Gyro first, phoneclient pairs every accelerometer event with the newest gyro reading
+        sensors = sorted((s for s in sensors if s in values), key=lambda s: s != phoneclient.GYROSCOPE)
+        speed = self.server.speed
+        boot = time.monotonic_ns()
+        while True:
+            started = time.perf_counter()
+            for i in range(len(times)):
+                if speed > 0:
+                    delay = started + times[i] / speed - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                timestamp = time.monotonic_ns() - boot
+                frames = []
+                for sensor in sensors:
+                    event = {"values": values[sensor][i], "timestamp": timestamp, "accuracy": 3}
+                    if multiple:
+                        event["type"] = sensor
+                    frames.append(text_frame(json.dumps(event)))
+                self.wfile.write(b"".join(frames))
+            if not self.server.loop:
+                return
+
+
+class FakePhoneServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, path, port=8080, speed=1.0, loop=True):
+        times, values = load_events(path)
+        self.times = (times - times[0]).tolist() if len(times) else []
+        self.values = {sensor: v.tolist() for sensor, v in values.items()}
+        self.speed = speed
+        self.loop = loop
+        super().__init__(("0.0.0.0", port), PhoneHandler)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python fakephone.py <capture> [port] [speed]")
+        sys.exit(1)
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8080
+    server = FakePhoneServer(sys.argv[1], port, float(sys.argv[3]) if len(sys.argv) > 3 else 1.0)
+    print(f"Fake phone replaying {sys.argv[1]} ({len(server.times)} samples) on port {port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
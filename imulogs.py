@@ -0,0 +1,322 @@
+#Shared loader for the text IMU logs written by capturelogs.py (logs.txt, example_data/*.txt)
+#
+# Three ways in:
+#   iter_log(path)     - streaming generator, one LogEvent per line, constant memory
+#   load_log(path)     - bulk vectorized parse, returns NumPy arrays split into sessions
+#   iter_chunks(path)  - the bulk parser over fixed size pieces of the file, for
+#                        logs too big to hold in memory (one LogData per piece)
+#
+# A session runs from one START line to the next, END only sets its end time.
+# Samples before the first START are a session of their own. logindex.py and
+# binlogs.py count sessions the same way, so a session number means the same
+# thing to every tool. A line only counts once its newline is written: the
+# last line of a log that doesn't end in one is a write still in progress
+# (logindex.py picks it up once it's finished), so every tool leaves it out.
+#
+# Usage:
+#   python imulogs.py bench [files...]
+
+import re
+import sys
+import time
+from collections import namedtuple
+
+import numpy as np
+
+SAMPLE = "SAMPLE"
+START = "START"
+END = "END"
+ERROR = "ERROR"
+HEADER = "HEADER"
+
+# values is (ax, ay, az, gx, gy, gz) for samples, message is set for ERROR and HEADER lines
+LogEvent = namedtuple("LogEvent", ["kind", "time", "values", "message"])
+
+sample_line = re.compile(
+    r"Accel\(x,y,z\): \((-?\d+), (-?\d+), (-?\d+)\)\s+Gyro\(x,y,z\): \((-?\d+), (-?\d+), (-?\d+)\), Time: (\d+(?:\.\d+)?)$", re.ASCII
+)
+marker_line = re.compile(r"(START|END) ([0-9.]+)$")
+error_line = re.compile(r"ERROR: (.*), ([0-9.]+)$")
+
+
+def parse_line(line):
+    """Parses one log line into a LogEvent, returns None for blank or unreadable lines."""
+    line = line.strip()
+    if not line:
+        return None
+    if line[0] == "A":
+        m = sample_line.match(line)
+        if m:
+            g = m.groups()
+            return LogEvent(SAMPLE, float(g[6]), (int(g[0]), int(g[1]), int(g[2]), int(g[3]), int(g[4]), int(g[5])), None)
+        return None
+    if line[0] == "#":
+        return LogEvent(HEADER, None, None, line[1:].strip())
+    m = marker_line.match(line)
+    if m:
+        return LogEvent(m.group(1), float(m.group(2)), None, None)
+    m = error_line.match(line)
+    if m:
+        return LogEvent(ERROR, float(m.group(2)), None, m.group(1))
+    return None
+
+
+def iter_log(path, skip_malformed=True):
+    """Yields a LogEvent for every line of the log without holding the file in memory."""
+    with open(path, "r", errors="replace") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break  # still being written
+            event = parse_line(line)
+            if event is None:
+                if line.strip() and not skip_malformed:
+                    raise ValueError(f"Malformed log line: {line.strip()}")
+                continue
+            yield event
+
+
+class Session:
+    def __init__(self, start, end, times, imu, errors):
+        self.start = start    # START marker time, None for samples logged before any START
+        self.end = end        # END marker time, None if the capture never closed cleanly
+        self.times = times    # (n,) float64 epoch seconds
+        self.imu = imu        # (n, 6) int32 ax ay az gx gy gz
+        self.errors = errors  # [(time, message)] ERROR lines inside the session
+
+    @property
+    def accel(self):
+        return self.imu[:, 0:3]
+
+    @property
+    def gyro(self):
+        return self.imu[:, 3:6]
+
+    def __len__(self):
+        return len(self.times)
+
+    def __repr__(self):
+        return f"<Session start={self.start} end={self.end} samples={len(self)} errors={len(self.errors)}>"
+
+
+class LogData:
+    def __init__(self, sessions, headers, malformed):
+        self.sessions = sessions
+        self.headers = headers      # text of '#' lines, e.g. ["Plane logs"]
+        self.malformed = malformed  # number of lines that could not be parsed
+
+    @property
+    def sample_count(self):
+        return sum(len(s) for s in self.sessions)
+
+    def all_samples(self):
+        if not self.sessions:
+            return np.zeros(0), np.zeros((0, 6), dtype=np.int32)
+        return np.concatenate([s.times for s in self.sessions]), np.concatenate([s.imu for s in self.sessions])
+
+
+# --- Bulk parsing ---
+#
+# Sample lines are parsed straight from the bytes with NumPy: every maximal run of
+# digits is a token, so a well formed sample line has 8 tokens (six values, then
+# the integer and fractional part of the time), or 7 when the time has no
+# fractional part. Times come out bit for bit as float() in parse_line gives
+# them. Marker lines are rare and go through parse_line.
+
+_digit, _minus, _dot, _space, _newline, _sample = ord("0"), ord("-"), ord("."), ord(" "), ord("\n"), ord("A")
+_whitespace = np.zeros(256, dtype=bool)
+_whitespace[list(b" \t\r\x0b\x0c")] = True
+TOKENS_PER_SAMPLE = (7, 8)
+
+
+def _token_values(a, ends, lengths, dtype):
+    """Decodes the digit runs ending at ends, one decimal place per pass."""
+    values = np.zeros(ends.shape, dtype=dtype)
+    for place in range(int(lengths.max(initial=0))):
+        digit = a.take(ends - 1 - place).astype(dtype) - _digit
+        digit[lengths <= place] = 0
+        values += digit * dtype(10) ** place
+    return values
+
+
+def _parse_sample_lines(a, line_starts, line_ends, is_sample):
+    """Returns (line_numbers, times, imu) for the lines of a that are valid samples."""
+    # Start/end offsets of every digit run
+    padded = np.zeros(len(a) + 2, dtype=bool)
+    np.less(a - _digit, 10, out=padded[1:-1])
+    edges = np.flatnonzero(padded[1:] != padded[:-1]).astype(np.int32)
+    tok_start, tok_end = edges[0::2], edges[1::2]
+
+    # Sample lines with the expected number of tokens, and the index of each one's first token
+    first_token = np.searchsorted(tok_start, line_starts)
+    counts = np.diff(first_token, append=len(tok_start))
+    ok = is_sample & np.isin(counts, TOKENS_PER_SAMPLE)
+    good_lines = np.flatnonzero(ok)
+    first_token, counts = first_token[good_lines], counts[good_lines]
+
+    # The time must be "digits" or "digits.digits" right after "Time: ", with only
+    # whitespace after it, the way the sample_line regex reads it
+    time_start = tok_start[first_token + 6]
+    time_end = tok_end[first_token + counts - 1]
+    valid = a[time_start - 1] == _space
+    split = counts == 8
+    dot = tok_end[first_token[split] + 6]
+    valid[split] &= (a[dot] == _dot) & (tok_start[first_token[split] + 7] == dot + 1)
+    end = line_ends[good_lines].copy()
+    trailing = end > time_end
+    while trailing.any():
+        trailing &= _whitespace[a[end - 1]]
+        end[trailing] -= 1
+        trailing &= end > time_end
+    valid &= end == time_end
+    good_lines, first_token, split = good_lines[valid], first_token[valid], split[valid]
+    time_start, time_end = time_start[valid], time_end[valid]
+
+    values = first_token[:, None] + np.arange(6)
+    ends = tok_end[values]
+    imu = _token_values(a, ends, ends - tok_start[values], np.int32)
+    imu[a[tok_start[values] - 1] == _minus] *= -1
+
+    # All the time's digits as one integer over 10 ** (fraction digits): when both are exact
+    # doubles the division rounds once, like float() does. Longer times go through the
+    # (slower) text conversion instead.
+    fraction_token = first_token + np.where(split, 7, 6)
+    digits = tok_end[first_token + 6] - time_start
+    places = np.where(split, tok_end[fraction_token] - tok_start[fraction_token], 0)
+    short = digits + places <= 18
+    seconds = _token_values(a, tok_end[first_token + 6], np.where(short, digits, 0), np.int64)
+    fraction = _token_values(a, tok_end[fraction_token], np.where(short, places, 0), np.int64)
+    mantissa = seconds * np.int64(10) ** places + fraction
+    exact = short & (mantissa < 2 ** 53) & (places <= 22)
+    times = mantissa / 10.0 ** places
+    slow = np.flatnonzero(~exact)
+    if len(slow):
+        width = int((time_end[slow] - time_start[slow]).max())
+        offsets = time_start[slow, None] + np.arange(width)
+        text = np.where(offsets < time_end[slow, None], a.take(offsets, mode="clip"), 0).astype(np.uint8)
+        times[slow] = text.view(f"S{width}").ravel().astype(np.float64)
+    return good_lines, times, imu
+
+
+def load_log(path_or_bytes):
+    """Parses a whole log at once and returns a LogData with one Session per START marker
+    (plus one for samples before the first)."""
+    if isinstance(path_or_bytes, (bytes, bytearray, memoryview)):
+        data = bytes(path_or_bytes)
+    else:
+        with open(path_or_bytes, "rb") as f:
+            data = f.read()
+    data = data[:data.rfind(b"\n") + 1]  # a last line without its newline is still being written
+
+    a = np.frombuffer(data, dtype=np.uint8)
+    newlines = np.flatnonzero(a == _newline)
+    line_starts = np.concatenate(([0], newlines + 1))
+    line_ends = np.concatenate((newlines, [len(a)]))
+    nonempty = line_starts < line_ends
+    line_starts, line_ends = line_starts[nonempty], line_ends[nonempty]
+
+    # Samples start with 'A', everything else (markers, headers, junk) is handled line by line
+    is_sample = a[line_starts] == _sample
+    good, times, imu = _parse_sample_lines(a, line_starts, line_ends, is_sample)
+    malformed = int(is_sample.sum()) - len(good)
+
+    headers = []
+    boundaries = []  # (line number, event) for START/END/ERROR
+    for line_no in np.flatnonzero(~is_sample):
+        text = data[line_starts[line_no]:line_ends[line_no]].decode("utf-8", errors="replace")
+        event = parse_line(text)
+        if event is None:
+            if text.strip():
+                malformed += 1
+        elif event.kind == HEADER:
+            headers.append(event.message)
+        else:
+            boundaries.append((int(line_no), event))
+
+    # Cut the sample arrays at the START lines
+    sessions = []
+    start = end = None
+    errors = []
+    first = 0
+    for line_no, event in boundaries + [(len(line_starts), None)]:
+        if event is not None and event.kind == ERROR:
+            errors.append((event.time, event.message))
+            continue
+        if event is not None and event.kind == END:
+            end = event.time
+            continue
+        stop = int(np.searchsorted(good, line_no))
+        if stop > first or start is not None:
+            sessions.append(Session(start, end, times[first:stop], imu[first:stop], errors))
+        first = stop
+        start = event.time if event is not None and event.kind == START else None
+        end = None
+        errors = []
+
+    return LogData(sessions, headers, malformed)
+
+
+def iter_chunks(path, start=0, stop=None, chunk_bytes=8 << 20):
+    """Yields a LogData for every ~chunk_bytes of the file between byte offsets start and stop,
+    cut at line ends. A piece that begins in the middle of a session has its first session's
+    start set to None, that session continues the last one of the previous piece."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        position = start
+        leftover = b""
+        while stop is None or position < stop:
+            size = chunk_bytes if stop is None else min(chunk_bytes, stop - position)
+            data = f.read(size)
+            position += len(data)
+            if not data:
+                break
+            data = leftover + data
+            cut = data.rfind(b"\n") + 1
+            if cut == 0:
+                leftover = data
+                continue
+            leftover = data[cut:]
+            yield load_log(data[:cut])
+
+
+def session_offsets(path, chunk_bytes=8 << 20):
+    """Byte offsets of every START line, found without parsing anything else."""
+    offsets = []
+    with open(path, "rb") as f:
+        position = 0
+        previous = b"\n"  # the start of the file counts as a line start
+        while True:
+            data = f.read(chunk_bytes)
+            if not data:
+                break
+            # Keep the end of the previous piece so a marker split between pieces is still found
+            window = previous + data
+            found = window.find(b"\nSTART ")
+            while found != -1:
+                offsets.append(position - len(previous) + found + 1)
+                found = window.find(b"\nSTART ", found + 1)
+            previous = window[-7:]
+            position += len(data)
+    return offsets
+
+
+def benchmark(paths, repeat=5):
+    for path in paths:
+        best = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            log = load_log(path)
+            best = min(best, time.perf_counter() - started)
+        count = log.sample_count
+        print(f"{path}: bulk    {count} samples in {best * 1000:.1f} ms ({count / best / 1e6:.2f} M samples/sec)")
+
+        started = time.perf_counter()
+        streamed = sum(1 for event in iter_log(path) if event.kind == SAMPLE)
+        elapsed = time.perf_counter() - started
+        print(f"{path}: stream  {streamed} samples in {elapsed * 1000:.1f} ms ({streamed / elapsed / 1e6:.2f} M samples/sec)")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "bench":
+        benchmark(sys.argv[2:] or ["example_data/drivelogs.txt", "example_data/planelogs.txt"])
+    else:
+        print("Usage: python imulogs.py bench [logs.txt ...]")
@@ -0,0 +1,330 @@
+#IMU sources, registered by name (the IMU_TYPE in config.json)
+#
+# Every source has the same interface:
+#   await open()            connects if needed, True when samples can be read
+#   await read_batch(t)     (times, samples) of everything that arrived, waits up
+#                           to t seconds for something. times are time.monotonic()
+#                           based, samples (n, 6) ax ay az gx gy gz in MPU6050 counts.
+#                           Empty when nothing came in, check is_open to tell a
+#                           quiet source from a lost one. The arrays may be views,
+#                           copy or consume them before the next read_batch.
+#   close()
+#   capabilities            set of strings, see below
+#   nominal_rate            samples/sec the source is expected to deliver
+#
+# Capabilities:
+#   "gyro"                  real gyro values (not zeros)
+#   "calibration"           raw counts from our own hardware, calibration.py applies
+#   "device_timestamps"     times come from the device clock, not the arrival time
+#   "sequence"              dropped samples are counted (dropped attribute)
+#   "linear_acceleration"   the device removes gravity itself (linear_ring)
+#   "finite"                runs out (replays)
+#
+# Adding a source is a class with @register("Name"), the main loops don't change.
+
+import asyncio
+import os
+import time
+
+import numpy as np
+import serial
+import serial.tools.list_ports
+
+import phoneclient
+import replay
+import serialframes
+import serialreader
+import synthetic
+
+SOURCES = {}
+
+SERIAL_BAUD_RATE = 38400  # text protocol, binary frames use serialframes.BAUD_RATE
+
+
+def register(name):
+    def add(cls):
+        cls.name = name
+        SOURCES[name] = cls
+        return cls
+    return add
+
+
+def create(name, config):
+    if name not in SOURCES:
+        raise ValueError(f"Unknown IMU source {name}, available: {', '.join(SOURCES)}")
+    return SOURCES[name](config)
+
+
+def find_serial_ports():
+    """Every port that looks like an ESP32's USB serial adapter."""
+    ports = serial.tools.list_ports.comports()
+    return [p.device for p in ports if "USB" in p.description or "UART" in p.description or "serial" in p.description.lower() or "CP210x" in p.description or "CH340" in p.description]
+
+
+def empty_batch():
+    return np.zeros(0), np.zeros((0, 6))
+
+
+class IMUSource:
+    name = None
+    capabilities = frozenset()
+    settings = ()  # config keys the source is built from, a change means a new source
+
+    def __init__(self, config):
+        self.config = {key: config.get(key) for key in self.settings}
+
+    def matches(self, config):
+        return all(config.get(key) == value for key, value in self.config.items())
+
+    @property
+    def nominal_rate(self):
+        return 100.0
+
+    @property
+    def is_open(self):
+        return False
+
+    @property
+    def dropped(self):
+        return 0
+
+    @property
+    def malformed(self):
+        return 0
+
+    async def open(self):
+        raise NotImplementedError
+
+    async def read_batch(self, timeout=1.0):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class RingSource(IMUSource):
+    """Base for sources whose reader thread fills a ring of its own, read_batch hands out what's new."""
+
+    reader = None
+    seq = 0
+
+    @property
+    def is_open(self):
+        return self.reader is not None and self.reader.running
+
+    async def wait(self, timeout):
+        # Blocking readers wait on a condition, keep that off the event loop
+        return await asyncio.to_thread(self.reader.wait_for_samples, self.seq, timeout)
+
+    @property
+    def malformed(self):
+        return self.reader.malformed if self.reader is not None else 0
+
+    async def read_batch(self, timeout=1.0):
+        if self.reader is None:
+            return empty_batch()
+        first_seq, self.seq, times, samples = await self.wait(timeout)
+        return times, samples
+
+    def close(self):
+        if self.reader is not None:
+            self.reader.stop()
+            self.reader = None
+
+
+@register("ESP32")
+class ESP32Source(RingSource):
+    settings = ("SERIAL_PORT", "SERIAL_PROTOCOL")
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.protocol = self.config["SERIAL_PROTOCOL"] or "text"
+        self.capabilities = frozenset({"gyro", "calibration"} | ({"device_timestamps", "sequence"} if self.protocol == "binary" else set()))
+
+    @property
+    def nominal_rate(self):
+        # Binary frames are paced by the firmware, text is however fast 38400 baud prints
+        return 1000.0 if self.protocol == "binary" else 120.0
+
+    @property
+    def dropped(self):
+        return self.reader.decoder.dropped if self.reader is not None else 0
+
+    @property
+    def clock_offset(self):
+        """Offset the binary decoder adds to device time to get monotonic time, None for text."""
+        return getattr(self.reader.decoder, "clock_offset", None) if self.reader is not None else None
+
+    def find_devices(self):
+        if self.config["SERIAL_PORT"]:
+            # Fixed device, e.g. the pty of fakeesp32.py
+            return [self.config["SERIAL_PORT"]]
+        devices = find_serial_ports()
+        if len(devices) > 1:
+            print(f"{len(devices)} serial ports found, using the first one that opens (multicapture.py records all of them)")
+        return devices
+
+    async def open(self):
+        # Only look for ports when we don't already have a working reader
+        if self.is_open:
+            return True
+        baud = serialframes.BAUD_RATE if self.protocol == "binary" else SERIAL_BAUD_RATE
+        for device in await asyncio.to_thread(self.find_devices):
+            try:
+                if os.name == "posix":
+                    # Read straight from the event loop, no reader thread needed
+                    self.reader = serialreader.AsyncSerialReader(device, baud, protocol=self.protocol)
+                    self.reader.start(asyncio.get_running_loop())
+                else:
+                    self.reader = serialreader.SerialReader(device, baud, protocol=self.protocol)
+                    self.reader.start()
+                self.seq = 0
+                print(f"Connected to ESP32 on {device}")
+                return True
+            except serial.SerialException as e:
+                # Busy or not ours, try the next one
+                print(f"Could not open serial port {device}: {e}")
+                self.reader = None
+                continue
+        print("No ESP32 serial port found.")
+        return False
+
+    async def wait(self, timeout):
+        if isinstance(self.reader, serialreader.AsyncSerialReader):
+            return await self.reader.wait_for_samples(self.seq, timeout)
+        return await super().wait(timeout)
+
+
+@register("Phone")
+class PhoneSource(RingSource):
+    settings = ("PHONE_IP",)
+    capabilities = frozenset({"gyro", "device_timestamps", "linear_acceleration"})
+
+    @property
+    def nominal_rate(self):
+        return 50.0  # SensorServer's default sampling period (SENSOR_DELAY_GAME, ~20 ms)
+
+    @property
+    def is_open(self):
+        return self.reader is not None and self.reader.connected
+
+    @property
+    def linear_ring(self):
+        return self.reader.linear_ring if self.reader is not None else None
+
+    async def open(self):
+        if self.reader is None:
+            # The client reconnects on its own, open() just reports whether it's connected
+            self.reader = phoneclient.PhoneClient(self.config["PHONE_IP"])
+            self.reader.start()
+        return self.reader.connected
+
+
+@register("Replay")
+class ReplaySource(IMUSource):
+    settings = ("REPLAY_FILE", "REPLAY_SPEED", "REPLAY_LOOP", "REPLAY_SESSION", "REPLAY_FROM", "REPLAY_TO")
+    capabilities = frozenset({"gyro", "finite"})
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.replay = None
+
+    @property
+    def nominal_rate(self):
+        if self.replay is None or len(self.replay.times) < 2:
+            return 100.0
+        recorded = (len(self.replay.times) - 1) / (self.replay.times[-1] or 1.0)
+        return recorded * self.replay.speed if self.replay.speed > 0 else float("inf")
+
+    @property
+    def is_open(self):
+        return self.replay is not None and not self.replay.finished
+
+    def window(self):
+        """REPLAY_FROM/REPLAY_TO as (start, end) seconds, None to play everything (REPLAY_TO 0 is the end)."""
+        start = float(self.config["REPLAY_FROM"] or 0.0)
+        end = float(self.config["REPLAY_TO"] or 0.0)
+        if start <= 0 and end <= 0:
+            return None
+        return (start, end if end > 0 else float("inf"))
+
+    async def open(self):
+        if self.replay is None:
+            try:
+                self.replay = await asyncio.to_thread(
+                    replay.ReplayIMU,
+                    self.config["REPLAY_FILE"] or "example_data/drivelogs.txt",
+                    speed=float(self.config["REPLAY_SPEED"] if self.config["REPLAY_SPEED"] is not None else 1.0),
+                    loop=bool(self.config["REPLAY_LOOP"] if self.config["REPLAY_LOOP"] is not None else True),
+                    session=self.config["REPLAY_SESSION"] - 1 if self.config["REPLAY_SESSION"] else None,
+                    window=self.window(),
+                )
+                print(f"Replaying {self.replay.path} ({len(self.replay.samples)} samples, speed {self.replay.speed or 'max'})")
+            except Exception as e:
+                print(f"Error loading replay file: {e}")
+                self.replay = None
+                return False
+        return not self.replay.finished
+
+    async def read_batch(self, timeout=1.0):
+        if self.replay is None:
+            return empty_batch()
+        deadline = time.monotonic() + timeout
+        while True:
+            times, samples, wait = self.replay.take_due()
+            if wait is None:
+                stats = self.replay.stats()
+                print(f"Replay finished: {stats['samples']} samples in {stats['seconds']:.3f} s ({stats['samples_per_sec']:.0f} samples/sec)")
+                return empty_batch()
+            if samples:
+                await asyncio.sleep(0)  # At full speed there's always more due, let the other tasks run
+                return np.array(times), np.array(samples, dtype=np.float64)
+            if time.monotonic() + wait > deadline:
+                await asyncio.sleep(max(0.0, deadline - time.monotonic()))
+                return empty_batch()
+            await asyncio.sleep(wait)
+
+
+@register("Synthetic")
+class SyntheticSource(IMUSource):
+    """Generated samples (synthetic.py), SYNTHETIC_PROFILE at SYNTHETIC_RATE samples/sec in real time."""
+
+    settings = ("SYNTHETIC_PROFILE", "SYNTHETIC_RATE")
+    capabilities = frozenset({"gyro", "calibration"})
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.rate = float(self.config["SYNTHETIC_RATE"] or 100.0)
+        self.generator = None
+        self.started = None
+
+    @property
+    def nominal_rate(self):
+        return self.rate
+
+    @property
+    def is_open(self):
+        return self.started is not None
+
+    async def open(self):
+        if self.started is None:
+            try:
+                self.generator = synthetic.SyntheticIMU(self.config["SYNTHETIC_PROFILE"] or "drive", self.rate)
+            except KeyError:
+                print(f"Unknown synthetic profile {self.config['SYNTHETIC_PROFILE']}, available: {', '.join(synthetic.PROFILES)}")
+                return False
+            self.started = time.monotonic()
+        return True
+
+    async def read_batch(self, timeout=1.0):
+        if self.started is None:
+            return empty_batch()
+        due = int((time.monotonic() - self.started) * self.rate) + 1
+        if due <= self.generator.index:
+            await asyncio.sleep(min(timeout, (self.generator.index - due + 1) / self.rate))
+            due = int((time.monotonic() - self.started) * self.rate) + 1
+        times, samples = self.generator.generate(max(0, due - self.generator.index))
+        return self.started + times, samples
+
+    def close(self):
+        self.started = None
@@ -0,0 +1,183 @@
+#Push based streaming of samples to HTTP clients
+#
+# Every client keeps its own cursor (sequence number) into a SampleRing and the
+# response generator reads whatever arrived since, every batch_ms. Nothing is
+# queued per client: a client that can't keep up simply finds its cursor
+# overwritten and skips ahead (the skipped samples are reported as dropped), so
+# a slow client never holds up the IMU loop or the other clients.
+#
+# Formats:
+#   text/event-stream: one "data: {json}" event per batch
+#       {"seq": first seq, "dropped": n, "t": [...], "v": [[...], ...]}
+#   application/octet-stream: frames of FRAME_HEADER + count FRAME_DTYPE records
+#
+# Usage:
+#   python imustream.py bench [clients] [rate] [seconds]
+
+import json
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+from flask import Response, request
+
+import samplering
+
+FRAME_MAGIC = b"MBSF"
+FRAME_HEADER = struct.Struct("<4sIQI")  # magic, sample count, first seq, dropped since last frame
+dropped_total = 0  # over all clients, for the metrics
+dropped_lock = threading.Lock()
+
+
+def frame_dtype(width):
+    return np.dtype([("time", "<f8"), ("values", "<f4", (width,))])
+
+
+class StreamClient:
+    def __init__(self, ring, batch_ms=50, downsample=1, max_batch=4096):
+        self.ring = ring
+        self.batch_interval = max(batch_ms, 1) / 1000.0
+        self.downsample = max(int(downsample), 1)
+        self.max_batch = max_batch
+        # Start at the newest sample, clients want live data not history
+        self.seq = ring.seq
+        self.dropped = 0
+
+    def next_batch(self):
+        """Waits for the next batch interval and returns (first_seq, dropped, times, values) copies."""
+        time.sleep(self.batch_interval)
+        first_seq, end_seq, times, values = self.ring.since(self.seq)
+        dropped = first_seq - self.seq
+        if end_seq - first_seq > self.max_batch:
+            dropped += end_seq - first_seq - self.max_batch
+            times, values = times[-self.max_batch:], values[-self.max_batch:]
+            first_seq = end_seq - self.max_batch
+        if self.downsample > 1:
+            keep = (np.arange(first_seq, end_seq) % self.downsample) == 0
+            times, values = times[keep], values[keep]
+        times, values = times.copy(), values.copy()
+        if not self.ring.still_valid(first_seq):
+            # Overwritten while we were copying, drop this batch rather than send torn data
+            dropped += end_seq - first_seq
+            times, values = times[:0], values[:0]
+        self.seq = end_seq
+        self.dropped += dropped
+        if dropped:
+            global dropped_total
+            with dropped_lock:
+                dropped_total += dropped
+        return first_seq, dropped, times, values
+
+    def sse(self):
+        while True:
+            first_seq, dropped, times, values = self.next_batch()
+            if len(times) == 0 and dropped == 0:
+                # Keeps the connection alive and lets the server notice a gone client
+                yield ": idle\n\n"
+                continue
+            payload = {"seq": first_seq, "dropped": dropped, "t": times.tolist(), "v": values.tolist()}
+            yield f"data: {json.dumps(payload)}\n\n"
+
+    def binary(self):
+        dtype = frame_dtype(self.ring.data.shape[1])
+        while True:
+            first_seq, dropped, times, values = self.next_batch()
+            records = np.empty(len(times), dtype=dtype)
+            records["time"] = times
+            records["values"] = values
+            yield FRAME_HEADER.pack(FRAME_MAGIC, len(records), first_seq, dropped) + records.tobytes()
+
+
+def stream_response(ring):
+    """Builds the Flask response for a stream request, options come from the query string."""
+    client = StreamClient(
+        ring,
+        batch_ms=request.args.get("batch_ms", 50, type=int),
+        downsample=request.args.get("downsample", 1, type=int),
+    )
+    if request.args.get("format") == "binary":
+        return Response(client.binary(), mimetype="application/octet-stream")
+    return Response(client.sse(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+def read_frames(response, width=6):
+    """Generator over (first_seq, dropped, records) from a binary stream (requests response)."""
+    dtype = frame_dtype(width)
+    buffer = b""
+    for chunk in response.iter_content(chunk_size=None):
+        buffer += chunk
+        while len(buffer) >= FRAME_HEADER.size:
+            magic, count, first_seq, dropped = FRAME_HEADER.unpack_from(buffer)
+            if magic != FRAME_MAGIC:
+                raise ValueError("Lost frame sync in binary stream")
+            size = FRAME_HEADER.size + count * dtype.itemsize
+            if len(buffer) < size:
+                break
+            records = np.frombuffer(buffer, dtype=dtype, count=count, offset=FRAME_HEADER.size)
+            buffer = buffer[size:]
+            yield first_seq, dropped, records
+
+
+def benchmark(clients=4, rate=1000, seconds=5.0, port=1299):
+    """Runs a producer at rate samples/sec and clients binary subscribers on localhost."""
+    import requests
+    from flask import Flask
+    from werkzeug.serving import make_server
+
+    ring = samplering.SampleRing()
+    app = Flask(__name__)
+    app.add_url_rule("/imu_stream", "imu_stream", lambda: stream_response(ring))
+    server = make_server("127.0.0.1", port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    stop = threading.Event()
+
+    def produce():
+        started = time.perf_counter()
+        sent = 0
+        while not stop.is_set():
+            due = int((time.perf_counter() - started) * rate)
+            if due > sent:
+                count = due - sent
+                ring.push_batch(np.full(count, time.monotonic()), np.random.randn(count, 6))
+                sent = due
+            time.sleep(0.001)
+
+    received = [0] * clients
+    dropped = [0] * clients
+
+    def consume(index):
+        with requests.get(f"http://127.0.0.1:{port}/imu_stream?format=binary&batch_ms=20", stream=True, timeout=5) as response:
+            for first_seq, lost, records in read_frames(response):
+                received[index] += len(records)
+                dropped[index] += lost
+                if stop.is_set():
+                    break
+
+    threading.Thread(target=produce, daemon=True).start()
+    readers = [threading.Thread(target=consume, args=(i,), daemon=True) for i in range(clients)]
+    for reader in readers:
+        reader.start()
+    time.sleep(seconds)
+    stop.set()
+    for reader in readers:
+        reader.join(timeout=2)
+    server.shutdown()
+
+    total = sum(received)
+    print(f"{clients} clients, producer {rate} samples/sec for {seconds:.0f} s")
+    print(f"delivered {total / seconds:.0f} samples/sec total, {total / seconds / clients:.0f} per client, {sum(dropped)} dropped")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "bench":
+        args = sys.argv[2:]
+        benchmark(
+            clients=int(args[0]) if len(args) > 0 else 4,
+            rate=int(args[1]) if len(args) > 1 else 1000,
+            seconds=float(args[2]) if len(args) > 2 else 5.0,
+        )
+    else:
+        print("Usage: python imustream.py bench [clients] [rate] [seconds]")
@@ -0,0 +1,346 @@
+#Sparse time index for captures (text logs and .mblog), kept next to the log
+#
+# logs.txt gets a logs.txt.idx sidecar with:
+#   blocks     one entry per BLOCK_SAMPLES samples: byte offset of the first one,
+#              sample count and the min/max timestamp in the block
+#   sessions   one entry per START..START span: byte range, START/END times,
+#              first/last sample time, sample and error counts
+#
+# A time window or a session is then read by seeking straight to the blocks that
+# hold it and parsing only those bytes, so the cost follows the size of the window,
+# not of the file. Building the index is a single chunked pass (the same NumPy
+# parser as imulogs.load_log), done once: captures only ever grow, so when the log
+# got longer the index carries on from where it stopped, and it's only rebuilt if
+# the start of the file changed or the file got shorter.
+#
+# Usage:
+#   python logindex.py <log> [more ...]                        build/refresh, print the sessions
+#   python logindex.py <log> --window FROM TO [--session N]    seconds from the start of the
+#                                                              file (or of session N)
+
+import json
+import os
+import sys
+import tempfile
+import time
+import zlib
+
+import numpy as np
+
+import binlogs
+import imulogs
+
+VERSION = 1
+BLOCK_SAMPLES = 4096
+CHUNK_BYTES = 8 << 20
+HEAD_BYTES = 4096  # crc'd to tell a grown log from a different one
+MARKER_KINDS = {binlogs.START: imulogs.START, binlogs.END: imulogs.END, binlogs.ERROR: imulogs.ERROR}
+
+
+def is_binary(path):
+    with open(path, "rb") as f:
+        return f.read(len(binlogs.MAGIC)) == binlogs.MAGIC
+
+
+def head_crc(path):
+    with open(path, "rb") as f:
+        return zlib.crc32(f.read(HEAD_BYTES))
+
+
+def scan_text(data):
+    """(sample offsets, times, markers) of a piece of text log that ends at a line end.
+    markers is [(offset, kind, time), ...], offsets are relative to the piece."""
+    a = np.frombuffer(data, dtype=np.uint8)
+    newlines = np.flatnonzero(a == imulogs._newline)
+    line_starts = np.concatenate(([0], newlines + 1))
+    line_ends = np.concatenate((newlines, [len(a)]))
+    nonempty = line_starts < line_ends
+    line_starts, line_ends = line_starts[nonempty], line_ends[nonempty]
+
+    is_sample = a[line_starts] == imulogs._sample
+    good, times, imu = imulogs._parse_sample_lines(a, line_starts, line_ends, is_sample)
+
+    markers = []
+    for line_no in np.flatnonzero(~is_sample):
+        line = data[line_starts[line_no]:line_ends[line_no]]
+        if line[:1] not in (b"S", b"E"):
+            continue  # headers and junk
+        event = imulogs.parse_line(line.decode("utf-8", errors="replace"))
+        if event is not None and event.kind in (imulogs.START, imulogs.END, imulogs.ERROR):
+            markers.append((int(line_starts[line_no]), event.kind, event.time))
+    return line_starts[good].astype(np.int64), times, markers
+
+
+def scan_records(records, base):
+    """Same as scan_text for a slice of binary records starting at byte offset base."""
+    offsets = base + np.arange(len(records), dtype=np.int64) * binlogs.RECORD_DTYPE.itemsize
+    kinds = records["kind"]
+    samples = kinds == binlogs.SAMPLE
+    markers = [(int(offsets[i]), MARKER_KINDS[int(kinds[i])], float(records["time"][i]))
+               for i in np.flatnonzero(~samples) if int(kinds[i]) in MARKER_KINDS]
+    return offsets[samples], records["time"][samples].astype(np.float64), markers
+
+
+class LogIndex:
+    def __init__(self, path, save=True):
+        self.path = path
+        self.index_path = path + ".idx"
+        self.binary = is_binary(path)
+        self.blocks = []     # [offset, samples, min time, max time]
+        self.sessions = []
+        self.indexed = binlogs.HEADER.size if self.binary else 0
+        self.crc = None
+        self.size = 0
+        if not self.load():
+            self.blocks, self.sessions = [], []
+            self.indexed = binlogs.HEADER.size if self.binary else 0
+        if self.refresh() and save:
+            self.save()
+
+    # --- sidecar file ---
+
+    def load(self):
+        try:
+            with open(self.index_path, "r") as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return False
+        except ValueError as e:
+            print(f"Rebuilding {self.index_path}: {e}")
+            return False
+        if saved.get("version") != VERSION or saved.get("block_samples") != BLOCK_SAMPLES:
+            return False
+        self.blocks, self.sessions = saved["blocks"], saved["sessions"]
+        self.indexed, self.crc = saved["indexed"], saved["crc"]
+        return True
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.index_path))
+        try:
+            handle, temp_path = tempfile.mkstemp(prefix=".logindex-", suffix=".idx", dir=directory)
+        except OSError as e:
+            print(f"Can't write {self.index_path} ({e}), using the index in memory only")
+            return
+        try:
+            os.chmod(temp_path, os.stat(self.path).st_mode & 0o666)  # mkstemp makes it private, readable like the log
+        except OSError:
+            pass
+        with os.fdopen(handle, "w") as f:
+            json.dump({
+                "version": VERSION, "block_samples": BLOCK_SAMPLES, "binary": self.binary,
+                "indexed": self.indexed, "crc": self.crc, "blocks": self.blocks, "sessions": self.sessions,
+            }, f)
+        os.replace(temp_path, self.index_path)
+
+    # --- building ---
+
+    def refresh(self):
+        """Indexes whatever was appended since the last look. True if anything changed."""
+        size = self.size = os.path.getsize(self.path)
+        crc = head_crc(self.path)
+        if crc != self.crc or size < self.indexed:
+            if self.crc is not None:
+                print(f"{self.path} changed, rebuilding its index")
+            self.blocks, self.sessions = [], []
+            self.indexed = binlogs.HEADER.size if self.binary else 0
+            self.crc = crc
+            changed = True
+        else:
+            changed = False
+        if size - self.indexed >= (binlogs.RECORD_DTYPE.itemsize if self.binary else 1):
+            before = self.indexed
+            if self.binary:
+                self.scan_binary(size)
+            else:
+                self.scan_text_file(size)
+            changed = changed or self.indexed != before
+        return changed
+
+    def scan_text_file(self, size):
+        with open(self.path, "rb") as f:
+            f.seek(self.indexed)
+            while self.indexed < size:
+                data = f.read(CHUNK_BYTES)
+                if not data:
+                    break
+                cut = data.rfind(b"\n") + 1
+                if cut == 0:
+                    if len(data) < CHUNK_BYTES:
+                        break  # A line still being written, pick it up next time
+                    cut = len(data)  # No newline in a whole chunk, it's junk anyway
+                f.seek(self.indexed + cut)
+                offsets, times, markers = scan_text(data[:cut])
+                self.add(offsets + self.indexed, times, [(self.indexed + o, k, t) for o, k, t in markers])
+                self.indexed += cut
+
+    def scan_binary(self, size):
+        records = binlogs.BinaryLog(self.path).records
+        first = (self.indexed - binlogs.HEADER.size) // binlogs.RECORD_DTYPE.itemsize
+        step = CHUNK_BYTES // binlogs.RECORD_DTYPE.itemsize
+        for begin in range(first, len(records), step):
+            chunk = records[begin:begin + step]
+            base = binlogs.HEADER.size + begin * binlogs.RECORD_DTYPE.itemsize
+            self.add(*scan_records(chunk, base))
+            self.indexed = base + len(chunk) * binlogs.RECORD_DTYPE.itemsize
+
+    def add(self, offsets, times, markers):
+        """Folds one scanned piece into the blocks and sessions."""
+        if len(times):
+            # A short last block from the previous piece is topped up first
+            previous = self.blocks[-1] if self.blocks else None
+            fill = BLOCK_SAMPLES - previous[1] if previous is not None and previous[1] < BLOCK_SAMPLES else 0
+            fill = min(fill, len(times))
+            if fill:
+                previous[1] += fill
+                previous[2] = min(previous[2], float(times[:fill].min()))
+                previous[3] = max(previous[3], float(times[:fill].max()))
+            starts = np.arange(fill, len(times), BLOCK_SAMPLES)
+            if len(starts):
+                counts = np.diff(np.append(starts, len(times)))
+                lows = np.minimum.reduceat(times, starts)
+                highs = np.maximum.reduceat(times, starts)
+                self.blocks += [[int(o), int(c), float(lo), float(hi)]
+                                for o, c, lo, hi in zip(offsets[starts].tolist(), counts.tolist(), lows.tolist(), highs.tolist())]
+
+        # Sessions: cut the samples at the markers
+        cuts = np.searchsorted(offsets, [offset for offset, kind, t in markers]) if markers else []
+        previous_cut = 0
+        for (offset, kind, t), cut in zip(markers, cuts):
+            self.count(offsets, times, previous_cut, int(cut))
+            previous_cut = int(cut)
+            session = self.sessions[-1] if self.sessions else None
+            if kind == imulogs.START:
+                if session is not None:
+                    session["stop"] = offset
+                self.sessions.append(self.new_session(offset, t))
+            elif session is not None and kind == imulogs.END:
+                session["end"] = t
+            elif session is not None:
+                session["errors"] += 1
+        self.count(offsets, times, previous_cut, len(times))
+
+    @staticmethod
+    def new_session(offset, start):
+        return {"offset": offset, "stop": None, "start": start, "end": None,
+                "first": None, "last": None, "samples": 0, "errors": 0}
+
+    def count(self, offsets, times, begin, stop):
+        if stop <= begin:
+            return
+        if not self.sessions:
+            # Samples before the first START marker, like imulogs.load_log gives a session for them
+            self.sessions.append(self.new_session(int(offsets[begin]), None))
+        session = self.sessions[-1]
+        if session["first"] is None:
+            session["first"] = float(times[begin])
+        session["last"] = float(times[stop - 1])
+        session["samples"] += stop - begin
+
+    # --- reading ---
+
+    @property
+    def first_time(self):
+        for session in self.sessions:
+            if session["first"] is not None:
+                return session["first"]
+        return None
+
+    def block_ranges(self, start, end, begin=0, stop=None):
+        """Merged byte ranges of the blocks that may hold samples between start and end,
+        limited to the byte range begin..stop. The last block runs to the end of the file,
+        so a last line without a newline is still read, like imulogs.load_log does."""
+        stop = self.size if stop is None else stop
+        ranges = []
+        for number, (offset, count, low, high) in enumerate(self.blocks):
+            block_stop = self.blocks[number + 1][0] if number + 1 < len(self.blocks) else self.size
+            if high < start or low > end or block_stop <= begin or offset >= stop:
+                continue
+            first, last = max(offset, begin), min(block_stop, stop)
+            if ranges and ranges[-1][1] >= first:
+                ranges[-1][1] = max(ranges[-1][1], last)
+            else:
+                ranges.append([first, last])
+        return [tuple(r) for r in ranges]
+
+    def read_range(self, begin, stop):
+        """(times, imu, markers) of the bytes begin..stop, which are line/record aligned."""
+        with open(self.path, "rb") as f:
+            f.seek(begin)
+            data = f.read(stop - begin)
+        if self.binary:
+            records = np.frombuffer(data, dtype=binlogs.RECORD_DTYPE, count=len(data) // binlogs.RECORD_DTYPE.itemsize)
+            samples = records["kind"] == binlogs.SAMPLE
+            markers = [(MARKER_KINDS.get(int(k)), float(t)) for k, t in zip(records["kind"][~samples], records["time"][~samples])]
+            return records["time"][samples].astype(np.float64), records["imu"][samples].astype(np.int32), markers
+        log = imulogs.load_log(data)
+        times, imu = log.all_samples()
+        markers = [(imulogs.ERROR, t) for session in log.sessions for t, message in session.errors]
+        return times, imu, markers
+
+    def read_window(self, start, end, session=None):
+        """(times, imu) of the samples with start <= time <= end (absolute timestamps),
+        within one session (its number in self.sessions) if given."""
+        begin, stop = 0, None
+        if session is not None:
+            begin, stop = self.session_range(session)
+        times, imu = [np.zeros(0)], [np.zeros((0, 6), dtype=np.int32)]
+        for first, last in self.block_ranges(start, end, begin, stop):
+            range_times, range_imu, markers = self.read_range(first, last)
+            keep = (range_times >= start) & (range_times <= end)
+            times.append(range_times[keep])
+            imu.append(range_imu[keep])
+        return np.concatenate(times), np.concatenate(imu)
+
+    def session_range(self, number):
+        session = self.sessions[number]
+        return session["offset"], session["stop"] if session["stop"] is not None else self.size
+
+    def session_ranges(self):
+        return [self.session_range(number) for number in range(len(self.sessions))]
+
+    def read_session(self, number):
+        """One session as an imulogs.Session, reading only its bytes."""
+        session = self.sessions[number]
+        times, imu, markers = self.read_range(*self.session_range(number))
+        errors = [(t, None) for kind, t in markers if kind == imulogs.ERROR]
+        return imulogs.Session(session["start"], session["end"], times, imu, errors)
+
+    def relative_window(self, start_seconds, end_seconds, session=None):
+        """read_window with the bounds in seconds from the first sample of the file (or of a session)."""
+        origin = self.first_time if session is None else self.sessions[session]["first"]
+        if origin is None:
+            return np.zeros(0), np.zeros((0, 6), dtype=np.int32)
+        return self.read_window(origin + start_seconds, origin + end_seconds, session)
+
+
+def option(args, flag, count=1):
+    if flag not in args:
+        return None
+    index = args.index(flag)
+    values = args[index + 1:index + 1 + count]
+    del args[index:index + 1 + count]
+    return values
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    window = option(args, "--window", 2)
+    session = option(args, "--session")
+    if not args:
+        print("Usage: python logindex.py <log> [more ...] [--window FROM TO [--session N]]")
+        sys.exit(1)
+    for path in args:
+        started = time.perf_counter()
+        index = LogIndex(path)
+        print(f"{path}: {sum(b[1] for b in index.blocks)} samples, {len(index.blocks)} blocks, "
+              f"{len(index.sessions)} sessions (indexed in {(time.perf_counter() - started) * 1000:.1f} ms)")
+        if window is None:
+            for number, s in enumerate(index.sessions, 1):
+                seconds = s["last"] - s["first"] if s["first"] is not None else 0.0
+                print(f"  Session {number}: {s['samples']} samples, {seconds:.1f} s, bytes {s['offset']}-{s['stop'] or index.size}")
+            continue
+        started = time.perf_counter()
+        number = int(session[0]) - 1 if session else None
+        times, imu = index.relative_window(float(window[0]), float(window[1]), number)
+        print(f"  {len(times)} samples between {window[0]} s and {window[1]} s "
+              f"read in {(time.perf_counter() - started) * 1000:.1f} ms")
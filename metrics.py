@@ -0,0 +1,148 @@
+#Low overhead instrumentation for the backend
+#
+# Counters and histograms are created once at import time and only updated in
+# place afterwards: a counter is one integer add, a histogram observation is a
+# bisect over fixed bucket bounds plus an add into a preallocated list, and
+# observe_batch() folds a whole NumPy batch in with one searchsorted/bincount.
+# Values owned by someone else (a reader's malformed count, the ring's seq) are
+# registered as callbacks and only read when metrics are scraped.
+#
+# Every metric has a single writer thread, readers (the scrape) may see a
+# histogram mid update, which is fine for monitoring.
+#
+# Exposition: REGISTRY.prometheus() (text format 0.0.4) and REGISTRY.snapshot() (JSON).
+
+import bisect
+
+import numpy as np
+
+# Latency style buckets in seconds, 50 us to 1 s
+SECONDS_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def get(self):
+        return self.value
+
+
+class CallbackMetric:
+    """Value read from fn() at scrape time, nothing to update on the hot path."""
+
+    def __init__(self, name, help, fn, kind="gauge"):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.kind = kind
+
+    def get(self):
+        try:
+            return self.fn()
+        except Exception:
+            return 0
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.help = help
+        self.bounds = list(buckets)
+        self.bounds_array = np.array(self.bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def observe_batch(self, values):
+        if len(values) == 0:
+            return
+        indexes = np.searchsorted(self.bounds_array, values, side="left")
+        for index, amount in enumerate(np.bincount(indexes, minlength=len(self.counts)).tolist()):
+            self.counts[index] += amount
+        self.count += len(values)
+        self.sum += float(np.sum(values))
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q quantile, like histogram_quantile without interpolation.
+        None when nothing was observed. A quantile past the last bound gives that bound, like
+        histogram_quantile does, so the JSON never holds Infinity."""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, amount in zip(self.bounds, self.counts):
+            seen += amount
+            if seen >= rank:
+                return bound
+        return self.bounds[-1]
+
+
+class Registry:
+    def __init__(self, prefix="motionblob_"):
+        self.prefix = prefix
+        self.metrics = []
+
+    def add(self, metric):
+        metric.name = self.prefix + metric.name
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help):
+        return self.add(Counter(name, help))
+
+    def histogram(self, name, help, buckets=SECONDS_BUCKETS):
+        return self.add(Histogram(name, help, buckets))
+
+    def callback(self, name, help, fn, kind="gauge"):
+        return self.add(CallbackMetric(name, help, fn, kind))
+
+    def prometheus(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            if metric.kind == "histogram":
+                cumulative = 0
+                for bound, amount in zip(metric.bounds, metric.counts):
+                    cumulative += amount
+                    lines.append(f'{metric.name}_bucket{{le="{bound:g}"}} {cumulative}')
+                lines.append(f'{metric.name}_bucket{{le="+Inf"}} {metric.count}')
+                lines.append(f"{metric.name}_sum {metric.sum:.9g}")
+                lines.append(f"{metric.name}_count {metric.count}")
+            else:
+                lines.append(f"{metric.name} {metric.get()}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """Compact JSON form: plain values, histograms as count/sum/p50/p99."""
+        result = {}
+        for metric in self.metrics:
+            name = metric.name[len(self.prefix):]
+            if metric.kind == "histogram":
+                result[name] = {
+                    "count": metric.count,
+                    "sum": round(metric.sum, 6),
+                    "p50": metric.quantile(0.5),
+                    "p99": metric.quantile(0.99),
+                }
+            else:
+                result[name] = metric.get()
+        return result
+
+
+REGISTRY = Registry()
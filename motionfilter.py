@@ -0,0 +1,180 @@
+#Streaming motion filter: gyro/accel fusion, gravity removal and low pass
+#
+# Works on raw MPU6050 counts. Per sample:
+#   gravity[n] = a * (gravity[n-1] - dt * gyro[n] x tilt[n]) + (1 - a) * accel[n]
+#   linear     = lowpass(accel - gravity)
+#   roll/pitch = angles of the gravity vector
+# which is a complementary filter on the gravity vector: the gyro carries it
+# through fast rotations, the accel pulls it back so it doesn't drift. tilt is
+# a slow low pass of the accel standing in for the gravity direction in the
+# gyro term, which keeps every stage a first order linear recursion. That lets
+# process() run whole batches as blocked matrix products, while update() does
+# the same maths one sample at a time. Both share state, so they can be mixed.
+#
+# Usage:
+#   python motionfilter.py bench [logs.txt ...]
+
+import math
+import sys
+import time
+
+import numpy as np
+
+GYRO_LSB_PER_DPS = 131.0  # MPU6050 default +-250 deg/s range
+BLOCK = 128
+
+_kernels = {}
+
+
+def _kernel(a, size):
+    key = (a, size)
+    if key not in _kernels:
+        i = np.arange(size)
+        exponent = i[:, None] - i[None, :]
+        _kernels[key] = (np.where(exponent >= 0, a ** np.maximum(exponent, 0), 0.0), a ** (i + 1.0))
+    return _kernels[key]
+
+
+def first_order_iir(u, a, y0):
+    """y[n] = a * y[n-1] + u[n] along axis 0 of u (n, k), starting from y0 (k,).
+    Returns (y, y[-1])."""
+    n = len(u)
+    if n == 0:
+        return u.copy(), y0
+    size = min(BLOCK, n)
+    blocks = -(-n // size)
+    padded = np.zeros((blocks * size,) + u.shape[1:])
+    padded[:n] = u
+    padded = padded.reshape((blocks, size) + u.shape[1:])
+    kernel, powers = _kernel(a, size)
+    # Zero state response of every block at once, then chain the blocks together
+    y = np.matmul(kernel, padded)
+    carry = np.asarray(y0, dtype=np.float64)
+    for b in range(blocks):
+        y[b] += powers[:, None] * carry
+        carry = y[b, -1]
+    y = y.reshape((blocks * size,) + u.shape[1:])[:n]
+    return y, y[-1].copy()
+
+
+def smoothing_factor(cutoff_hz, sample_rate):
+    """Pole of a one pole low pass, y[n] = a * y[n-1] + (1 - a) * x[n]."""
+    return math.exp(-2 * math.pi * cutoff_hz / sample_rate)
+
+
+def tilt_angles(gravity):
+    """Roll and pitch in degrees for gravity vectors (n, 3) or (3,)."""
+    gx, gy, gz = gravity[..., 0], gravity[..., 1], gravity[..., 2]
+    roll = np.degrees(np.arctan2(gy, gz))
+    pitch = np.degrees(np.arctan2(-gx, np.hypot(gy, gz)))
+    return roll, pitch
+
+
+class MotionFilter:
+    def __init__(self, sample_rate=100.0, fusion_time_constant=0.5, cutoff_hz=5.0, tilt_cutoff_hz=0.5,
+                 gyro_lsb_per_dps=GYRO_LSB_PER_DPS):
+        self.sample_rate = sample_rate
+        self.nominal_dt = 1.0 / sample_rate
+        # Complementary filter weight on the gyro prediction
+        self.fusion = fusion_time_constant / (fusion_time_constant + self.nominal_dt)
+        self.lowpass = smoothing_factor(cutoff_hz, sample_rate)
+        self.tilt_lowpass = smoothing_factor(tilt_cutoff_hz, sample_rate)
+        self.gyro_scale = math.radians(1.0) / gyro_lsb_per_dps
+        self.reset()
+
+    def reset(self):
+        self.gravity = None
+        self.tilt = None
+        self.linear = np.zeros(3)
+        self.last_time = None
+
+    def _start(self, accel):
+        self.gravity = np.array(accel, dtype=np.float64)
+        self.tilt = self.gravity.copy()
+
+    def process(self, times, imu):
+        """Filters a batch. times (n,) seconds, imu (n, 6) raw counts.
+        Returns (linear (n, 3), gravity (n, 3), roll (n,), pitch (n,))."""
+        times = np.asarray(times, dtype=np.float64)
+        imu = np.asarray(imu, dtype=np.float64)
+        if len(times) == 0:
+            empty = np.zeros((0, 3))
+            return empty, empty, np.zeros(0), np.zeros(0)
+        accel = imu[:, 0:3]
+        gyro = imu[:, 3:6] * self.gyro_scale
+        if self.gravity is None:
+            self._start(accel[0])
+
+        previous = self.last_time if self.last_time is not None else times[0] - self.nominal_dt
+        dt = np.diff(times, prepend=previous)
+        dt = np.where((dt > 0) & (dt < 1.0), dt, self.nominal_dt)
+        self.last_time = times[-1]
+
+        tilt, self.tilt = first_order_iir((1 - self.tilt_lowpass) * accel, self.tilt_lowpass, self.tilt)
+        rotation = -dt[:, None] * np.cross(gyro, tilt)
+        a = self.fusion
+        gravity, self.gravity = first_order_iir(a * rotation + (1 - a) * accel, a, self.gravity)
+        linear, self.linear = first_order_iir((1 - self.lowpass) * (accel - gravity), self.lowpass, self.linear)
+        roll, pitch = tilt_angles(gravity)
+        return linear, gravity, roll, pitch
+
+    def update(self, timestamp, sample):
+        """Filters one sample, returns (linear (3,), gravity (3,), roll, pitch)."""
+        ax, ay, az, gx, gy, gz = sample
+        s = self.gyro_scale
+        wx, wy, wz = gx * s, gy * s, gz * s
+        if self.gravity is None:
+            self._start((ax, ay, az))
+        dt = timestamp - self.last_time if self.last_time is not None else self.nominal_dt
+        if not 0 < dt < 1.0:
+            dt = self.nominal_dt
+        self.last_time = timestamp
+
+        t, k = self.tilt, self.tilt_lowpass
+        tx = t[0] = k * t[0] + (1 - k) * ax
+        ty = t[1] = k * t[1] + (1 - k) * ay
+        tz = t[2] = k * t[2] + (1 - k) * az
+        # gyro x tilt
+        cx, cy, cz = wy * tz - wz * ty, wz * tx - wx * tz, wx * ty - wy * tx
+        g, a = self.gravity, self.fusion
+        g[0] = a * (g[0] - dt * cx) + (1 - a) * ax
+        g[1] = a * (g[1] - dt * cy) + (1 - a) * ay
+        g[2] = a * (g[2] - dt * cz) + (1 - a) * az
+        lin, k = self.linear, self.lowpass
+        lin[0] = k * lin[0] + (1 - k) * (ax - g[0])
+        lin[1] = k * lin[1] + (1 - k) * (ay - g[1])
+        lin[2] = k * lin[2] + (1 - k) * (az - g[2])
+        roll = math.degrees(math.atan2(g[1], g[2]))
+        pitch = math.degrees(math.atan2(-g[0], math.hypot(g[1], g[2])))
+        return lin.copy(), g.copy(), roll, pitch
+
+
+def benchmark(paths, sample_rate=100.0):
+    import imulogs
+    for path in paths:
+        times, imu = imulogs.load_log(path).all_samples()
+        count = len(times)
+
+        motion = MotionFilter(sample_rate)
+        started = time.perf_counter()
+        linear, gravity, roll, pitch = motion.process(times, imu)
+        batch = time.perf_counter() - started
+
+        motion = MotionFilter(sample_rate)
+        samples = imu.tolist()
+        stamps = times.tolist()
+        started = time.perf_counter()
+        for t, sample in zip(stamps, samples):
+            online = motion.update(t, sample)
+        single = time.perf_counter() - started
+
+        drift = float(np.abs(online[0] - linear[-1]).max())
+        print(f"{path}: batch  {count / batch / 1e6:.2f} M samples/sec")
+        print(f"{path}: online {count / single / 1e3:.0f} k samples/sec (batch/online difference {drift:.3g} counts)")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "bench":
+        benchmark(sys.argv[2:] or ["example_data/drivelogs.txt", "example_data/planelogs.txt"])
+    else:
+        print("Usage: python motionfilter.py bench [logs.txt ...]")
@@ -0,0 +1,369 @@
+#Records several ESP32 IMUs at once (seat and dashboard, say) and time aligns them
+#
+# Every port gets its own ESP32 source (imusources.py) and its own task: on
+# posix the readers are event loop callbacks, on Windows reader threads, so a
+# slow or silent port never holds up the others. All readers stamp samples with
+# the same time.monotonic() clock (binary frames map the device clock onto it).
+#
+# Per device:
+#   DriftEstimator   the device clock against the host's: the least delayed batch
+#                    of every second (arrival - timestamp) is the lower envelope of
+#                    the transport delay, a line through the last two minutes of it
+#                    gives the drift, timestamps are corrected with it
+# Merge:
+#   Aligner          resamples every device onto one grid (--rate per second) with
+#                    linear interpolation. Rows are emitted up to the newest time
+#                    every live device has reached, a device that went quiet for
+#                    more than max_lag seconds stops holding that back and its
+#                    channels are left empty until it's back.
+#
+# Output in --out (multilogs by default):
+#   <name>.txt      each device's samples in the usual log format (drift corrected),
+#                   so analyzelogs.py, replay.py and logindex.py work on them
+#   merged.csv      time, then ax ay az gx gy gz of every device, empty where a
+#                   device had no data
+#
+# Usage:
+#   python multicapture.py [--ports auto | PORT,PORT,...] [--names seat,dash,...]
+#                          [--protocol text|binary] [--rate HZ] [--out DIR]
+#   python multicapture.py test [devices] [seconds]
+#
+# test runs against fake devices on ptys (fakeesp32.py), mixing protocols, rates
+# and injected clock drift, and reports the drift estimates and how well the
+# merged streams line up.
+
+import asyncio
+import collections
+import io
+import os
+import queue
+import sys
+import threading
+import time
+
+import numpy as np
+
+import capturestore
+import configstore
+import imusources
+
+DRIFT_WINDOW = 1.0     # seconds per lower envelope point
+DRIFT_HISTORY = 120    # points in the fit
+DRIFT_MIN_POINTS = 5
+
+
+class DriftEstimator:
+    """Slope of (arrival - timestamp) over time: how much slower the device clock runs than the
+    host's, as it shows in the timestamps. Zero for sources stamped on arrival."""
+
+    def __init__(self, window=DRIFT_WINDOW, history=DRIFT_HISTORY):
+        self.window = window
+        self.points = collections.deque(maxlen=history)
+        self.current = None  # [window start, timestamp, smallest lag]
+        self.origin = None
+        self.slope = 0.0
+
+    @property
+    def ppm(self):
+        """Device clock error, positive when it runs fast."""
+        return -self.slope * 1e6
+
+    def observe(self, arrival, timestamp):
+        lag = arrival - timestamp
+        if self.origin is None:
+            self.origin = timestamp
+        if self.current is None or timestamp - self.current[0] >= self.window:
+            if self.current is not None:
+                self.points.append((self.current[1], self.current[2]))
+                self.fit()
+            self.current = [timestamp, timestamp, lag]
+        elif lag < self.current[2]:
+            self.current[1:] = [timestamp, lag]
+
+    def fit(self):
+        if len(self.points) < DRIFT_MIN_POINTS:
+            return
+        t, lag = np.array(self.points).T
+        self.slope = float(np.polyfit(t - self.origin, lag, 1)[0])
+
+    def correct(self, times):
+        if self.origin is None:
+            return times
+        return times + self.slope * (times - self.origin)
+
+
+class Aligner:
+    def __init__(self, names, rate=100.0, max_lag=0.5, max_gap=0.1):
+        self.names = list(names)
+        self.rate = rate
+        self.max_lag = max_lag
+        self.max_gap = max_gap  # no interpolating across a hole longer than this
+        self.times = {name: np.zeros(0) for name in self.names}
+        self.imu = {name: np.zeros((0, 6)) for name in self.names}
+        self.last_arrival = {name: None for name in self.names}
+        self.base = None
+        self.next_index = 0
+
+    def add(self, name, times, imu, arrival):
+        self.times[name] = np.concatenate((self.times[name], times))
+        self.imu[name] = np.concatenate((self.imu[name], np.asarray(imu, dtype=np.float64)))
+        self.last_arrival[name] = arrival
+
+    def live(self, now):
+        return [name for name in self.names
+                if len(self.times[name]) and now - self.last_arrival[name] <= self.max_lag]
+
+    def emit(self, now):
+        """(times, values) of the grid rows every live device has data for by now,
+        values is (n, 6 * devices) with NaN where a device has nothing."""
+        live = self.live(now)
+        if not live:
+            return np.zeros(0), np.zeros((0, 6 * len(self.names)))
+        if self.base is None:
+            # Start once the first device has data, later ones join when they show up
+            self.base = min(self.times[name][0] for name in live)
+        watermark = min(self.times[name][-1] for name in live)
+        last_index = int(np.floor((watermark - self.base) * self.rate))
+        if last_index < self.next_index:
+            return np.zeros(0), np.zeros((0, 6 * len(self.names)))
+        grid = self.base + np.arange(self.next_index, last_index + 1) / self.rate
+        self.next_index = last_index + 1
+
+        values = np.full((len(grid), 6 * len(self.names)), np.nan)
+        for column, name in enumerate(self.names):
+            times, imu = self.times[name], self.imu[name]
+            if len(times) == 0:
+                continue
+            inside = (grid >= times[0]) & (grid <= times[-1])
+            if inside.any():
+                points = grid[inside]
+                after = np.clip(np.searchsorted(times, points), 1, len(times) - 1) if len(times) > 1 else np.zeros(len(points), dtype=int)
+                hole = (times[after] - times[after - 1] > self.max_gap) if len(times) > 1 else np.zeros(len(points), dtype=bool)
+                rows = np.column_stack([np.interp(points, times, imu[:, axis]) for axis in range(6)])
+                rows[hole] = np.nan
+                values[inside, column * 6:column * 6 + 6] = rows
+            # Keep the last sample before the next grid point, it's needed to interpolate up to it
+            keep = max(0, int(np.searchsorted(times, grid[-1], side="right")) - 1)
+            self.times[name], self.imu[name] = times[keep:], imu[keep:]
+        return grid, values
+
+
+class Writer(threading.Thread):
+    """All file writes of the capture, so the readers never wait on the disk."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.queue = queue.Queue()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            path, text = item
+            try:
+                with open(path, "a") as f:
+                    f.write(text)
+            except Exception as e:
+                print(f"Error writing {path}: {e}")
+
+    def write(self, path, text):
+        self.queue.put((path, text))
+
+    def stop(self):
+        self.queue.put(None)
+        self.join()
+
+
+def format_rows(times, values):
+    out = io.StringIO()
+    np.savetxt(out, np.column_stack((times, values)), fmt=["%.6f"] + ["%.1f"] * values.shape[1], delimiter=",")
+    return out.getvalue().replace("nan", "")
+
+
+class Device:
+    def __init__(self, name, port, source):
+        self.name = name
+        self.port = port
+        self.source = source
+        self.drift = DriftEstimator()
+        self.anchor = None
+        self.samples = 0
+
+
+class MultiCapture:
+    def __init__(self, ports, names=None, protocol="text", rate=100.0, out="multilogs", settings=None):
+        settings = settings or configstore.ConfigStore("config.json").current
+        names = names or [os.path.basename(port) for port in ports]
+        protocols = protocol if isinstance(protocol, (list, tuple)) else [protocol] * len(ports)
+        self.devices = [
+            Device(name, port, imusources.create("ESP32", settings.replace(SERIAL_PORT=port, SERIAL_PROTOCOL=port_protocol)))
+            for name, port, port_protocol in zip(names, ports, protocols)
+        ]
+        self.aligner = Aligner([device.name for device in self.devices], rate)
+        self.out = out
+        self.rows = 0
+        # Monotonic stamps go to the logs as epoch time, anchored once like capturelogs.py
+        self.clock_offset = time.time() - time.monotonic()
+        self.writer = Writer()
+        self.stop_event = None
+
+    def log_path(self, device):
+        return os.path.join(self.out, f"{device.name}.txt")
+
+    def marker(self, kind, message=None):
+        stamp = self.clock_offset + time.monotonic()
+        for device in self.devices:
+            line = f"ERROR: {message}, {stamp}\n" if kind == "ERROR" else f"{kind} {stamp}\n"
+            self.writer.write(self.log_path(device), line)
+
+    async def read_device(self, device):
+        while not self.stop_event.is_set():
+            if not device.source.is_open:
+                if not await device.source.open():
+                    await asyncio.sleep(5)
+                    continue
+            times, samples = await device.source.read_batch(timeout=0.5)
+            if len(samples) == 0:
+                if not device.source.is_open:
+                    print(f"Lost {device.name} ({device.port}), reconnecting...")
+                    self.writer.write(self.log_path(device), f"ERROR: {device.port} connection lost, {self.clock_offset + time.monotonic()}\n")
+                continue
+            arrival = time.monotonic()
+            times = np.array(times, dtype=np.float64)
+            offset = device.source.clock_offset
+            if offset is not None:
+                # The decoder moves its offset whenever a frame arrives quicker than any before,
+                # which hides a fast device clock. Keep the first one, the drift fit does the rest.
+                if device.anchor is None:
+                    device.anchor = offset
+                times += device.anchor - offset
+            device.drift.observe(arrival, times[-1])
+            times = device.drift.correct(times)
+            device.samples += len(samples)
+            self.aligner.add(device.name, times, samples, arrival)
+            self.writer.write(self.log_path(device), capturestore.format_text(
+                tuple(int(v) for v in row) + (t,) for row, t in zip(samples.tolist(), (times + self.clock_offset).tolist())
+            ))
+
+    async def merge(self, interval=0.1):
+        path = os.path.join(self.out, "merged.csv")
+        if not os.path.exists(path):
+            columns = [f"{device.name}_{axis}" for device in self.devices for axis in ("ax", "ay", "az", "gx", "gy", "gz")]
+            self.writer.write(path, "time," + ",".join(columns) + "\n")
+        while not self.stop_event.is_set():
+            await asyncio.sleep(interval)
+            times, values = self.aligner.emit(time.monotonic())
+            if len(times):
+                self.rows += len(times)
+                self.writer.write(path, format_rows(times + self.clock_offset, values))
+
+    async def run(self, seconds=None):
+        os.makedirs(self.out, exist_ok=True)
+        self.writer.start()
+        self.stop_event = asyncio.Event()
+        self.marker("START")
+        tasks = [asyncio.create_task(self.read_device(device)) for device in self.devices]
+        tasks.append(asyncio.create_task(self.merge()))
+        try:
+            if seconds is None:
+                await asyncio.gather(*tasks)
+            else:
+                await asyncio.sleep(seconds)
+        finally:
+            self.stop_event.set()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for device in self.devices:
+                device.source.close()
+            self.marker("END")
+            self.writer.stop()
+
+    def report(self):
+        for device in self.devices:
+            print(f"{device.name} ({device.port}): {device.samples} samples, drift {device.drift.ppm:+.0f} ppm, "
+                  f"dropped {device.source.dropped}, malformed {device.source.malformed}")
+        print(f"merged: {self.rows} rows at {self.aligner.rate:g} Hz")
+
+
+def alignment_error(values, reference, other, rate, max_shift=0.05):
+    """Shift in seconds that best lines up two devices' ax channels in the merged rows."""
+    a, b = values[:, reference * 6], values[:, other * 6]
+    both = ~np.isnan(a) & ~np.isnan(b)
+    a, b = np.diff(a[both]), np.diff(b[both])
+    shifts = range(-int(max_shift * rate), int(max_shift * rate) + 1)
+    scores = [np.dot(a[max(0, s):len(a) + min(0, s)], b[max(0, -s):len(b) + min(0, -s)]) for s in shifts]
+    return shifts[int(np.argmax(scores))] / rate
+
+
+def test(count=3, seconds=20.0):
+    """Fake devices on ptys playing the same motion at the same time, different protocols,
+    rates and clock drift. Afterwards their merged channels should line up."""
+    import tempfile
+    import fakeesp32
+    import synthetic
+    times, imu = synthetic.SyntheticIMU("drive", 1000.0).seconds(seconds + 5)
+    started = time.perf_counter() + 0.5
+    ports, setups = [], []
+    for index in range(count):
+        binary = index % 2 == 0
+        rate = 1000.0 if binary else 100.0
+        drift = [0.0, 0.0, -800.0, 0.0, 500.0][index % 5] if binary else 0.0
+        master, device = fakeesp32.open_pty()
+        data = imu[::int(1000 / rate)]
+        threading.Thread(target=fakeesp32.play, args=(master, data, rate, binary),
+                         kwargs={"drift_ppm": drift, "started": started, "loop": False}, daemon=True).start()
+        ports.append(device)
+        setups.append(("binary" if binary else "text", rate, drift))
+
+    out = tempfile.mkdtemp(prefix="multicapture-")
+    capture = MultiCapture(ports, [f"imu{index}" for index in range(count)], [setup[0] for setup in setups],
+                           rate=1000.0, out=out, settings=configstore.Snapshot({}))
+    asyncio.run(capture.run(seconds))
+    capture.report()
+
+    with open(os.path.join(out, "merged.csv")) as f:
+        f.readline()
+        values = np.genfromtxt(f, delimiter=",")[:, 1:]
+    for index, (protocol, rate, drift) in enumerate(setups):
+        coverage = 1 - np.isnan(values[:, index * 6]).mean()
+        shift = alignment_error(values, 0, index, 1000.0) if index else 0.0
+        print(f"imu{index}: {protocol} at {rate:g}/s, injected drift {drift:+.0f} ppm, "
+              f"estimated {capture.devices[index].drift.ppm:+.0f} ppm, in {coverage:.0%} of rows, "
+              f"offset to imu0 {shift * 1000:+.0f} ms")
+    print(f"Logs in {out}")
+
+
+def option(args, flag, cast, default):
+    if flag not in args:
+        return default
+    index = args.index(flag)
+    value = cast(args[index + 1])
+    del args[index:index + 2]
+    return value
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args and args[0] == "test":
+        test(int(args[1]) if len(args) > 1 else 3, float(args[2]) if len(args) > 2 else 20.0)
+        sys.exit(0)
+    ports = option(args, "--ports", str, "auto")
+    names = option(args, "--names", str, None)
+    protocol = option(args, "--protocol", str, "text")
+    rate = option(args, "--rate", float, 100.0)
+    out = option(args, "--out", str, "multilogs")
+    ports = imusources.find_serial_ports() if ports == "auto" else ports.split(",")
+    if not ports:
+        print("No ESP32 serial ports found.")
+        sys.exit(1)
+    names = names.split(",") if names else None
+    if names and len(names) != len(ports):
+        print(f"{len(ports)} ports but {len(names)} names")
+        sys.exit(1)
+    capture = MultiCapture(ports, names, protocol, rate, out)
+    print(f"Capturing {', '.join(ports)} into {out}")
+    try:
+        asyncio.run(capture.run())
+    except KeyboardInterrupt:
+        print("\nKeyboardInterrupt detected. Exiting...")
+    capture.report()
@@ -1,65 +1,104 @@
-import serial
-import serial.tools.list_ports
 import time
+import math
 import threading
-import queue
+import collections
 import sys
+import signal
+import asyncio
+import numpy as np
 from PyQt5 import QtCore, QtGui, QtWidgets
-import requests
-from flask import Flask, jsonify # Import Flask and jsonify
-import json
-import websocket
+from flask import Flask, Response, jsonify, request # Import Flask and jsonify
+from werkzeug.serving import make_server
+import imusources
+import samplering
+import motionfilter
+import calibration
+import imustream
+import asynccore
+import configstore
+import metrics
 
 # --- Global Variables ---
-baud_rate = 38400  # IMU baud rate
-ax = ay = az = gx = gy = gz = 0
-s = None  # Serial port object
-global retryconenction, capture_stablization, finish_stablization, crashamount, phone_imu_thread
+# Every IMU source writes its samples here, everything else reads from it
+imu_ring = samplering.SampleRing()
+# Filtered output of imu_ring: linear accel x, y, z (gravity removed) then roll, pitch in degrees
+motion_ring = samplering.SampleRing(width=5)
+motion_filter = None  # motionfilter.MotionFilter, created from the config
+imu_calibration = calibration.Calibration()  # applied to ESP32 samples before filtering
+calibrator = None  # calibration.Calibrator while a calibration is running
+CALIBRATION_TIMEOUT = 30.0  # seconds to converge before giving up
+CALIBRATION_STILL_WINDOW = 0.5  # seconds of samples that must look still to start
+calibration_deadline = 0.0
+calibration_published = 0.0
+# What /calibration_status reports, replaced (never changed in place) under calibration_changed
+calibration_report = {"version": 0, "state": "idle"}
+calibration_changed = threading.Condition()
+calibration_saves = set()  # asyncio tasks writing a finished calibration to config.json
+imu_source = None  # imusources.IMUSource picked by IMU_TYPE
+ring_seq = 0  # first sample of imu_ring the main loop hasn't handled yet
+sample_latency = 0.0  # seconds between the source reading a sample and it reaching the main loop
+global retryconenction, capture_stablization, finish_stablization, crashamount
 retryconenction = True
 capture_stablization = False
 finish_stablization = False
-phone_imu_thread = None
 crashamount = 0
 currentstate = "STANDYBY"
-
-# --- Data Queue for Overlay ---
-data_queue = queue.Queue()
+# CoreBridge of the GUI, set by run_gui (None when headless). Woken after every batch so the overlays draw a frame
+gui_bridge = None
+overlays = []  # Every Overlay window, one per screen
 stop_event = threading.Event()
 
+# --- Metrics ---
+# Hot path metrics are updated in place, the rest is read from the owners when scraped
+samples_total = metrics.REGISTRY.counter("samples_total", "Samples received from the IMU source")
+frames_total = metrics.REGISTRY.counter("frames_total", "Overlay frames run (new samples or dots easing back to rest)")
+reconnects_total = metrics.REGISTRY.counter("reconnects_total", "Times the IMU data stopped and the connection was retried")
+sample_latency_seconds = metrics.REGISTRY.histogram("sample_latency_seconds", "Time from the source reading a sample to the main loop handling it")
+display_latency_seconds = metrics.REGISTRY.histogram("display_latency_seconds", "Time from the source reading a sample to the overlay picking it up")
+loop_seconds = metrics.REGISTRY.histogram("loop_seconds", "Main loop processing time per batch (calibration, filter, publish)")
+paint_seconds = metrics.REGISTRY.histogram("paint_seconds", "Overlay paintEvent time")
+metrics.REGISTRY.callback("malformed_total", "Malformed lines or bad frames from the source", lambda: imu_source.malformed if imu_source is not None else 0, "counter")
+metrics.REGISTRY.callback("source_dropped_total", "Samples the source lost on the way (sequence gaps)", lambda: imu_source.dropped if imu_source is not None else 0, "counter")
+metrics.REGISTRY.callback("stream_dropped_total", "Samples /imu_stream and /motion_stream clients skipped", lambda: imustream.dropped_total, "counter")
+metrics.REGISTRY.callback("crashes_total", "Main loop crashes (crashamount)", lambda: crashamount, "counter")
+metrics.REGISTRY.callback("ring_seq", "Samples ever written to imu_ring", lambda: imu_ring.seq, "counter")
+metrics.REGISTRY.callback("connected", "1 while IMU data is flowing", lambda: int(currentstate in ("READY", "RUNNING")))
+
 # --- Flask App Initialization ---
 app = Flask(__name__)
 
 #Config handling
-currentconfig = {}
-
 CONFIG_FILE = 'config.json'
+# Parsed once and re-read only when the file changes (config_task), settings are plain attributes
+config = configstore.ConfigStore(CONFIG_FILE)
 
-def read_config(value):    
-    try:
-        with open(CONFIG_FILE, 'r') as f:
-            config = json.load(f)
-        return config[value]
-    except Exception as e:
-        print(f"Error reading config.json: {e}")
-        return None
-
-def write_config(value, new_value):
-    try:
-        with open(CONFIG_FILE, 'r') as f:
-            config = json.load(f)
-        config[value] = new_value
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump(config, f, indent=4)
-    except Exception as e:
-        print(f"Error writing config.json: {e}")
-
-def checkconfig():
-    global currentconfig
-    try:
-        with open(CONFIG_FILE, 'r') as f:
-            currentconfig = json.load(f)
-    except Exception as e:
-        print(f"Error reading config.json: {e}")
+def apply_config():
+    """
+    Rebuilds everything that depends on config.json, at startup and whenever the file changes.
+    """
+    global imu_calibration
+    build_motion_filter()
+    imu_calibration = calibration.Calibration.from_config(config.current.calibration)
+
+def filter_rate():
+    """
+    Samples/sec the filter coefficients are worked out for: what the active source delivers
+    (1 kHz binary ESP32, 50 Hz phone, ...), FILTER_SAMPLE_RATE until there is a source.
+    """
+    if imu_source is not None:
+        rate = imu_source.nominal_rate
+        if math.isfinite(rate) and rate > 0:
+            return rate
+    return config.current.filter_sample_rate
+
+def build_motion_filter():
+    global motion_filter
+    settings = config.current
+    motion_filter = motionfilter.MotionFilter(
+        sample_rate=filter_rate(),
+        fusion_time_constant=settings.filter_fusion_time_constant,
+        cutoff_hz=settings.filter_cutoff_hz,
+    )
 
 
 # --- REST API Endpoint ---
@@ -79,6 +118,8 @@ def get_imu_data():
     """
     Returns the current IMU data as a JSON object.
     """
+    seq, timestamp, sample = imu_ring.latest()
+    ax, ay, az, gx, gy, gz = sample.tolist()
     imu_data = {
         "accelerometer": {
             "x": ax,
@@ -90,47 +131,227 @@ def get_imu_data():
             "y": gy,
             "z": gz
         },
-        "status": currentstate
+        "motion": dict(zip(("x", "y", "z", "roll", "pitch"), motion_ring.latest()[2].tolist())),
+        "seq": seq,
+        "timestamp": timestamp,
+        "status": currentstate,
+        "source": imu_source.name if imu_source is not None else None,
+        "dropped": imu_source.dropped if imu_source is not None else 0,
+        "linear_acceleration": imu_source.linear_ring.latest()[2].tolist() if imu_source is not None and "linear_acceleration" in imu_source.capabilities else None,
+        "latency_ms": round(sample_latency * 1000, 3)
     }
     return jsonify(imu_data)
 
+def publish_calibration(state, **extra):
+    """
+    Replaces calibration_report and wakes everyone long polling /calibration_status.
+    """
+    global calibration_report, calibration_published
+    report = {"state": state}
+    if calibrator is not None:
+        error = calibrator.standard_error
+        report.update({
+            "progress": round(1.0 if state == "done" else calibrator.progress, 3),
+            "still_samples": calibrator.stats.count,
+            "rejected": calibrator.rejected,
+            "residual_variance": calibrator.stats.variance.round(2).tolist(),
+            "standard_error": [round(float(e), 3) if np.isfinite(e) else None for e in error],
+            "tolerance": calibrator.tolerance.tolist(),
+            "elapsed": round(time.monotonic() - (calibration_deadline - CALIBRATION_TIMEOUT), 2),
+        })
+    report.update(extra)
+    # Flask threads and the event loop both publish, the version is bumped under the lock
+    with calibration_changed:
+        report["version"] = calibration_report["version"] + 1
+        calibration_report = report
+        calibration_changed.notify_all()
+        calibration_published = time.monotonic()
+
+def calibration_status():
+    return dict(calibration_report, calibrated=config.current.calibration is not None)
+
+@app.route('/calibration_status', methods=['GET'])
+def get_calibration_status():
+    """
+    Long poll: with ?after=<version> the answer waits (up to ?timeout= seconds, default 10)
+    until there is a newer report than that version.
+    """
+    after = request.args.get("after", type=int)
+    timeout = min(request.args.get("timeout", 10.0, type=float), 30.0)
+    if after is not None:
+        with calibration_changed:
+            calibration_changed.wait_for(lambda: calibration_report["version"] > after, timeout)
+    return jsonify(calibration_status())
+
+def quantile_ms(histogram, q):
+    value = histogram.quantile(q)
+    return value * 1000 if value is not None else None
+
+@app.route('/summary', methods=['GET'])
+def get_summary():
+    """
+    Everything the settings window shows, in one request: state, source, rate, calibration and health.
+    """
+    seq, timestamp, sample = imu_ring.latest()
+    age = time.monotonic() - timestamp if seq >= 0 else None
+    first_seq, end_seq, times, data = imu_ring.last_seconds(1.0)
+    span = times[-1] - times[0] if len(times) > 1 else 0.0
+    # Nothing new for a second means nothing is coming in, not the rate of the last burst
+    rate = (len(times) - 1) / span if span > 0 and age is not None and age < 1.0 else 0.0
+    source = None
+    if imu_source is not None:
+        nominal = imu_source.nominal_rate
+        source = {
+            "name": imu_source.name,
+            "open": imu_source.is_open,
+            "capabilities": sorted(imu_source.capabilities),
+            "nominal_rate": nominal if math.isfinite(nominal) else None,
+        }
+    return jsonify({
+        "status": currentstate,
+        "imu_type": config.current.imu_type,
+        "source": source,
+        "sample_rate": round(rate, 1),
+        "sample_age_ms": round(age * 1000, 1) if age is not None else None,
+        "calibration": calibration_status(),
+        "health": {
+            "connected": currentstate in ("READY", "RUNNING"),
+            "samples": samples_total.get(),
+            "malformed": imu_source.malformed if imu_source is not None else 0,
+            "dropped": imu_source.dropped if imu_source is not None else 0,
+            "stream_dropped": imustream.dropped_total,
+            "reconnects": reconnects_total.get(),
+            "crashes": crashamount,
+            "latency_ms_p50": quantile_ms(sample_latency_seconds, 0.5),
+            "latency_ms_p99": quantile_ms(sample_latency_seconds, 0.99),
+        },
+        "overlays": len(overlays),
+    })
+
+@app.route('/imu_stream', methods=['GET'])
+def imu_stream():
+    """
+    Pushes batches of raw samples to the client, see imustream.py for the options.
+    """
+    return imustream.stream_response(imu_ring)
+
+@app.route('/motion_stream', methods=['GET'])
+def motion_stream():
+    """
+    Same as /imu_stream for the filtered motion (x, y, z, roll, pitch).
+    """
+    return imustream.stream_response(motion_ring)
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Prometheus text format.
+    """
+    return Response(metrics.REGISTRY.prometheus(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/metrics.json', methods=['GET'])
+def get_metrics_json():
+    return jsonify(metrics.REGISTRY.snapshot())
 
 @app.route('/status', methods=['GET'])
 def get_status():
-    global currentstate
     return jsonify({"status": currentstate})
 
 @app.route('/refreshconfig', methods=['POST'])
 def refresh_config():
-    checkconfig()
+    # Not needed anymore, config_task notices changes to config.json by itself. Kept for old GUIs
+    config.reload_if_changed()
     return jsonify({"status": "Config Refreshed"})
 
 @app.route('/start_calibration', methods=['POST'])
 def start_calibration():
-    global capture_stablization
+    global capture_stablization, finish_stablization, calibrator, calibration_deadline
+    if imu_source is None or currentstate not in ("READY", "RUNNING"):
+        return jsonify({"status": "Rejected", "reason": "No IMU data"}), 409
+    if "calibration" not in imu_source.capabilities:
+        return jsonify({"status": "Rejected", "reason": f"{imu_source.name} doesn't need calibration"}), 409
+    first_seq, end_seq, times, samples = imu_ring.last_seconds(CALIBRATION_STILL_WINDOW)
+    if not calibration.looks_still(samples):
+        return jsonify({"status": "Rejected", "reason": "The device is moving, keep it still and try again"}), 409
+    calibrator = calibration.Calibrator()
+    calibration_deadline = time.monotonic() + CALIBRATION_TIMEOUT
+    finish_stablization = False
     capture_stablization = True
-    return jsonify({"status": "Calibration started"})
+    publish_calibration("running")
+    return jsonify({"status": "Calibration started", "version": calibration_report["version"]})
 
 @app.route('/stop_calibration', methods=['POST'])
 def stop_calibration():
-    global capture_stablization
+    global finish_stablization
+    # The main loop finishes the calibration on its next pass, with what it has so far
     finish_stablization = True
     return jsonify({"status": "Calibration stopped"})
 
+@app.route('/cancel_calibration', methods=['POST'])
+def cancel_calibration():
+    global capture_stablization
+    if capture_stablization:
+        capture_stablization = False
+        publish_calibration("failed", reason="Cancelled")
+    return jsonify({"status": "Calibration cancelled"})
+
+
+@app.route('/overlay_stats', methods=['GET'])
+def get_overlay_stats():
+    # Frame timing of each overlay window
+    return jsonify([dict(overlay.frame_stats(), screen=overlay.screen_name) for overlay in list(overlays)])
 
 # --- Overlay Class Definition ---
 class Overlay(QtWidgets.QWidget):
-    def __init__(self, data_queue, stop_event):
+    # Dot field layout, in logical pixels at 96 dpi, scaled to the screen's dpi
+    dot_radius = 6
+    dot_spacing = 48
+    dot_margin = 24
+    max_offset = 36       # furthest a dot moves from its rest position
+    gain = 0.01           # pixels per raw accel count of linear (gravity free) acceleration
+
+    # Frames only run when there are new samples (schedule_frame(), woken through
+    # CoreBridge) or the dots are easing back to rest, at most once per display
+    # refresh. With nothing going on just the idle timer ticks.
+    idle_interval = 250   # ms
+    stale_after = 0.5     # seconds without samples before the dots go back to rest
+    rest_easing = 0.2     # part of the way back to rest per frame
+
+    def __init__(self, ring, readout_ring=None, stop_event=None, screen=None):
         super().__init__()
-        self.data_queue = data_queue
+        # Shows on the whole of this screen, everything is laid out from its geometry and dpi
+        self.target_screen = screen or QtGui.QGuiApplication.primaryScreen()
+        self.screen_name = screen_label(self.target_screen)
         self.stop_event = stop_event
+        self.ring = ring
+        self.readout_ring = readout_ring  # raw samples for the stats readout
         self.imu_text = "Waiting for IMU data..."
+        self.show_stats = config.current.overlay_stats
+
+        # Motion state
+        self.last_seq = -1
+        self.readout_seq = -1
+        self.last_data = time.monotonic()
+        self.offset = QtCore.QPointF(0, 0)
+
+        # Frame timing, paint durations and the time between frames
+        self.paint_times = collections.deque(maxlen=240)
+        self.frame_intervals = collections.deque(maxlen=240)
+        self.last_paint = None
+        self.last_stats_print = time.monotonic()
+
         self.init_ui()
 
-        # Timer to update the overlay
-        self.timer = QtCore.QTimer(self)
-        self.timer.timeout.connect(self.update_overlay_data)
-        self.timer.start(50)  # Update every 50 milliseconds
+        self.frame_ms = self.frame_interval()
+        self.last_frame = 0.0
+        self.frame_timer = QtCore.QTimer(self)
+        self.frame_timer.setSingleShot(True)
+        self.frame_timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self.frame_timer.timeout.connect(self.update_overlay_data)
+        self.idle_timer = QtCore.QTimer(self)
+        self.idle_timer.timeout.connect(self.idle_tick)
+        self.idle_timer.start(self.idle_interval)
 
     def init_ui(self):
         # Set window flags for a transparent, borderless, always-on-top window
@@ -141,259 +362,547 @@ class Overlay(QtWidgets.QWidget):
             QtCore.Qt.WindowTransparentForInput
         )
         self.setAttribute(QtCore.Qt.WA_TranslucentBackground)
-
-        # Set initial geometry (can be adjusted)
-        self.setGeometry(100, 500, 300, 600) # x, y, width, height
-
-        # Create a QLabel to display the text
-        self.label = QtWidgets.QLabel(self.imu_text, self)
-        self.label.setAlignment(QtCore.Qt.AlignCenter)
-
-        # Set font for better visibility
-        font = QtGui.QFont("Arial", 20, QtGui.QFont.Bold)
-        self.label.setFont(font)
-        self.label.setStyleSheet("color: white;") # White text for contrast
-
-        # Layout to center the label
-        layout = QtWidgets.QVBoxLayout()
-        layout.addWidget(self.label)
-        self.setLayout(layout)
+        # We repaint exactly what changed, don't let Qt clear the whole window first
+        self.setAttribute(QtCore.Qt.WA_OpaquePaintEvent)
+
+        self.readout_font = QtGui.QFont("Arial", 10, QtGui.QFont.Bold)
+        self.place_on_screen()
+        if self.target_screen is not None:
+            self.target_screen.geometryChanged.connect(self.place_on_screen)
+            self.target_screen.logicalDotsPerInchChanged.connect(self.place_on_screen)
+
+    def place_on_screen(self, *args):
+        screen = self.target_screen
+        scale = screen.logicalDotsPerInch() / 96.0 if screen is not None else 1.0
+        # Same physical size and travel on every screen
+        cls = type(self)
+        self.dot_radius = max(2, round(cls.dot_radius * scale))
+        self.dot_spacing = max(8, round(cls.dot_spacing * scale))
+        self.dot_margin = round(cls.dot_margin * scale)
+        self.max_offset = round(cls.max_offset * scale)
+        self.gain = cls.gain * scale
+        self.readout_height = round(40 * scale)
+        self.dot_pixmap = self.render_dot()
+        if screen is not None:
+            self.setGeometry(screen.geometry())
+        else:
+            self.setGeometry(100, 500, 300, 600)
+        self.layout_dots()
+
+    def frame_interval(self):
+        screen = self.screen() if hasattr(self, "screen") else None
+        if screen is None:
+            screen = QtGui.QGuiApplication.primaryScreen()
+        refresh = screen.refreshRate() if screen is not None else 60.0
+        return max(1, int(1000 / (refresh or 60.0)))
+
+    def render_dot(self):
+        # Drawn once, every frame just blits it
+        ratio = self.devicePixelRatioF()
+        size = self.dot_radius * 2 + 2
+        pixmap = QtGui.QPixmap(int(size * ratio), int(size * ratio))
+        pixmap.setDevicePixelRatio(ratio)
+        pixmap.fill(QtCore.Qt.transparent)
+        painter = QtGui.QPainter(pixmap)
+        painter.setRenderHint(QtGui.QPainter.Antialiasing)
+        painter.setPen(QtGui.QPen(QtGui.QColor(0, 0, 0, 160), 1))
+        painter.setBrush(QtGui.QColor(255, 255, 255, 220))
+        painter.drawEllipse(QtCore.QRectF(1, 1, size - 2, size - 2))
+        painter.end()
+        return pixmap
+
+    def layout_dots(self):
+        # Two columns of dots along the left and right edges, like MacMotionCues
+        size = self.dot_radius * 2 + 2
+        self.dot_size = size
+        x_positions = (self.dot_margin, self.width() - self.dot_margin - size)
+        self.dot_positions = [
+            QtCore.QPointF(x, y)
+            for x in x_positions
+            for y in range(self.dot_margin, self.height() - self.dot_margin - size + 1, self.dot_spacing)
+        ]
+        # Bounding box of the whole field at rest, grown by how far the dots can move
+        self.field_rect = QtCore.QRect()
+        for p in self.dot_positions:
+            self.field_rect = self.field_rect.united(QtCore.QRect(int(p.x()), int(p.y()), size, size))
+        self.readout_rect = QtCore.QRect(0, 0, self.width(), self.readout_height)
+
+    def resizeEvent(self, event):
+        self.layout_dots()
+        super().resizeEvent(event)
+
+    def dots_region(self, offset):
+        region = QtGui.QRegion()
+        dx, dy = int(offset.x()), int(offset.y())
+        for p in self.dot_positions:
+            region += QtCore.QRect(int(p.x()) + dx - 1, int(p.y()) + dy - 1, self.dot_size + 2, self.dot_size + 2)
+        return region
+
+    def update_motion(self, now):
+        seq, timestamp, sample = self.ring.latest()
+        if seq == self.last_seq or seq < 0:
+            if now - self.last_data < self.stale_after or self.offset.isNull():
+                return self.offset
+            # Source went quiet, ease the dots back instead of leaving them where they were
+            step = self.offset * self.rest_easing
+            if max(abs(step.x()), abs(step.y())) < 0.5:
+                return QtCore.QPointF(0, 0)  # Steps too small to draw, finish in one go
+            return self.offset - step
+        self.last_seq = seq
+        self.last_data = now
+        display_latency_seconds.observe(now - timestamp)
+        # ring holds motionfilter output, already low passed with gravity removed
+        motion = sample[0:2] * self.gain
+        # Dots move against the acceleration, the way the scenery would
+        dx = float(np.clip(-motion[0], -self.max_offset, self.max_offset))
+        dy = float(np.clip(motion[1], -self.max_offset, self.max_offset))
+        return QtCore.QPointF(dx, dy)
 
     def paintEvent(self, event):
-        # This method is called when the widget needs to be repainted
+        started = time.perf_counter()
         painter = QtGui.QPainter(self)
-        painter.setRenderHint(QtGui.QPainter.Antialiasing)
-
-        # Draw a semi-transparent background rectangle
-        painter.setBrush(QtGui.QColor(0, 0, 0, 0)) # Black with 150 alpha (out of 255)
-        painter.setPen(QtCore.Qt.NoPen)
-        painter.drawRoundedRect(self.rect(), 10, 10) # Rounded corners
-
-        # The QLabel handles drawing the text, so no need to draw text here
+        # The region, not its bounding rect: with dots on both screen edges that's the whole width
+        dirty = event.region()
+        # Clear only the area being repainted
+        painter.setCompositionMode(QtGui.QPainter.CompositionMode_Source)
+        for rect in dirty.rects():
+            painter.fillRect(rect, QtCore.Qt.transparent)
+        painter.setCompositionMode(QtGui.QPainter.CompositionMode_SourceOver)
+
+        for p in self.dot_positions:
+            target = p + self.offset
+            if dirty.intersects(QtCore.QRect(int(target.x()), int(target.y()), self.dot_size, self.dot_size)):
+                painter.drawPixmap(target, self.dot_pixmap)
+
+        if self.show_stats and dirty.intersects(self.readout_rect):
+            painter.setFont(self.readout_font)
+            painter.setPen(QtGui.QColor(255, 255, 255))
+            painter.drawText(self.readout_rect, QtCore.Qt.AlignCenter, f"{self.imu_text}\n{self.stats_text()}")
+        painter.end()
+
+        now = time.perf_counter()
+        self.paint_times.append(now - started)
+        paint_seconds.observe(now - started)
+        if self.last_paint is not None:
+            self.frame_intervals.append(now - self.last_paint)
+        self.last_paint = now
+
+    def frame_stats(self):
+        # Copies first, the API thread reads these while the GUI thread appends
+        paint_times, frame_intervals = list(self.paint_times), list(self.frame_intervals)
+        if not paint_times:
+            return {"fps": 0.0, "paint_ms_avg": 0.0, "paint_ms_max": 0.0}
+        intervals = sum(frame_intervals)
+        return {
+            "fps": len(frame_intervals) / intervals if intervals > 0 else 0.0,
+            "paint_ms_avg": 1000 * sum(paint_times) / len(paint_times),
+            "paint_ms_max": 1000 * max(paint_times),
+        }
+
+    def stats_text(self):
+        stats = self.frame_stats()
+        return f"{stats['fps']:.0f} fps, paint {stats['paint_ms_avg']:.2f}/{stats['paint_ms_max']:.2f} ms"
+
+    def schedule_frame(self):
+        """Runs update_overlay_data soon, but no sooner than one refresh after the last frame."""
+        if self.frame_timer.isActive():
+            return  # Already coming, it will pick up whatever is newest
+        wait = self.last_frame + self.frame_ms / 1000 - time.monotonic()
+        self.frame_timer.start(max(0, int(wait * 1000)))
+
+    def idle_tick(self):
+        if self.stop_event is not None and self.stop_event.is_set():
+            self.close() # Close the overlay if stop event is set
+            return
+        self.frame_ms = self.frame_interval()  # The window may be on another screen now
+        if not self.offset.isNull() and time.monotonic() - self.last_data >= self.stale_after:
+            self.schedule_frame()
+        if self.show_stats:
+            self.update(self.readout_rect)
+            if time.monotonic() - self.last_stats_print > 10:
+                self.last_stats_print = time.monotonic()
+                print(f"Overlay {self.screen_name}: {self.stats_text()}")
+
+    def update_readout(self):
+        seq, timestamp, sample = self.readout_ring.latest()
+        if seq == self.readout_seq or seq < 0:
+            return False
+        self.readout_seq = seq
+        ax, ay, az, gx, gy, gz = (int(v) for v in sample)
+        self.imu_text = (
+            f"Ax: {ax:04d}, Ay: {ay:04d}, Az: {az:04d}\n"
+            f"Gx: {gx:04d}, Gy: {gy:04d}, Gz: {gz:04d}"
+        )
+        return True
 
     def update_overlay_data(self):
-        # Check if new data is available in the queue
-        try:
-            while True:
-                new_text = self.data_queue.get_nowait()
-                self.imu_text = new_text
-        except queue.Empty:
-            pass # No new data
+        now = time.monotonic()
+        self.last_frame = now
+        frames_total.inc()
 
-        self.label.setText(self.imu_text)
-        self.update() # Request a repaint
+        offset = self.update_motion(now)
+        moved = offset - self.offset
+        if abs(moved.x()) >= 0.5 or abs(moved.y()) >= 0.5 or (offset.isNull() and not self.offset.isNull()):
+            # Repaint where the dots were and where they are going
+            dirty = self.dots_region(self.offset) | self.dots_region(offset)
+            self.offset = offset
+            self.update(dirty)
 
-        if self.stop_event.is_set():
-            self.close() # Close the overlay if stop event is set
+        # The readout is formatted here, once per frame at most, never per sample
+        if self.show_stats and self.readout_ring is not None and self.update_readout():
+            self.update(self.readout_rect)
+
+        if not self.offset.isNull() and now - self.last_data >= self.stale_after:
+            self.schedule_frame()  # Still easing back to rest
 
 # --- End Overlay Class Definition ---
 
-def capture_esp32_stablization_offset(ax, ay, az, gx, gy, gz):
-    print("Capturing ESP32 Stablization Offset")
-    print("Not yet implemented")
-    if finish_stablization:
-        capture_stablization = False
-        finish_stablization = False
-
-def phisical_conenction_connect():
-    if currentconfig["IMU_TYPE"] == "ESP32":
-        global s
-        ports = list(serial.tools.list_ports.comports())
-        for p in ports:
-            if "USB" in p.description or "UART" in p.description or "serial" in p.description.lower() or "CP210x" in p.description or "CH340" in p.description:
-                try:
-                    s = serial.Serial(p.device, baud_rate, timeout=1)
-                    return True
-                except serial.SerialException as e:
-                    print(f"Could not open serial port {p.device}: {e}")
-                    return False
-        print("No ESP32 serial port found.")
-        return 
-    elif currentconfig["IMU_TYPE"] == "Phone":
+def capture_esp32_stablization_offset(batch):
+    global capture_stablization, finish_stablization, imu_calibration
+    calibrator.feed(batch)
+    # Done as soon as the estimate converged, or when asked to stop
+    if not (calibrator.converged or finish_stablization or calibrator.moved or time.monotonic() > calibration_deadline):
+        if time.monotonic() - calibration_published > 0.1:
+            publish_calibration("running")
+        return
+    capture_stablization = False
+    finish_stablization = False
+    if calibrator.moved:
+        reason = "The device moved, keep it still during calibration"
+    elif not calibrator.ready:
+        reason = f"Only {calibrator.stats.count} still samples ({calibrator.rejected} while moving)"
+    else:
+        reason = None
+    if reason is not None:
+        print(f"Calibration failed: {reason}")
+        publish_calibration("failed", reason=reason)
+        return
+    imu_calibration = calibrator.result()
+    print(f"Calibration done: bias {imu_calibration.bias.round(1).tolist()}, scale {imu_calibration.scale.round(4).tolist()}")
+    # config.set fsyncs under a file lock, the samples keep flowing while a thread does it
+    task = asyncio.get_running_loop().create_task(save_calibration(imu_calibration, calibrator.converged))
+    calibration_saves.add(task)
+    task.add_done_callback(calibration_saves.discard)
+
+async def save_calibration(result, converged):
+    try:
+        await asyncio.to_thread(config.set, "CALIBRATION", result.to_config())
+    except OSError as e:
+        print(f"Error saving the calibration: {e}")
+        publish_calibration("failed", reason=f"Could not save config.json: {e}")
+        return
+    publish_calibration("done", converged=converged, result=result.to_config())
+
+async def phisical_conenction_connect():
+    global imu_source
+    settings = config.current
+    if imu_source is not None and (imu_source.name != settings.imu_type or not imu_source.matches(settings)):
+        # Source or its settings changed in the config
+        imu_source.close()
+        imu_source = None
+    if imu_source is None:
         try:
-            ws = websocket.create_connection(f"ws://{currentconfig['PHONE_IP']}/sensor/connect?type=android.sensor.accelerometer")
-            data = ws.recv()
-            ws.close()
-            return True
-        except Exception as e:
-            print(f"Error connecting to phone: {e}")
+            imu_source = imusources.create(settings.imu_type, settings)
+        except ValueError as e:
+            print(e)
             return False
+    return await imu_source.open()
 
-def phisical_conenction_update():
-    global ax, ay, az, gx, gy, gz
-    if currentconfig["IMU_TYPE"] == "ESP32" and s is not None:
-        try:
-                line = s.readline().decode('utf-8').strip()
-                if line:
-                    data = line.split('\t')
-                    if len(data) == 6:
-                        try:
-                            ax = int(data[0])
-                            ay = int(data[1])
-                            az = int(data[2])
-                            gx = int(data[3])
-                            gy = int(data[4])
-                            gz = int(data[5])
-                            return True
-                        except ValueError:
-                            print(f"Error parsing data: {line}")
-                    else:
-                        print(f"Received malformed line or incomplete: {line}")
-                        pass
-        except serial.SerialException as e:
-                print(f"Serial communication error: {e}")
-                s.close()
-                return False
+async def phisical_conenction_update():
+    global sample_latency
+    if imu_source is None:
         return False
-    elif currentconfig["IMU_TYPE"] == "Phone":
-        try:
-            #Check if phone imu thread is running
-            global phone_imu_thread
-            if phone_imu_thread is None or not phone_imu_thread.is_alive():
-                print("Starting phone IMU thread")
-                phone_imu_thread = threading.Thread(target=phone_imu_thread_func)
-                phone_imu_thread.daemon = True
-                phone_imu_thread.start()
-            return True
-        except Exception as e:
-            print(f"Error starting or managing phone thread {e}")
-            return False
-
-def phone_imu_thread_func():
-    try:
-        print("Trying to connect to phone")
-        ws = websocket.create_connection(f"ws://{currentconfig['PHONE_IP']}/sensor/connect?type=android.sensor.accelerometer")
-        print("Connected to phone")
-    except Exception as e:
-        print(f"Error connecting to phone: {e}")
-        return
-    ws = websocket.create_connection(f"ws://{currentconfig['PHONE_IP']}/sensor/connect?type=android.sensor.accelerometer")
-    global ax, ay, az, gx, gy, gz
-    try:
-        while (currentconfig["IMU_TYPE"] == "Phone") and (currentstate == "RUNNING" or currentstate == "READY"):
-            data = ws.recv()
-            data = json.loads(data)
-            values = data["values"]
-            ax = int(values[0])
-            ay = int(values[1])
-            az = int(values[2])
-            gx = 0 # There's no point in getting gyro from phone, gyro data from esp32 is just for the funnies
-            gy = 0
-            gz = 0
-    except websocket.WebSocketConnectionClosedException:
-        print("WebSocket connection closed unexpectedly.")
-    except Exception as e:
-        print(f"Error in phone IMU thread: {e}")
-    finally:
-        print("Closing phone IMU thread")
-        ws.close()
-
-def run_gui(data_queue, stop_event):
-    app_qt = QtWidgets.QApplication(sys.argv) # Renamed to avoid conflict with Flask app
-    overlay = Overlay(data_queue, stop_event)
-    overlay.show()
-    sys.exit(app_qt.exec_()) # Use app_qt here
-
-def run_flask_app():
+    times, samples = await imu_source.read_batch(timeout=1.0)
+    if len(samples) == 0:
+        return False
+    imu_ring.push_batch(times, samples)
+    samples_total.inc(len(samples))
+    sample_latency = time.monotonic() - times[-1]
+    sample_latency_seconds.observe(sample_latency)
+    return True
+
+def process_new_samples():
+    global ring_seq
+    # Everything that arrived since the last pass, as views into imu_ring
+    first_seq, ring_seq, batch_times, batch = imu_ring.since(ring_seq)
+
+    # stablization calibration for esp32 IMU, works on the raw samples
+    if capture_stablization:
+        #Check to make sure were using esp32 beause using a phone is fucked :3
+        if "calibration" in imu_source.capabilities:
+            capture_esp32_stablization_offset(batch)
+
+    # Filter stage, the overlay and API read the result from motion_ring
+    if "calibration" in imu_source.capabilities:
+        batch = imu_calibration.apply(batch)
+    linear, gravity, roll, pitch = motion_filter.process(batch_times, batch)
+    motion_ring.push_batch(batch_times, np.column_stack((linear, roll, pitch)))
+
+    # The overlays read the rings themselves, they just need to know there's something new
+    if gui_bridge is not None:
+        gui_bridge.wake()
+
+def release_sources():
+    global imu_source
+    if imu_source is not None:
+        imu_source.close()
+        imu_source = None
+
+# --- Backend tasks ---
+
+async def imu_task():
     """
-    Runs the Flask application.
+    Connection state machine, feeds imu_ring through the filter into motion_ring.
     """
-    app.run(host='0.0.0.0', port=1202, debug=False) # debug=False for production
-
-if __name__ == '__main__':
-    # Load config
-    checkconfig()
-
-    # Start GUI thread
-    gui_thread = threading.Thread(target=run_gui, args=(data_queue, stop_event), daemon=True)
-    gui_thread.start()
-
-    # Start Flask API thread
-    flask_thread = threading.Thread(target=run_flask_app, daemon=True)
-    flask_thread.start()
-
-
+    global currentstate, crashamount, capture_stablization
     while True:
         try:
-            # Check for esp32 connection
-            if not phisical_conenction_connect():
+            # Check for imu connection
+            if not await phisical_conenction_connect():
                 if currentstate != "STANDYBY":
                     currentstate = "STANDYBY"
-
-                #Load dummy data to prevent gui bug
-
-                try: 
-                    ignorevar2 = imu_display_data
-                except:
-                    #give time for backend to start 
-                    time.sleep(1) #TODO: Should be moved to check the thread and wait for it to be fully started.
-                    imu_display_data = (
-                        f"Ax: {0:04d}, Ay: {0:04d}, Az: {0:04d}\n"
-                        f"Gx: {0:04d}, Gy: {0:04d}, Gz: {0:04d}"
-                    )
-                    try:
-                        print(imu_display_data)
-                        data_queue.put_nowait(imu_display_data)
-                    except queue.Full:
-                        pass # Queue is full, skip update for this cycle
-
-                time.sleep(1) # Reduced sleep for quicker connection attempts
-
+                await asyncio.sleep(1) # Wait a bit before looking for the imu again
                 continue
             elif currentstate == "STANDYBY":
                 currentstate = "CONNECTED"
                 print("IMU Connected. Current State: CONNECTED")
+                if motion_filter.sample_rate != filter_rate():
+                    # The cutoff and fusion time constant are in seconds, the coefficients depend on the rate
+                    build_motion_filter()
+                    print(f"Motion filter set up for {motion_filter.sample_rate:g} samples/sec")
 
-            # Verify the connection to esp32 is working
+            # Verify the connection to the imu is working
             if currentstate == "CONNECTED":
-                if phisical_conenction_update():
+                if await phisical_conenction_update():
                     currentstate = "READY"
                     print("IMU Data Flowing. Current State: READY")
+                    process_new_samples()
                 else:
                     print("error update")
+                continue
 
-            # Primary loop handling overlay and feeding esp32 IMU data.
+            # Primary loop handling overlay and feeding IMU data.
             if currentstate == "READY" or currentstate == "RUNNING":
-                if phisical_conenction_update():
-                    # stablization calibration for esp32 IMU
-                    if capture_stablization:
-                        #Check to make sure were using esp32 beause using a phone is fucked :3
-                        if currentconfig["IMU_TYPE"] == "ESP32":
-                            capture_esp32_stablization_offset(ax, ay, az, gx, gy, gz)
-                    
-                    imu_display_data = (
-                        f"Ax: {ax:04d}, Ay: {ay:04d}, Az: {az:04d}\n"
-                        f"Gx: {gx:04d}, Gy: {gy:04d}, Gz: {gz:04d}"
-                    )
-                    try:
-                        data_queue.put_nowait(imu_display_data)
-                    except queue.Full:
-                        pass # Queue is full, skip update for this cycle
+                if await phisical_conenction_update():
+                    started = time.perf_counter()
+                    process_new_samples()
+                    loop_seconds.observe(time.perf_counter() - started)
                 else:
+                    reconnects_total.inc()
                     print("Lost IMU data, retrying connection...")
+                    if capture_stablization:
+                        capture_stablization = False
+                        publish_calibration("failed", reason="Lost IMU data")
                     currentstate = "STANDYBY"
 
-            # Check for crash amount (currently not directly related to Flask)
-            if crashamount > 5:
-                print("Too many crashes. Exiting.")
-                stop_event.set() # Signal GUI to close
-                break
-
-        except KeyboardInterrupt:
-            print("\nKeyboardInterrupt detected. Exiting")
-            stop_event.set() # Signal GUI to close
+        except asyncio.CancelledError:
             currentstate = "EXIT"
-            break
+            release_sources()
+            raise
 
         except Exception as e:
             crashamount += 1
             print(f"Error: {e}")
             if crashamount > 5:
                 print("Too many crashes. Exiting.")
-                stop_event.set() # Signal GUI to close
-                break
+                release_sources()
+                return
             print(f"Restarting in 5 seconds to hopefully recover. Crash count: {crashamount}")
-            time.sleep(5) # Shorter sleep for faster recovery attempts
+            await asyncio.sleep(5) # Shorter sleep for faster recovery attempts
+
+async def api_task():
+    """
+    Runs the Flask API, the WSGI server still handles each request on its own thread.
+    """
+    server = make_server('0.0.0.0', 1202, app, threaded=True)
+    print("REST API listening on port 1202")
+    try:
+        await asyncio.to_thread(server.serve_forever)
+    finally:
+        # serve_forever is blocking in a worker thread, shutdown() makes it return
+        server.shutdown()
+        server.server_close()
+
+async def log_task():
+    """
+    Appends incoming samples to LOG_FILE (capturelogs.py text format) once a second, if configured.
+    """
+    log_file = config.current.log_file
+    if not log_file:
+        await asyncio.Event().wait() # Nothing to do, just wait to be cancelled
+    log_seq = imu_ring.seq
+    clock_offset = time.time() - time.monotonic()
+
+    def append(text):
+        with open(log_file, "a") as f:
+            f.write(text)
+
+    await asyncio.to_thread(append, f"START {time.time()}\n")
+    try:
+        while True:
+            await asyncio.sleep(1)
+            first_seq, log_seq, times, data = imu_ring.since(log_seq)
+            lines = "".join(
+                f"Accel(x,y,z): ({int(v[0])}, {int(v[1])}, {int(v[2])})  Gyro(x,y,z): ({int(v[3])}, {int(v[4])}, {int(v[5])}), Time: {t + clock_offset}\n"
+                for t, v in zip(times.tolist(), data.tolist())
+            )
+            if lines:
+                await asyncio.to_thread(append, lines)
+    finally:
+        append(f"END {time.time()}\n")
+
+async def config_task():
+    """
+    Watches config.json (mtime), applies the new settings when it changes.
+    """
+    applied = config.current
+    while True:
+        await asyncio.sleep(0.5)
+        config.reload_if_changed()
+        if config.current is not applied:
+            applied = config.current
+            apply_config()
+            if gui_bridge is not None:
+                gui_bridge.config_changed.emit()
+            print("config.json changed, settings reloaded")
+
+def build_core():
+    core = asynccore.BackendCore()
+    core.add_task("config", config_task)
+    core.add_task("imu", imu_task)
+    core.add_task("api", api_task)
+    core.add_task("log", log_task)
+    return core
+
+# --- Qt side ---
+
+class CoreBridge(QtCore.QObject):
+    """
+    Lets the backend thread tell the Qt event loop to quit or that new samples are in,
+    signals are queued across threads.
+    """
+    backend_stopped = QtCore.pyqtSignal()
+    samples_ready = QtCore.pyqtSignal()
+    config_changed = QtCore.pyqtSignal()
+
+    def __init__(self):
+        super().__init__()
+        self.wake_pending = False
+        self.samples_ready.connect(self.clear_wake)
+
+    def wake(self):
+        # Called by the backend after every batch, keep just one signal in flight
+        if not self.wake_pending:
+            self.wake_pending = True
+            self.samples_ready.emit()
+
+    def clear_wake(self):
+        self.wake_pending = False
+
+def screen_label(screen):
+    if screen is None:
+        return "default"
+    # Some platforms don't name their screens, the index is what OVERLAY_SCREENS takes then
+    return screen.name() or str(QtGui.QGuiApplication.screens().index(screen))
+
+def selected_screens(screens, primary, setting):
+    """
+    Screens picked by OVERLAY_SCREENS: "all", "primary" or a comma separated list of screen names or indexes.
+    """
+    setting = (setting or "all").strip()
+    if setting.lower() == "all":
+        return list(screens)
+    if setting.lower() == "primary":
+        return [primary] if primary is not None else []
+    picked = []
+    for item in setting.split(","):
+        item = item.strip()
+        for index, screen in enumerate(screens):
+            if (item == screen.name() or item == str(index)) and screen not in picked:
+                picked.append(screen)
+    if not picked:
+        print(f"No screen matches OVERLAY_SCREENS {setting!r} (screens: {', '.join(screen_label(s) for s in screens)}), using the primary one")
+        return [primary] if primary is not None else []
+    return picked
+
+class ScreenOverlays(QtCore.QObject):
+    """
+    Keeps one Overlay on every screen OVERLAY_SCREENS picks, as screens come and go or the setting changes.
+    They all draw from the same motion_ring, a screen costs one paint per frame and nothing in the backend.
+    """
+    def __init__(self, app_qt, bridge):
+        super().__init__()
+        self.app_qt = app_qt
+        self.bridge = bridge
+        self.windows = {}  # QScreen -> Overlay
+        app_qt.screenAdded.connect(self.sync)
+        app_qt.screenRemoved.connect(self.screen_removed)
+        bridge.config_changed.connect(self.sync)
+        self.sync()
+
+    def screen_removed(self, screen):
+        if screen in self.windows:
+            self.windows.pop(screen).close()
+        self.sync()
+
+    def sync(self, *args):
+        settings = config.current
+        wanted = selected_screens(self.app_qt.screens(), self.app_qt.primaryScreen(), settings.overlay_screens)
+        for screen in list(self.windows):
+            if screen not in wanted:
+                self.windows.pop(screen).close()
+        for screen in wanted:
+            if screen not in self.windows:
+                overlay = Overlay(motion_ring, imu_ring, stop_event, screen)
+                overlay.setAttribute(QtCore.Qt.WA_DeleteOnClose)
+                self.bridge.samples_ready.connect(overlay.schedule_frame)
+                overlay.show()
+                self.windows[screen] = overlay
+                print(f"Overlay on screen {overlay.screen_name} ({screen.geometry().width()}x{screen.geometry().height()}, {screen.logicalDotsPerInch():.0f} dpi)")
+        for overlay in self.windows.values():
+            overlay.show_stats = settings.overlay_stats
+        overlays[:] = self.windows.values()
+
+def run_gui(core):
+    global gui_bridge
+    app_qt = QtWidgets.QApplication(sys.argv) # Renamed to avoid conflict with Flask app
+    # Windows come and go with the screens, quitting is up to the backend and Ctrl+C
+    app_qt.setQuitOnLastWindowClosed(False)
+
+    bridge = CoreBridge()
+    bridge.backend_stopped.connect(app_qt.quit)
+    # Owned by the bridge, which lives as long as the Qt loop does
+    bridge.screen_overlays = ScreenOverlays(app_qt, bridge)
+    gui_bridge = bridge
+    core.on_shutdown(bridge.backend_stopped.emit)
+    app_qt.aboutToQuit.connect(core.request_stop)
+
+    # Qt blocks python signal handlers, wake up now and then so Ctrl+C works
+    signal.signal(signal.SIGINT, lambda *args: app_qt.quit())
+    wakeup = QtCore.QTimer()
+    wakeup.timeout.connect(lambda: None)
+    wakeup.start(250)
+
+    core.start_in_thread()
+    app_qt.exec_()
+    gui_bridge = None
+    overlays.clear()
+    core.request_stop()
+    core.thread.join()
+
+if __name__ == '__main__':
+    # Load config
+    apply_config()
+
+    core = build_core()
+    if "--headless" in sys.argv:
+        # Backend only, no overlay window
+        try:
+            asyncio.run(core.run())
+        except KeyboardInterrupt:
+            print("\nKeyboardInterrupt detected. Exiting")
+    else:
+        run_gui(core)
 
+    stop_event.set()
     print("Main application shutting down.")
-    sys.exit(0) # Ensure a clean exit for the main thread
\ No newline at end of file
@@ -0,0 +1,174 @@
+#Phone IMU client for the SensorServer android app
+#
+# One long lived websocket subscribed to several sensors at once
+# (/sensors/connect?types=[...]), every message says which sensor it is from:
+#   {"type": "android.sensor.accelerometer", "values": [x, y, z], "timestamp": ns, "accuracy": n}
+# If the connection drops it reconnects with exponential backoff.
+#
+# Phone values are converted to the same units as the ESP32 (MPU6050 raw counts
+# at the default ranges) so the filter, calibration and overlay gain work the
+# same for both. Floats are kept, nothing is rounded.
+# Every accelerometer event publishes one six axis sample to the ring, with the
+# newest gyro reading. Linear acceleration (the phone's own gravity removal) goes
+# to linear_ring.
+#
+# Sensor timestamps are nanoseconds on the phone's clock, they are mapped onto
+# time.monotonic() with the smallest offset seen so far, which keeps the phone's
+# own sample spacing and follows the host clock without network jitter.
+#
+# Usage (prints what arrives):
+#   python phoneclient.py 192.168.1.20:8080
+
+import json
+import math
+import sys
+import threading
+import time
+
+import websocket
+
+import samplering
+
+ACCELEROMETER = "android.sensor.accelerometer"
+GYROSCOPE = "android.sensor.gyroscope"
+LINEAR_ACCELERATION = "android.sensor.linear_acceleration"
+DEFAULT_SENSORS = (ACCELEROMETER, GYROSCOPE, LINEAR_ACCELERATION)
+
+STANDARD_GRAVITY = 9.80665
+ACCEL_COUNTS = 16384.0 / STANDARD_GRAVITY  # m/s^2 to MPU6050 counts at +-2g
+GYRO_COUNTS = 131.0 * 180.0 / math.pi  # rad/s to MPU6050 counts at +-250 deg/s
+
+
+def sensors_url(address, sensors=DEFAULT_SENSORS):
+    return f"ws://{address}/sensors/connect?types={json.dumps(list(sensors), separators=(',', ':'))}"
+
+
+class PhoneClient(threading.Thread):
+    def __init__(self, address, ring=None, sensors=DEFAULT_SENSORS, backoff_min=0.5, backoff_max=30.0, timeout=2.0):
+        super().__init__(daemon=True)
+        self.address = address
+        self.sensors = tuple(sensors)
+        self.ring = ring if ring is not None else samplering.SampleRing()
+        self.linear_ring = samplering.SampleRing(width=3)
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.cond = threading.Condition()
+        self.stop_event = threading.Event()
+        self.ws = None
+        self.connected = False
+        self.running = True
+        self.reconnects = 0
+        self.malformed = 0
+        self.error = None
+        self.gyro = (0.0, 0.0, 0.0)
+        self.clock_offset = None
+
+    def run(self):
+        backoff = self.backoff_min
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    self.ws = websocket.create_connection(sensors_url(self.address, self.sensors), timeout=self.timeout)
+                except Exception as e:
+                    self.error = e
+                    print(f"Error connecting to phone: {e}, retrying in {backoff:.1f} s")
+                    self.stop_event.wait(backoff)
+                    backoff = min(backoff * 2, self.backoff_max)
+                    continue
+                print(f"Connected to phone at {self.address}")
+                backoff = self.backoff_min
+                self.set_connected(True)
+                try:
+                    self.receive()
+                except Exception as e:
+                    if not self.stop_event.is_set():
+                        self.error = e
+                        print(f"Phone connection lost: {e}")
+                finally:
+                    self.set_connected(False)
+                    self.ws.close()
+                if not self.stop_event.is_set():
+                    self.reconnects += 1
+                    # Phone clock may have restarted with the app
+                    self.clock_offset = None
+        finally:
+            with self.cond:
+                self.running = False
+                self.cond.notify_all()
+
+    def receive(self):
+        while not self.stop_event.is_set():
+            try:
+                message = self.ws.recv()
+            except websocket.WebSocketTimeoutException:
+                continue
+            if not message:
+                raise websocket.WebSocketConnectionClosedException("Connection closed by phone")
+            self.handle(message, time.monotonic())
+
+    def handle(self, message, receive_time):
+        try:
+            event = json.loads(message)
+            values = event["values"]
+            x, y, z = float(values[0]), float(values[1]), float(values[2])
+            sensor = event.get("type", ACCELEROMETER)  # single sensor endpoint leaves the type out
+            timestamp = self.sensor_time(event.get("timestamp"), receive_time)
+        except (ValueError, KeyError, IndexError, TypeError):
+            self.malformed += 1
+            return
+        if sensor == GYROSCOPE:
+            self.gyro = (x * GYRO_COUNTS, y * GYRO_COUNTS, z * GYRO_COUNTS)
+        elif sensor == ACCELEROMETER:
+            self.ring.push(timestamp, (x * ACCEL_COUNTS, y * ACCEL_COUNTS, z * ACCEL_COUNTS) + self.gyro)
+            with self.cond:
+                self.cond.notify_all()
+        elif sensor == LINEAR_ACCELERATION:
+            self.linear_ring.push(timestamp, (x * ACCEL_COUNTS, y * ACCEL_COUNTS, z * ACCEL_COUNTS))
+
+    def sensor_time(self, timestamp, receive_time):
+        if timestamp is None:
+            return receive_time
+        sensor_seconds = int(timestamp) * 1e-9
+        offset = receive_time - sensor_seconds
+        if self.clock_offset is None or offset < self.clock_offset:
+            self.clock_offset = offset
+        return sensor_seconds + self.clock_offset
+
+    def set_connected(self, connected):
+        with self.cond:
+            self.connected = connected
+            self.cond.notify_all()
+
+    def wait_for_samples(self, seq, timeout=1.0):
+        """Blocks until the ring has samples from seq on, the connection drops or timeout runs out.
+        Returns (first_seq, end_seq, times, data) like SampleRing.since."""
+        with self.cond:
+            self.cond.wait_for(lambda: self.ring.seq > seq or not self.connected, timeout)
+        return self.ring.since(seq)
+
+    def stop(self):
+        self.stop_event.set()
+        ws = self.ws
+        if ws is not None:
+            try:
+                ws.close()
+            except Exception:
+                pass
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python phoneclient.py <phone ip:port>")
+        sys.exit(1)
+    client = PhoneClient(sys.argv[1])
+    client.start()
+    seq = 0
+    try:
+        while True:
+            first_seq, seq, times, data = client.wait_for_samples(seq, timeout=1.0)
+            if len(times):
+                print(f"{len(times)} samples, latest {[round(v, 1) for v in data[-1].tolist()]}, reconnects {client.reconnects}")
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        client.stop()
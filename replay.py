@@ -0,0 +1,177 @@
+#Virtual IMU that plays back recorded captures (text logs or .mblog) as if they were live
+#
+# speed = 1.0 plays in real time, N plays N times faster and 0 plays as fast as
+# possible, which makes a run through overlay.py a throughput benchmark.
+#
+# A single session (--session N, counted from 1) and/or a time window (--from /
+# --to, seconds from the first sample of the file or of that session) is read
+# through the log's sidecar index (logindex.py), only those bytes are parsed.
+#
+# Usage:
+#   python replay.py example_data/drivelogs.txt [speed] [--session N] [--from S] [--to S]
+
+import bisect
+import sys
+import time
+
+import numpy as np
+
+import imulogs
+
+
+def load_part(path, session=None, window=None):
+    """(times, imu) of one session (index into the log's sessions) and/or a window
+    (start, end) in seconds, read through the log index."""
+    import logindex
+    index = logindex.LogIndex(path)
+    if session is not None and not 0 <= session < len(index.sessions):
+        raise ValueError(f"{path} has {len(index.sessions)} sessions, there is no session {session + 1}")
+    if window is None:
+        part = index.read_session(session)
+        return part.times, part.imu.astype(np.int32)
+    times, imu = index.relative_window(window[0], window[1], session)
+    return times, imu.astype(np.int32)
+
+
+def load_capture(path, session=None, window=None):
+    """Returns (times, imu) for all sessions of a capture, back to back."""
+    if session is not None or window is not None:
+        return load_part(path, session, window)
+    if path.endswith(".mblog"):
+        import binlogs
+        sessions = [(s["time"], s["imu"]) for s in binlogs.load_binary_log(path).sessions()]
+    else:
+        sessions = [(s.times, s.imu) for s in imulogs.load_log(path).sessions]
+    # Sessions are played back to back, the time between captures is skipped
+    times, imu = [], []
+    offset = 0.0
+    for session_times, session_imu in sessions:
+        if len(session_times) == 0:
+            continue
+        session_times = session_times - session_times[0]
+        times.append(session_times + offset)
+        imu.append(session_imu)
+        offset += session_times[-1]
+    if not times:
+        return np.zeros(0), np.zeros((0, 6), dtype=np.int32)
+    return np.concatenate(times).astype(np.float64), np.concatenate(imu).astype(np.int32)
+
+
+class ReplayIMU:
+    def __init__(self, path, speed=1.0, loop=False, session=None, window=None):
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.times, self.imu = load_capture(path, session, window)
+        # Plain python values, indexing numpy arrays per sample is slower than the rest of the pipeline
+        self.times = (self.times - self.times[0]).tolist() if len(self.times) else []
+        self.samples = [tuple(row) for row in self.imu.tolist()]
+        # One pass lasts up to the last sample plus one average interval, the next loop starts then
+        self.period = self.times[-1] * len(self.times) / (len(self.times) - 1) if len(self.times) > 1 else 0.0
+        self.index = 0
+        self.finished = False
+        self.played = 0
+        self.loops = 0
+        self.started = None
+        self.first_started = None
+
+    def restart(self):
+        self.index = 0
+        self.finished = False
+        now = time.monotonic()
+        if self.started is None or self.speed <= 0:
+            self.started = now
+        else:
+            # Looping: the next pass follows on from the recording, not from whenever we noticed
+            self.started += self.period / self.speed
+            self.loops += 1
+        if self.first_started is None:
+            self.first_started = now
+
+    def stamps(self, first, stop):
+        """time.monotonic() time each sample is played at, the recorded spacing scaled by speed.
+        At full speed (0) there is no schedule, the samples are stamped with the time they're taken."""
+        if self.speed <= 0:
+            return [time.monotonic()] * (stop - first)
+        return [self.started + t / self.speed for t in self.times[first:stop]]
+
+    def next_sample(self):
+        """Returns (ax, ay, az, gx, gy, gz), waiting until it is due. None once the capture is over."""
+        if self.started is None:
+            self.restart()
+        if self.index >= len(self.samples):
+            if not self.loop or not self.samples:
+                self.finished = True
+                return None
+            self.restart()
+
+        if self.speed > 0:
+            due = self.started + self.times[self.index] / self.speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        sample = self.samples[self.index]
+        self.index += 1
+        self.played += 1
+        return sample
+
+    def take_due(self, max_count=256):
+        """Non blocking version of next_sample for event loops. Returns (times, samples, wait):
+        the samples due by now (at most max_count) with their stamps (see stamps()) and how
+        long until the next one is due. wait is None once the capture is over."""
+        if self.started is None:
+            self.restart()
+        if self.index >= len(self.samples):
+            if not self.loop or not self.samples:
+                self.finished = True
+                return [], [], None
+            self.restart()
+
+        stop = min(self.index + max_count, len(self.samples))
+        if self.speed > 0:
+            # Everything recorded up to the current replay position is due
+            position = (time.monotonic() - self.started) * self.speed
+            stop = bisect.bisect_right(self.times, position, self.index, stop)
+        times = self.stamps(self.index, stop)
+        samples = self.samples[self.index:stop]
+        self.index = stop
+        self.played += len(samples)
+
+        if self.index >= len(self.samples) or self.speed <= 0:
+            return times, samples, 0.0
+        due = self.started + self.times[self.index] / self.speed
+        return times, samples, max(0.0, due - time.monotonic())
+
+    def stats(self):
+        elapsed = time.monotonic() - self.first_started if self.first_started is not None else 0.0
+        rate = self.played / elapsed if elapsed > 0 else 0.0
+        return {"samples": self.played, "seconds": elapsed, "samples_per_sec": rate}
+
+
+def option(args, flag, cast):
+    if flag not in args:
+        return None
+    index = args.index(flag)
+    value = cast(args[index + 1])
+    del args[index:index + 2]
+    return value
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    session = option(args, "--session", int)
+    start = option(args, "--from", float)
+    end = option(args, "--to", float)
+    if not args:
+        print("Usage: python replay.py <capture> [speed] [--session N] [--from S] [--to S]")
+        sys.exit(1)
+    window = None
+    if start is not None or end is not None:
+        window = (start or 0.0, end if end is not None else float("inf"))
+    replay = ReplayIMU(args[0], float(args[1]) if len(args) > 1 else 0,
+                       session=session - 1 if session else None, window=window)
+    while replay.next_sample() is not None:
+        pass
+    stats = replay.stats()
+    print(f"Replayed {stats['samples']} samples in {stats['seconds']:.3f} s ({stats['samples_per_sec']:.0f} samples/sec)")
@@ -0,0 +1,99 @@
+#Shared ring buffer of timestamped samples (six-axis IMU by default)
+#
+# One thread writes, any number of threads read without taking a lock:
+#   - storage is preallocated and mirrored (every sample is written at i and
+#     i + capacity), so any window of up to capacity samples is one contiguous
+#     slice and readers get NumPy views instead of copies
+#   - seq counts published samples and is only bumped after the row is written,
+#     so a reader never sees a half written sample
+#   - a reader that holds on to a view can check still_valid(first_seq)
+#     afterwards to find out whether the writer has lapped it (seqlock style)
+
+import numpy as np
+
+
+class SampleRing:
+    def __init__(self, capacity=8192, width=6):
+        self.capacity = capacity
+        self.times = np.zeros(capacity * 2)
+        self.data = np.zeros((capacity * 2, width))
+        self.seq = 0  # number of samples ever written, the newest one is seq - 1
+        # Reads stay this far behind the writer so views survive a few more pushes
+        self.headroom = capacity // 4
+
+    # --- writer side ---
+
+    def push(self, timestamp, sample):
+        i = self.seq % self.capacity
+        self.times[i] = self.times[i + self.capacity] = timestamp
+        self.data[i] = self.data[i + self.capacity] = sample
+        self.seq += 1
+
+    def push_batch(self, timestamps, samples):
+        count = len(timestamps)
+        if count == 0:
+            return
+        # Only the last capacity samples survive, they go where they would have landed.
+        # seq is published once, after every row is written
+        end_seq = self.seq + count
+        if count > self.capacity:
+            timestamps, samples = timestamps[-self.capacity:], samples[-self.capacity:]
+            count = self.capacity
+        i = (end_seq - count) % self.capacity
+        first = min(count, self.capacity - i)
+        for offset in (0, self.capacity):
+            self.times[i + offset:i + offset + first] = timestamps[:first]
+            self.data[i + offset:i + offset + first] = samples[:first]
+        if first < count:
+            # Wrapped, the rest starts over at the beginning of both halves
+            rest = count - first
+            for offset in (0, self.capacity):
+                self.times[offset:offset + rest] = timestamps[first:]
+                self.data[offset:offset + rest] = samples[first:]
+        self.seq = end_seq
+
+    # --- reader side ---
+
+    def _window(self, first_seq, end_seq):
+        start = first_seq % self.capacity
+        stop = start + (end_seq - first_seq)
+        return self.times[start:stop], self.data[start:stop]
+
+    def oldest_seq(self, end_seq=None):
+        if end_seq is None:
+            end_seq = self.seq
+        return max(0, end_seq - (self.capacity - self.headroom))
+
+    def latest(self):
+        """Returns (seq, timestamp, sample view) of the newest sample, seq is -1 if empty."""
+        end_seq = self.seq
+        if end_seq == 0:
+            return -1, 0.0, self.data[0]
+        i = (end_seq - 1) % self.capacity
+        return end_seq - 1, self.times[i], self.data[i]
+
+    def since(self, seq):
+        """Returns (first_seq, end_seq, times, data) for the samples from seq up to the newest.
+        Samples already overwritten are skipped, first_seq says where the views really start."""
+        end_seq = self.seq
+        first_seq = min(max(seq, self.oldest_seq(end_seq)), end_seq)
+        times, data = self._window(first_seq, end_seq)
+        return first_seq, end_seq, times, data
+
+    def last_seconds(self, seconds):
+        """Returns (first_seq, end_seq, times, data) for the samples newer than now - seconds,
+        where now is the newest sample's timestamp."""
+        end_seq = self.seq
+        first_seq = self.oldest_seq(end_seq)
+        times, data = self._window(first_seq, end_seq)
+        if len(times) == 0:
+            return first_seq, end_seq, times, data
+        cut = int(np.searchsorted(times, times[-1] - seconds, side="right"))
+        return first_seq + cut, end_seq, times[cut:], data[cut:]
+
+    def still_valid(self, first_seq):
+        """True if the samples from first_seq on have not been overwritten since they were read."""
+        return self.seq - first_seq <= self.capacity
+
+    def __len__(self):
+        return min(self.seq, self.capacity)
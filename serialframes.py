@@ -0,0 +1,161 @@
+#Binary framed serial protocol for the ESP32 (esp32.ino with BINARY_FRAMES defined)
+#
+# Frame, 22 bytes little endian:
+#   sync    0xA5 0x5A
+#   seq     uint16, +1 per sample, wraps
+#   micros  uint32, device micros() when the sample was read, wraps every ~71 min
+#   imu     6 x int16, ax ay az gx gy gz raw counts
+#   crc     uint16, CRC-16/CCITT-FALSE over seq, micros and imu (binascii.crc_hqx(data, 0xFFFF))
+#
+# FrameDecoder works on whatever bytes the port returned: sync candidates are
+# found with NumPy, their CRCs are checked all at once with a table driven CRC
+# over the byte columns and the good frames are unpacked with frombuffer. Text
+# the firmware prints at boot and corrupted frames are skipped, the decoder
+# resyncs on the next good frame. Gaps in seq are counted as dropped samples.
+#
+# Usage:
+#   python serialframes.py bench [frames]
+
+import struct
+import sys
+import time
+
+import numpy as np
+
+BAUD_RATE = 921600
+SYNC = b"\xa5\x5a"
+FRAME = struct.Struct("<2sHI6hH")
+FRAME_SIZE = FRAME.size  # 22
+FRAME_DTYPE = np.dtype([("sync", "<u2"), ("seq", "<u2"), ("micros", "<u4"), ("imu", "<i2", (6,)), ("crc", "<u2")])
+CRC_START, CRC_END = 2, FRAME_SIZE - 2  # bytes covered by the crc
+
+
+def _crc_table():
+    table = np.zeros(256, dtype=np.uint16)
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else crc << 1
+        table[byte] = crc & 0xFFFF
+    return table
+
+
+CRC_TABLE = _crc_table()
+
+
+def crc16(columns):
+    """CRC-16/CCITT-FALSE of every row of a (n, length) uint8 array, same as binascii.crc_hqx(row, 0xFFFF)."""
+    crc = np.full(len(columns), 0xFFFF, dtype=np.uint16)
+    for i in range(columns.shape[1]):
+        crc = (crc << 8) ^ CRC_TABLE[(crc >> 8) ^ columns[:, i]]
+    return crc
+
+
+def encode_frame(seq, micros, imu):
+    """Packs one frame, what the firmware sends. Used by the fake device."""
+    import binascii
+    body = FRAME.pack(SYNC, seq & 0xFFFF, micros & 0xFFFFFFFF, *imu, 0)[CRC_START:CRC_END]
+    return SYNC + body + struct.pack("<H", binascii.crc_hqx(body, 0xFFFF))
+
+
+class FrameDecoder:
+    def __init__(self):
+        self.pending = b""
+        self.last_seq = None
+        self.last_micros = None
+        self.micros_wraps = 0
+        self.clock_offset = None
+        self.frames = 0
+        self.dropped = 0
+        self.crc_errors = 0
+        self.skipped_bytes = 0
+
+    @property
+    def malformed(self):
+        return self.crc_errors
+
+    def feed(self, data, read_time):
+        """Decodes newly read bytes. Returns (times, imu) of the complete frames, times are
+        device timestamps mapped onto the clock of read_time (the time the bytes were read)."""
+        buffer = self.pending + data
+        raw = np.frombuffer(buffer, dtype=np.uint8)
+        candidates = np.flatnonzero((raw[:-1] == 0xA5) & (raw[1:] == 0x5A))
+        candidates = candidates[candidates + FRAME_SIZE <= len(raw)]
+
+        good = candidates[:0]
+        if len(candidates):
+            windows = raw[candidates[:, None] + np.arange(FRAME_SIZE)]
+            expected = windows[:, CRC_END].astype(np.uint16) | (windows[:, CRC_END + 1].astype(np.uint16) << 8)
+            ok = crc16(windows[:, CRC_START:CRC_END]) == expected
+            good = candidates[ok]
+            if len(good) > 1 and (np.diff(good) < FRAME_SIZE).any():
+                # A sync pattern inside a good frame happened to pass the crc, keep the first frame
+                kept, end = [], -1
+                for position in good.tolist():
+                    if position >= end:
+                        kept.append(position)
+                        end = position + FRAME_SIZE
+                good = np.array(kept)
+            bad = candidates[~ok]
+            if len(bad):
+                # Sync patterns inside good frames are just payload, not errors
+                inside = np.searchsorted(good, bad, side="right") - 1
+                covered = (inside >= 0) & (bad < good[np.maximum(inside, 0)] + FRAME_SIZE)
+                self.crc_errors += int((~covered).sum())
+
+        # Keep only what could still become a frame
+        end = int(good[-1]) + FRAME_SIZE if len(good) else 0
+        keep_from = max(end, len(buffer) - (FRAME_SIZE - 1))
+        self.skipped_bytes += keep_from - FRAME_SIZE * len(good)
+        self.pending = buffer[keep_from:]
+
+        if len(good) == 0:
+            return np.zeros(0), np.zeros((0, 6), dtype=np.int16)
+        if (np.diff(good) == FRAME_SIZE).all():
+            frames = np.frombuffer(buffer, dtype=FRAME_DTYPE, count=len(good), offset=int(good[0]))
+        else:
+            frames = np.frombuffer(b"".join(buffer[p:p + FRAME_SIZE] for p in good.tolist()), dtype=FRAME_DTYPE)
+        self.frames += len(frames)
+        return self.timestamps(frames, read_time), frames["imu"]
+
+    def timestamps(self, frames, read_time):
+        seq = frames["seq"].astype(np.int64)
+        previous = np.concatenate(([seq[0] - 1 if self.last_seq is None else self.last_seq], seq[:-1]))
+        self.dropped += int(((seq - previous - 1) % 65536).sum())
+        self.last_seq = int(seq[-1])
+
+        micros = frames["micros"].astype(np.int64)
+        previous = np.concatenate(([micros[0] if self.last_micros is None else self.last_micros], micros[:-1]))
+        wraps = self.micros_wraps + np.cumsum(micros < previous)
+        self.micros_wraps = int(wraps[-1])
+        self.last_micros = int(micros[-1])
+        device_times = (micros + (wraps << 32)) * 1e-6
+
+        # The newest frame can't have arrived before read_time, the smallest offset is the least delayed one
+        offset = read_time - device_times[-1]
+        if self.clock_offset is None or offset < self.clock_offset:
+            self.clock_offset = offset
+        return device_times + self.clock_offset
+
+
+def benchmark(frames=200000, chunk=4096):
+    import random
+    data = b"".join(encode_frame(i, i * 1000, [random.randint(-32768, 32767) for _ in range(6)]) for i in range(frames))
+    # Some noise like the boot messages and a corrupted frame
+    data = b"Initializing MPU...\r\n" + data[:1000] + b"\xa5\x5a garbage" + data[1000:]
+    decoder = FrameDecoder()
+    started = time.perf_counter()
+    decoded = 0
+    for i in range(0, len(data), chunk):
+        times, imu = decoder.feed(data[i:i + chunk], time.monotonic())
+        decoded += len(imu)
+    elapsed = time.perf_counter() - started
+    print(f"{decoded} frames in {elapsed:.3f} s ({decoded / elapsed:.0f} frames/sec, {chunk} byte reads)")
+    print(f"dropped {decoder.dropped}, crc errors {decoder.crc_errors}, skipped bytes {decoder.skipped_bytes}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "bench":
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 200000)
+    else:
+        print("Usage: python serialframes.py bench [frames]")
@@ -0,0 +1,170 @@
+#ESP32 serial readers
+#
+# Opens the port once and blocks in read() (pyserial waits in select() on posix)
+# until bytes arrive, then grabs everything waiting in one go and splits lines
+# incrementally. Parsed samples go into a samplering.SampleRing that any number
+# of consumers can read by sequence number, so a slow consumer just misses old
+# samples instead of holding up the reader.
+#
+# protocol "text" is the firmware's tab separated lines, "binary" the framed
+# protocol from serialframes.py (esp32.ino built with BINARY_FRAMES).
+
+import asyncio
+import threading
+import time
+
+import serial
+
+import samplering
+import serialframes
+
+
+def split_samples(pending, data):
+    """Splits newly read bytes into tab separated six value samples.
+    Returns (leftover partial line, samples, number of malformed lines)."""
+    lines = (pending + data).split(b"\n")
+    pending = lines.pop()
+    samples = []
+    malformed = 0
+    for line in lines:
+        values = line.split(b"\t")
+        if len(values) != 6:
+            if line.strip():
+                malformed += 1
+            continue
+        try:
+            samples.append(tuple(int(v) for v in values))
+        except ValueError:
+            malformed += 1
+    return pending, samples, malformed
+
+
+class TextDecoder:
+    """Same interface as serialframes.FrameDecoder for the tab separated text protocol."""
+
+    def __init__(self):
+        self.pending = b""
+        self.malformed = 0
+        self.dropped = 0  # the text protocol has no sequence numbers
+
+    def feed(self, data, read_time):
+        self.pending, samples, malformed = split_samples(self.pending, data)
+        self.malformed += malformed
+        # Samples are stamped with the monotonic time of the read that completed them
+        return [read_time] * len(samples), samples
+
+
+def make_decoder(protocol):
+    if protocol == "binary":
+        return serialframes.FrameDecoder()
+    if protocol != "text":
+        print(f"Unknown serial protocol {protocol}, using text")
+    return TextDecoder()
+
+
+class SerialReader(threading.Thread):
+    def __init__(self, port, baud_rate, ring=None, read_timeout=0.5, protocol="text"):
+        super().__init__(daemon=True)
+        self.port = port
+        self.serial = serial.Serial(port, baud_rate, timeout=read_timeout)
+        self.ring = ring if ring is not None else samplering.SampleRing()
+        self.decoder = make_decoder(protocol)
+        self.cond = threading.Condition()
+        self.stop_event = threading.Event()
+        self.error = None
+        self.running = True
+
+    @property
+    def malformed(self):
+        return self.decoder.malformed
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set():
+                data = self.serial.read(max(1, self.serial.in_waiting))
+                if not data:
+                    continue
+                times, samples = self.decoder.feed(data, time.monotonic())
+                if len(samples):
+                    self.publish(times, samples)
+        except (serial.SerialException, OSError) as e:
+            print(f"Serial communication error: {e}")
+            self.error = e
+        finally:
+            self.serial.close()
+            with self.cond:
+                self.running = False
+                self.cond.notify_all()
+
+    def publish(self, times, samples):
+        self.ring.push_batch(times, samples)
+        with self.cond:
+            self.cond.notify_all()
+
+    def wait_for_samples(self, seq, timeout=1.0):
+        """Blocks until the ring has samples from seq on, the reader stops or timeout runs out.
+        Returns (first_seq, end_seq, times, data) like SampleRing.since."""
+        with self.cond:
+            self.cond.wait_for(lambda: self.ring.seq > seq or not self.running, timeout)
+        return self.ring.since(seq)
+
+    def stop(self):
+        self.stop_event.set()
+
+
+class AsyncSerialReader:
+    """Event loop version of SerialReader for posix: the port is non blocking and
+    read from a loop.add_reader callback, so no thread is needed at all."""
+
+    def __init__(self, port, baud_rate, ring=None, protocol="text"):
+        self.port = port
+        self.serial = serial.Serial(port, baud_rate, timeout=0)
+        self.ring = ring if ring is not None else samplering.SampleRing()
+        self.decoder = make_decoder(protocol)
+        self.error = None
+        self.running = False
+        self.loop = None
+        self.data_event = None
+
+    @property
+    def malformed(self):
+        return self.decoder.malformed
+
+    def start(self, loop):
+        self.loop = loop
+        self.data_event = asyncio.Event()
+        self.running = True
+        loop.add_reader(self.serial.fileno(), self.on_readable)
+
+    def on_readable(self):
+        try:
+            data = self.serial.read(max(1, self.serial.in_waiting))
+        except (serial.SerialException, OSError) as e:
+            print(f"Serial communication error: {e}")
+            self.error = e
+            self.stop()
+            return
+        if not data:
+            return
+        times, samples = self.decoder.feed(data, time.monotonic())
+        if len(samples):
+            self.ring.push_batch(times, samples)
+            self.data_event.set()
+
+    async def wait_for_samples(self, seq, timeout=1.0):
+        """Waits until the ring has samples from seq on, the reader stops or timeout runs out.
+        Returns (first_seq, end_seq, times, data) like SampleRing.since."""
+        if self.ring.seq <= seq and self.running:
+            self.data_event.clear()
+            try:
+                await asyncio.wait_for(self.data_event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.ring.since(seq)
+
+    def stop(self):
+        if self.running:
+            self.running = False
+            self.loop.remove_reader(self.serial.fileno())
+            self.serial.close()
+            self.data_event.set()
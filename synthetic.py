@@ -0,0 +1,173 @@
+#Synthetic IMU data, for benchmarks and for running everything without hardware
+#
+# A Profile describes the motion:
+#   events      smooth (raised cosine) pulses of acceleration and rotation, e.g.
+#               accelerate(), brake(), turn(), bump(), repeated every `period` seconds
+#   vibration   (frequency Hz, amplitude g) sine components, a road/engine spectrum
+#   noise       white sensor noise, accel in g and gyro in deg/s
+#   tilt        roll and pitch of the mounting in degrees, sets where gravity points
+#   dropouts    probability per sample of losing it (the rest keep their timestamps)
+#
+# SyntheticIMU generates any number of samples at any rate from a profile, in
+# MPU6050 counts, deterministic for a given seed. truth() gives the linear
+# acceleration that went in, so filters can be checked against it.
+#
+# Usage:
+#   python synthetic.py <profile> <seconds> [rate] [out.txt | out.mblog]
+
+import math
+import sys
+
+import numpy as np
+
+ACCEL_COUNTS_PER_G = 16384.0
+GYRO_COUNTS_PER_DPS = 131.0
+
+
+class Event:
+    def __init__(self, start, duration, accel_g=(0, 0, 0), gyro_dps=(0, 0, 0)):
+        self.start = start
+        self.duration = duration
+        self.peak = np.array(
+            [a * ACCEL_COUNTS_PER_G for a in accel_g] + [g * GYRO_COUNTS_PER_DPS for g in gyro_dps]
+        )
+
+    def shape(self, t):
+        """Raised cosine window, 0 outside the event and 1 at its middle."""
+        phase = (t - self.start) / self.duration
+        inside = (phase >= 0) & (phase < 1)
+        return np.where(inside, 0.5 - 0.5 * np.cos(2 * np.pi * phase), 0.0)
+
+
+def accelerate(start, duration, g=0.3):
+    return Event(start, duration, accel_g=(g, 0, 0))
+
+
+def brake(start, duration, g=0.5):
+    return Event(start, duration, accel_g=(-g, 0, 0))
+
+
+def turn(start, duration, lateral_g=0.3, yaw_dps=20.0):
+    """Positive is a left turn: pushed right (+y accel felt to the left) while yawing left."""
+    return Event(start, duration, accel_g=(0, lateral_g, 0), gyro_dps=(0, 0, yaw_dps))
+
+
+def bump(start, duration=0.15, g=0.8, pitch_dps=30.0):
+    return Event(start, duration, accel_g=(0, 0, g), gyro_dps=(0, pitch_dps, 0))
+
+
+class Profile:
+    def __init__(self, events=(), period=None, vibration=(), accel_noise=0.003, gyro_noise=0.05,
+                 tilt=(0.0, 0.0), dropouts=0.0):
+        self.events = list(events)
+        self.period = period
+        self.vibration = list(vibration)
+        self.accel_noise = accel_noise
+        self.gyro_noise = gyro_noise
+        self.tilt = tilt
+        self.dropouts = dropouts
+
+
+PROFILES = {
+    # At rest, for calibration
+    "still": lambda: Profile(),
+    # A minute of city driving on a loop
+    "drive": lambda: Profile(
+        events=[
+            accelerate(2, 6, 0.25),
+            turn(12, 5, 0.3, 25),
+            bump(20, 0.15, 0.6),
+            brake(24, 4, 0.4),
+            accelerate(32, 5, 0.3),
+            turn(40, 6, -0.35, -30),
+            bump(47, 0.2, 0.5),
+            brake(52, 5, 0.5),
+        ],
+        period=60.0,
+        vibration=[(11.0, 0.02), (23.0, 0.01), (47.0, 0.005)],
+        tilt=(3.0, -2.0),
+    ),
+    # Idling engine on a bad mount
+    "vibration": lambda: Profile(vibration=[(25.0, 0.08), (50.0, 0.05), (75.0, 0.02), (3.5, 0.01)]),
+    # Lossy link, for the dropout handling
+    "lossy": lambda: Profile(
+        events=[turn(1, 3, 0.2, 15), brake(5, 2, 0.3)],
+        period=8.0,
+        dropouts=0.05,
+    ),
+}
+
+
+class SyntheticIMU:
+    def __init__(self, profile="drive", rate=100.0, seed=0):
+        self.profile = PROFILES[profile]() if isinstance(profile, str) else profile
+        self.rate = float(rate)
+        self.index = 0
+        self.rng = np.random.default_rng(seed)
+        self.phases = self.rng.uniform(0, 2 * math.pi, size=(len(self.profile.vibration), 3))
+        roll, pitch = (math.radians(a) for a in self.profile.tilt)
+        self.gravity = ACCEL_COUNTS_PER_G * np.array(
+            [-math.sin(pitch), math.sin(roll) * math.cos(pitch), math.cos(roll) * math.cos(pitch)]
+        )
+
+    def truth(self, t):
+        """Motion without gravity or noise at times t: (n, 6) linear accel and rotation, counts."""
+        t = np.asarray(t, dtype=np.float64)
+        local = t % self.profile.period if self.profile.period else t
+        motion = np.zeros((len(t), 6))
+        for event in self.profile.events:
+            motion += event.shape(local)[:, None] * event.peak
+        for (frequency, amplitude), phases in zip(self.profile.vibration, self.phases):
+            motion[:, 0:3] += amplitude * ACCEL_COUNTS_PER_G * np.sin(2 * np.pi * frequency * t[:, None] + phases)
+        return motion
+
+    def generate(self, count):
+        """Next count samples: (times, imu) with dropped samples left out."""
+        t = (self.index + np.arange(count)) / self.rate
+        self.index += count
+        imu = self.truth(t)
+        imu[:, 0:3] += self.gravity
+        imu[:, 0:3] += self.rng.normal(0, self.profile.accel_noise * ACCEL_COUNTS_PER_G, size=(count, 3))
+        imu[:, 3:6] += self.rng.normal(0, self.profile.gyro_noise * GYRO_COUNTS_PER_DPS, size=(count, 3))
+        np.clip(imu, -32768, 32767, out=imu)
+        if self.profile.dropouts > 0:
+            keep = self.rng.random(count) >= self.profile.dropouts
+            t, imu = t[keep], imu[keep]
+        return t, imu
+
+    def seconds(self, seconds):
+        return self.generate(int(seconds * self.rate))
+
+
+def write_capture(path, times, imu, start=0.0):
+    """Saves generated samples as a capture (text like capturelogs.py, or .mblog)."""
+    imu = np.rint(imu).astype(np.int64)
+    times = start + times
+    if path.endswith(".mblog"):
+        import binlogs
+        writer = binlogs.BinaryLogWriter(path)
+        writer.marker(binlogs.START, float(times[0]) if len(times) else start)
+        writer.write_samples(tuple(row) + (t,) for row, t in zip(imu.tolist(), times.tolist()))
+        writer.marker(binlogs.END, float(times[-1]) if len(times) else start)
+        writer.close()
+        return
+    with open(path, "w") as f:
+        f.write(f"START {times[0] if len(times) else start}\n")
+        f.write("".join(
+            f"Accel(x,y,z): ({v[0]}, {v[1]}, {v[2]})  Gyro(x,y,z): ({v[3]}, {v[4]}, {v[5]}), Time: {t}\n"
+            for v, t in zip(imu.tolist(), times.tolist())
+        ))
+        f.write(f"END {times[-1] if len(times) else start}\n")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in PROFILES:
+        print(f"Usage: python synthetic.py <{'|'.join(PROFILES)}> <seconds> [rate] [out.txt | out.mblog]")
+        sys.exit(1)
+    rate = float(sys.argv[3]) if len(sys.argv) > 3 else 100.0
+    times, imu = SyntheticIMU(sys.argv[1], rate).seconds(float(sys.argv[2]))
+    if len(sys.argv) > 4:
+        write_capture(sys.argv[4], times, imu, start=1.7e9)
+        print(f"Wrote {len(times)} samples to {sys.argv[4]}")
+    else:
+        print(f"{len(times)} samples, mean {imu.mean(axis=0).round(1).tolist()}, std {imu.std(axis=0).round(1).tolist()}")
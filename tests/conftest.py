@@ -0,0 +1,7 @@
+#The modules live at the top of the repo, not in a package
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXAMPLE_DATA = os.path.join(ROOT, "example_data")
+sys.path.insert(0, ROOT)
@@ -0,0 +1,30 @@
+import os
+
+import pytest
+
+from conftest import EXAMPLE_DATA
+
+import analyzelogs
+import binlogs
+
+
+@pytest.fixture(params=["txt", "mblog"])
+def log_with_empty_sessions(request, tmp_path):
+    with open(os.path.join(EXAMPLE_DATA, "desklogs.txt")) as f:
+        lines = [line for line in f.read().splitlines() if not line.startswith("#")]
+    path = tmp_path / "gaps.txt"
+    path.write_text("\n".join(["START 100.0", "END 100.5"] + lines) + "\n")
+    if request.param == "mblog":
+        binlogs.convert_text_log(str(path), str(tmp_path / "gaps.mblog"))
+        return str(tmp_path / "gaps.mblog")
+    return str(path)
+
+
+def test_empty_sessions_keep_their_number(log_with_empty_sessions):
+    path = log_with_empty_sessions
+    sessions = analyzelogs.analyze([path], jobs=1)[path]
+    assert [s["session"] for s in sessions] == [1, 2, 3, 4]
+    assert [s["samples"] for s in sessions] == [0, 44, 0, 21]
+
+    only = analyzelogs.analyze([path], jobs=1, session=3)[path]
+    assert [(s["session"], s["samples"]) for s in only] == [(4, 21)]
@@ -0,0 +1,97 @@
+import os
+
+import numpy as np
+import pytest
+
+from conftest import EXAMPLE_DATA
+
+import calibration
+import imulogs
+
+CALIBRATION_TIMEOUT = 30.0  # overlay.py gives up after this long
+
+
+@pytest.fixture(scope="module")
+def desk():
+    return imulogs.load_log(os.path.join(EXAMPLE_DATA, "desklogs.txt")).sessions
+
+
+def desk_noise(desk, seconds, rate=120.0, seed=0):
+    """Samples drawn from the resting desk session, as if the board sat still for seconds."""
+    still = desk[2].imu
+    rng = np.random.default_rng(seed)
+    return still[rng.integers(0, len(still), int(seconds * rate))]
+
+
+def test_desk_noise_converges_well_before_the_timeout(desk):
+    rate = 120.0
+    calibrator = calibration.Calibrator()
+    seconds = 0
+    progress = []
+    while not calibrator.converged and seconds < CALIBRATION_TIMEOUT:
+        calibrator.feed(desk_noise(desk, 1, rate, seed=seconds))
+        progress.append(calibrator.progress)
+        seconds += 1
+    assert calibrator.converged
+    assert seconds <= CALIBRATION_TIMEOUT / 3
+    assert not calibrator.moved
+    # Progress moves along instead of sitting near zero and jumping
+    assert progress[len(progress) // 2] > 0.3
+    assert np.all(np.diff(progress) >= -0.1)
+
+
+def test_still_desk_segments_are_accepted(desk):
+    resting, moved = desk[2].imu, desk[0].imu
+    assert calibration.looks_still(resting)
+    assert calibration.looks_still(moved[:6])  # before it was picked up
+    assert not calibration.looks_still(moved[6:16])
+
+    detector = calibration.StillnessDetector()
+    still = detector.update(resting)
+    # Everything after the warmup counts
+    assert still[detector.warmup:].all()
+    assert not calibration.StillnessDetector().update(moved).any()
+
+
+def test_driving_is_rejected():
+    drive = imulogs.load_log(os.path.join(EXAMPLE_DATA, "drivelogs.txt")).sessions[0].imu
+    assert not calibration.looks_still(drive[:100])
+    calibrator = calibration.Calibrator()
+    calibrator.feed(drive[:3000])
+    assert calibrator.moved
+    assert not calibrator.converged
+    assert calibrator.rejected > 0.9 * 3000
+
+
+def test_calibrator_finds_the_offset(desk):
+    noise = desk_noise(desk, 10)
+    offset = np.array([0, 0, 0, 40, -25, 12])
+    calibrator = calibration.Calibrator()
+    calibrator.feed(noise + offset)
+    assert calibrator.converged
+    result = calibrator.result()
+    np.testing.assert_allclose(result.bias[3:6], noise[:, 3:6].mean(axis=0) + offset[3:6], atol=3 * calibrator.tolerance[3])
+    assert np.linalg.norm(result.apply(noise + offset)[:, 0:3].mean(axis=0)) == pytest.approx(calibration.ACCEL_LSB_PER_G, rel=1e-3)
+    assert not calibrator.moved
+
+
+def test_short_bumps_are_skipped_long_motion_fails(desk):
+    noise = desk_noise(desk, 5)
+    bump = np.tile([[8000, 0, 0, 9000, -9000, 0], [-8000, 0, 0, -9000, 9000, 0]], (25, 1))
+
+    calibrator = calibration.Calibrator()
+    calibrator.feed(np.vstack((noise, bump, noise)))
+    assert not calibrator.moved
+    assert calibrator.rejected >= len(bump)
+
+    calibrator = calibration.Calibrator(max_moving=200)
+    calibrator.feed(noise)
+    calibrator.feed(np.tile(bump, (3, 1))[:150])
+    calibrator.feed(np.tile(bump, (3, 1))[:150])  # the run carries over between batches
+    assert calibrator.moved
+
+
+def test_not_enough_still_samples():
+    calibrator = calibration.Calibrator()
+    with pytest.raises(ValueError):
+        calibrator.result()
@@ -0,0 +1,113 @@
+import gzip
+import os
+
+import numpy as np
+import pytest
+
+import capturestore
+
+
+def samples(first, count, rate=100.0):
+    """count samples from number first on, one every 1 / rate seconds."""
+    return [(i, -i, 2 * i, 3, -4, 5, round(i / rate, 6)) for i in range(first, first + count)]
+
+
+def write(store, total, batch=37, rate=100.0):
+    written = []
+    for first in range(0, total, batch):
+        chunk = samples(first, min(batch, total - first), rate)
+        store.write_samples(chunk)
+        written += chunk
+    return written
+
+
+def files(directory):
+    return sorted(name for name in os.listdir(directory) if name not in (capturestore.INDEX_FILE, capturestore.LOCK_FILE))
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_rotates_before_max_bytes(tmp_path, binary):
+    store = capturestore.CaptureStore(str(tmp_path), binary=binary, max_bytes=4000, compression="none")
+    write(store, 1000)
+    store.close()
+    entries = capturestore.CaptureStore(str(tmp_path), writable=False).segments()
+    assert len(entries) > 3
+    assert all(entry["bytes"] <= 4000 for entry in entries)
+    assert all(os.path.getsize(tmp_path / entry["file"]) <= 4000 for entry in entries)
+    assert sum(entry["samples"] for entry in entries) == 1000
+
+
+def test_rotates_at_max_seconds(tmp_path):
+    store = capturestore.CaptureStore(str(tmp_path), max_seconds=1.0, compression="none")
+    write(store, 450)
+    store.close()
+    entries = store.segments()
+    assert [entry["samples"] for entry in entries] == [100, 100, 100, 100, 50]
+    assert all(entry["end"] - entry["start"] < 1.0 for entry in entries)
+
+
+def test_recover_cuts_a_torn_last_line(tmp_path):
+    store = capturestore.CaptureStore(str(tmp_path), compression="none")
+    written = write(store, 200)
+    store.segment.sync()
+    path = store.segment.path
+    with open(path, "a") as f:
+        f.write("Accel(x,y,z): (1, 2, 3)  Gyro(x,y")  # the write a crash interrupted
+    store.lock_handle.close()  # crash: nothing closed, index.json is stale
+
+    recovered = capturestore.CaptureStore(str(tmp_path), compression="none")
+    try:
+        with open(path, "rb") as f:
+            assert f.read().endswith(b"\n")
+        (entry,) = recovered.segments()
+        assert entry["samples"] == len(written)
+        times, imu = recovered.read_window(0, 100)
+        np.testing.assert_allclose(times, [sample[6] for sample in written])
+    finally:
+        recovered.close()
+
+
+def test_compression_leaves_one_copy(tmp_path):
+    store = capturestore.CaptureStore(str(tmp_path), max_bytes=4000, compression="gzip")
+    written = write(store, 500)
+    store.close()
+    entries = store.segments()
+    names = files(tmp_path)
+    assert names == sorted(entry["file"] for entry in entries)
+    assert all(name.endswith(".txt.gz") for name in names)
+    times, _ = store.read_window(0, 100)
+    np.testing.assert_allclose(times, [sample[6] for sample in written])
+
+    # A crash after writing the compressed copy but before deleting the original leaves both
+    first = entries[0]["file"]
+    with gzip.open(tmp_path / first, "rb") as f, open(tmp_path / first[:-len(".gz")], "wb") as out:
+        out.write(f.read())
+    reopened = capturestore.CaptureStore(str(tmp_path), compression="gzip")
+    reopened.close()
+    assert len(files(tmp_path)) == len(entries)
+    assert all(name.endswith(".gz") for name in files(tmp_path))
+    assert sum(entry["samples"] for entry in reopened.segments()) == 500
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_window_across_segments(tmp_path, binary):
+    store = capturestore.CaptureStore(str(tmp_path), binary=binary, max_seconds=1.0, compression="gzip")
+    write(store, 500)
+    store.write_marker("ERROR", 4.995, "Serial lost")
+    store.close()
+
+    reader = capturestore.CaptureStore(str(tmp_path), writable=False)
+    assert len(reader.segments(1.5, 3.2)) == 3
+    times, imu = reader.read_window(1.5, 3.2)
+    expected = [sample for sample in samples(0, 500) if 1.5 <= sample[6] <= 3.2]
+    np.testing.assert_allclose(times, [sample[6] for sample in expected])
+    np.testing.assert_array_equal(imu, [sample[:6] for sample in expected])
+    assert len(reader.read_window(10, 20)[0]) == 0
+
+
+def test_read_only_store_changes_nothing(tmp_path):
+    reader = capturestore.CaptureStore(str(tmp_path / "missing"), writable=False)
+    assert reader.segments() == []
+    assert not os.path.exists(tmp_path / "missing")
+    with pytest.raises(ValueError):
+        reader.write_samples(samples(0, 1))
@@ -0,0 +1,25 @@
+import pytest
+
+import configstore
+
+
+@pytest.mark.parametrize("value, expected", [
+    (True, True), (False, False), ("false", False), ("False", False), ("0", False), ("no", False),
+    ("off", False), (0, False), ("true", True), (" Yes ", True), ("1", True), (1, True),
+])
+def test_bool_strings(value, expected):
+    assert configstore.Snapshot({"REPLAY_LOOP": value}).replay_loop is expected
+
+
+@pytest.mark.parametrize("value", ["maybe", "", 2, [], {}])
+def test_invalid_bool_uses_the_default(value, capsys):
+    snapshot = configstore.Snapshot({"REPLAY_LOOP": value, "OVERLAY_STATS": value})
+    assert snapshot.replay_loop is True
+    assert snapshot.overlay_stats is False
+    assert "Invalid REPLAY_LOOP" in capsys.readouterr().out
+
+
+def test_other_casts():
+    snapshot = configstore.Snapshot({"REPLAY_SPEED": "2.5", "REPLAY_SESSION": "x"})
+    assert snapshot.replay_speed == 2.5
+    assert snapshot.replay_session == 0
@@ -0,0 +1,90 @@
+import os
+
+import numpy as np
+import pytest
+
+from conftest import EXAMPLE_DATA
+
+import imulogs
+
+
+def stream_sessions(path):
+    """Builds the sessions from iter_log the slow way, one event at a time."""
+    sessions = []
+    current = None
+    for event in imulogs.iter_log(path):
+        if event.kind == imulogs.START:
+            current = {"start": event.time, "end": None, "times": [], "imu": [], "errors": []}
+            sessions.append(current)
+        elif current is None and event.kind == imulogs.SAMPLE:
+            # Samples before the first START are a session of their own
+            current = {"start": None, "end": None, "times": [], "imu": [], "errors": []}
+            sessions.append(current)
+        if current is None:
+            continue
+        if event.kind == imulogs.SAMPLE:
+            current["times"].append(event.time)
+            current["imu"].append(event.values)
+        elif event.kind == imulogs.ERROR:
+            current["errors"].append((event.time, event.message))
+        elif event.kind == imulogs.END:
+            # END doesn't close the session, only the next START does
+            current["end"] = event.time
+    return sessions
+
+
+@pytest.mark.parametrize("name", ["drivelogs", "planelogs", "desklogs"])
+def test_bulk_parse_matches_streaming(name):
+    path = os.path.join(EXAMPLE_DATA, f"{name}.txt")
+    bulk = imulogs.load_log(path)
+    streamed = stream_sessions(path)
+
+    assert bulk.malformed == 0
+    assert len(bulk.sessions) == len(streamed)
+    for session, expected in zip(bulk.sessions, streamed):
+        assert session.start == expected["start"]
+        assert session.end == expected["end"]
+        assert session.errors == expected["errors"]
+        np.testing.assert_array_equal(session.times, np.array(expected["times"], dtype=np.float64))
+        np.testing.assert_array_equal(session.imu, np.array(expected["imu"], dtype=np.int32).reshape(-1, 6))
+
+
+def test_chunked_parse_matches_bulk():
+    path = os.path.join(EXAMPLE_DATA, "drivelogs.txt")
+    times, imu = imulogs.load_log(path).all_samples()
+    pieces = [piece.all_samples() for piece in imulogs.iter_chunks(path, chunk_bytes=4096)]
+    np.testing.assert_array_equal(np.concatenate([p[0] for p in pieces]), times)
+    np.testing.assert_array_equal(np.concatenate([p[1] for p in pieces]), imu)
+
+
+def test_malformed_lines_are_counted():
+    data = (b"START 10.5\n"
+            b"Accel(x,y,z): (1, -2, 3)  Gyro(x,y,z): (4, 5, -6), Time: 10.6\n"
+            b"Accel(x,y,z): (1, 2  Gyro\n"
+            b"garbage\n"
+            b"END 10.7\n")
+    log = imulogs.load_log(data)
+    assert log.malformed == 2
+    assert len(log.sessions) == 1
+    assert log.sessions[0].imu.tolist() == [[1, -2, 3, 4, 5, -6]]
+    assert log.sessions[0].times.tolist() == [10.6]
+
+
+def test_bulk_and_streaming_agree_on_odd_lines(tmp_path):
+    sample = "Accel(x,y,z): (1, -2, 3)  Gyro(x,y,z): (-4, 5, 6), Time: {}"
+    lines = [sample.format(text) for text in (
+        "12", "12.5", "0.1", "1749162052.1431017", "1749162050.417401", "3.0000000000000001",
+        "98765432109876.54321", "1.507", "1.7232655914", "7.25\r", "8.5   ",  # all good
+        "12.", ".5", "1.2.3", "12 5", "12.5x", "-3.5", "")]  # all malformed
+    lines.append("Accel(x,y,z): (1, -2)  Gyro(x,y,z): (-4, 5, 6), Time: 1.5")
+    path = tmp_path / "logs.txt"
+    path.write_bytes(("\n".join(lines) + "\n").encode())
+
+    streamed = [event for event in imulogs.iter_log(str(path)) if event.kind == imulogs.SAMPLE]
+    bulk = imulogs.load_log(str(path))
+    times, imu = bulk.all_samples()
+    assert len(streamed) == 11
+    assert bulk.malformed == len(lines) - len(streamed)
+    # Bit for bit the same times as float() gives
+    assert times.tolist() == [event.time for event in streamed]
+    assert imu.tolist() == [list(event.values) for event in streamed]
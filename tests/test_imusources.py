@@ -0,0 +1,24 @@
+import asyncio
+import sys
+
+import pytest
+
+import configstore
+import imusources
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="needs ptys")
+def test_esp32_tries_every_port():
+    import fakeesp32
+    master, port = fakeesp32.open_pty()
+    source = imusources.create("ESP32", configstore.Snapshot({"IMU_TYPE": "ESP32"}))
+    source.find_devices = lambda: ["/dev/no-such-esp32", port]
+    try:
+        assert asyncio.run(source.open())
+        assert source.is_open
+    finally:
+        source.close()
+
+    source.find_devices = lambda: ["/dev/no-such-esp32", "/dev/no-such-esp32-either"]
+    assert not asyncio.run(source.open())
+    assert source.reader is None
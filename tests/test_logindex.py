@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+import pytest
+
+from conftest import EXAMPLE_DATA
+
+import binlogs
+import imulogs
+import logindex
+
+CRAFTED = (b"Accel(x,y,z): (1, 1, 1)  Gyro(x,y,z): (1, 1, 1), Time: 9.0\n"
+           b"ERROR: Serial lost, 9.1\n"
+           b"START 10.0\n"
+           b"Accel(x,y,z): (2, 2, 2)  Gyro(x,y,z): (2, 2, 2), Time: 10.1\n"
+           b"END 10.2\n"
+           b"Accel(x,y,z): (3, 3, 3)  Gyro(x,y,z): (3, 3, 3), Time: 10.3\n"
+           b"ERROR: Serial lost, 10.4\n"
+           b"START 11.0\n"
+           b"START 12.0\n"
+           b"Accel(x,y,z): (4, 4, 4)  Gyro(x,y,z): (4, 4, 4), Time: 12.1\n"
+           b"Accel(x,y,z): (5, 5, 5)  Gyro(x,y,z): (5, 5, 5), Time: 12.2")  # still being written
+
+
+def assert_same_sessions(path):
+    index = logindex.LogIndex(str(path), save=False)
+    sessions = imulogs.load_log(str(path)).sessions
+    assert len(index.sessions) == len(sessions)
+    for number, (entry, session) in enumerate(zip(index.sessions, sessions)):
+        assert entry["start"] == session.start
+        assert entry["end"] == session.end
+        assert entry["samples"] == len(session)
+        assert entry["errors"] == len(session.errors)
+        if len(session):
+            assert entry["first"] == session.times[0]
+            assert entry["last"] == session.times[-1]
+        read = index.read_session(number)
+        np.testing.assert_array_equal(read.times, session.times)
+        np.testing.assert_array_equal(read.imu, session.imu)
+
+
+@pytest.mark.parametrize("name", ["drivelogs", "planelogs", "desklogs"])
+def test_index_and_load_log_agree(name):
+    assert_same_sessions(os.path.join(EXAMPLE_DATA, f"{name}.txt"))
+
+
+def test_every_tool_splits_sessions_the_same_way(tmp_path):
+    path = tmp_path / "logs.txt"
+    path.write_bytes(CRAFTED)
+    assert_same_sessions(path)
+
+    sessions = imulogs.load_log(str(path)).sessions
+    # Before the first START, START..START with an END inside, an empty START, the last one
+    assert [session.start for session in sessions] == [None, 10.0, 11.0, 12.0]
+    assert [session.times.tolist() for session in sessions] == [[9.0], [10.1, 10.3], [], [12.1]]
+    assert sessions[1].end == 10.2
+    assert [len(session.errors) for session in sessions] == [1, 1, 0, 0]
+
+    binlogs.convert_text_log(str(path), str(tmp_path / "logs.mblog"))
+    binary = binlogs.load_binary_log(str(tmp_path / "logs.mblog")).sessions()
+    assert [chunk["time"].tolist() for chunk in binary] == [session.times.tolist() for session in sessions]
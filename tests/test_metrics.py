@@ -0,0 +1,23 @@
+import json
+
+import metrics
+
+
+def test_snapshot_is_valid_json():
+    registry = metrics.Registry()
+    registry.histogram("empty_seconds", "Never observed")
+    slow = registry.histogram("slow_seconds", "Everything past the last bucket")
+    slow.observe_batch([5.0, 6.0, 7.0])
+    snapshot = json.loads(json.dumps(registry.snapshot(), allow_nan=False))
+    assert snapshot["empty_seconds"]["p50"] is None
+    assert snapshot["slow_seconds"]["p99"] == metrics.SECONDS_BUCKETS[-1]
+
+
+def test_quantile_is_the_bucket_bound():
+    histogram = metrics.Histogram("latency_seconds", "Latency")
+    for value in [0.0002] * 98 + [0.03, 0.3]:
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == 0.00025
+    assert histogram.quantile(0.99) == 0.05
+    assert histogram.quantile(1.0) == 0.5
+    assert histogram.count == 100
@@ -0,0 +1,50 @@
+import asyncio
+import sys
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import configstore
+import multicapture
+
+
+def test_drift_estimator_finds_the_slope():
+    rng = np.random.default_rng(1)
+    drift = multicapture.DriftEstimator()
+    for t in np.arange(0, 30, 0.01):
+        # Device clock 300 ppm fast, arrivals delayed by 1-20 ms of jitter
+        drift.observe(t + rng.uniform(0.001, 0.02), t * (1 + 300e-6))
+    assert drift.ppm == pytest.approx(300, abs=10)
+    corrected = drift.correct(np.array([drift.origin + 10.0]))
+    assert corrected[0] == pytest.approx(drift.origin + 10.0 - 10.0 * 300e-6, abs=1e-4)
+
+
+def test_drift_estimator_needs_enough_points():
+    drift = multicapture.DriftEstimator()
+    for t in np.arange(0, multicapture.DRIFT_MIN_POINTS - 1, 0.01):
+        drift.observe(t, t * (1 + 1000e-6))
+    assert drift.ppm == 0.0
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="needs ptys")
+def test_capture_estimates_injected_drift(tmp_path):
+    import fakeesp32
+    import synthetic
+
+    seconds = 8.0
+    _, imu = synthetic.SyntheticIMU("drive", 1000.0).seconds(seconds + 5)
+    master, port = fakeesp32.open_pty()
+    threading.Thread(target=fakeesp32.play, args=(master, imu, 1000.0, True),
+                     kwargs={"drift_ppm": -800.0, "started": time.perf_counter() + 0.5, "loop": False},
+                     daemon=True).start()
+
+    capture = multicapture.MultiCapture([port], ["imu0"], "binary", rate=1000.0, out=str(tmp_path),
+                                        settings=configstore.Snapshot({}))
+    asyncio.run(capture.run(seconds))
+
+    device = capture.devices[0]
+    assert device.samples > 0.8 * 1000 * (seconds - 1)
+    assert device.drift.ppm == pytest.approx(-800, abs=60)
+    assert (tmp_path / "merged.csv").exists()
@@ -0,0 +1,71 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+import websocket
+
+from conftest import EXAMPLE_DATA
+
+import fakephone
+import phoneclient
+
+CAPTURE = os.path.join(EXAMPLE_DATA, "desklogs.txt")
+
+
+@pytest.fixture
+def phone():
+    """A fake phone on a free port that plays the capture once, as fast as it can."""
+    server = fakephone.FakePhoneServer(CAPTURE, port=0, speed=0, loop=False)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, f"127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_every_sample_arrives(phone):
+    server, address = phone
+    client = phoneclient.PhoneClient(address)
+    client.ws = websocket.create_connection(phoneclient.sensors_url(address), timeout=5)
+    # The fake phone hangs up after one pass, receive() ends there
+    with pytest.raises(websocket.WebSocketConnectionClosedException):
+        client.receive()
+    client.ws.close()
+
+    count = len(server.times)
+    assert client.malformed == 0
+    assert client.ring.seq == count
+    assert client.linear_ring.seq == count
+
+    _, _, times, data = client.ring.since(0)
+    accel = np.array(server.values[phoneclient.ACCELEROMETER]) * phoneclient.ACCEL_COUNTS
+    gyro = np.array(server.values[phoneclient.GYROSCOPE]) * phoneclient.GYRO_COUNTS
+    np.testing.assert_allclose(data[:, 0:3], accel)
+    np.testing.assert_allclose(data[:, 3:6], gyro)
+    assert np.all(np.diff(times) >= 0)
+
+    _, _, _, linear = client.linear_ring.since(0)
+    np.testing.assert_allclose(linear, np.array(server.values[phoneclient.LINEAR_ACCELERATION]) * phoneclient.ACCEL_COUNTS)
+
+
+def test_client_thread_collects_and_stops(phone):
+    server, address = phone
+    server.loop = True
+    client = phoneclient.PhoneClient(address)
+    client.start()
+    try:
+        seq = 0
+        deadline = time.monotonic() + 10
+        # wait_for_samples returns straight away until the client has connected
+        while seq < len(server.times) and time.monotonic() < deadline:
+            _, seq, times, data = client.wait_for_samples(seq, timeout=0.1)
+            time.sleep(0.01)
+        assert seq >= len(server.times)
+        assert client.linear_ring.seq > 0
+    finally:
+        client.stop()
+        client.join(5)
+    assert not client.is_alive()
+    assert not client.connected
@@ -0,0 +1,44 @@
+import numpy as np
+
+import samplering
+
+
+def batch(first, count, width=6):
+    times = np.arange(first, first + count, dtype=np.float64)
+    return times, np.repeat(times[:, None], width, axis=1)
+
+
+def test_batches_wrap_around():
+    ring = samplering.SampleRing(capacity=16)
+    for first in range(0, 100, 7):
+        ring.push_batch(*batch(first, 7))
+    first_seq, end_seq, times, data = ring.since(0)
+    assert end_seq == 105
+    assert first_seq == ring.oldest_seq()
+    np.testing.assert_array_equal(times, np.arange(first_seq, end_seq))
+    np.testing.assert_array_equal(data[:, 0], times)
+
+
+def test_batch_larger_than_the_ring_keeps_the_newest():
+    ring = samplering.SampleRing(capacity=16)
+    ring.push_batch(*batch(0, 5))
+    ring.push_batch(*batch(5, 40))
+    assert ring.seq == 45
+    times, data = ring._window(45 - 16, 45)
+    np.testing.assert_array_equal(times, np.arange(29, 45))
+    assert ring.latest()[1] == 44.0
+
+
+def test_reader_never_sees_unwritten_rows():
+    # seq only moves after the rows are in, so whatever seq says is there is the new data
+    class Watched(samplering.SampleRing):
+        def __setattr__(self, name, value):
+            if name == "seq" and hasattr(self, "seq") and value > 0:
+                i = (value - 1) % self.capacity
+                assert self.times[i] == value - 1
+            super().__setattr__(name, value)
+
+    ring = Watched(capacity=16)
+    ring.push_batch(*batch(0, 5))
+    ring.push_batch(*batch(5, 40))
+    ring.push(45.0, [45.0] * 6)
@@ -0,0 +1,52 @@
+import numpy as np
+
+import serialframes
+
+
+def frames(first_seq, count, micros=1000000, step=1000):
+    imu = [(i, -i, 2 * i, 3, -4, 5) for i in range(count)]
+    data = b"".join(serialframes.encode_frame(first_seq + i, micros + i * step, imu[i]) for i in range(count))
+    return data, np.array(imu, dtype=np.int16)
+
+
+def test_decodes_split_reads():
+    data, imu = frames(0, 50)
+    decoder = serialframes.FrameDecoder()
+    decoded = [decoder.feed(data[i:i + 7], 100.0)[1] for i in range(0, len(data), 7)]
+    np.testing.assert_array_equal(np.concatenate(decoded), imu)
+    assert decoder.frames == 50
+    assert decoder.dropped == decoder.crc_errors == 0
+
+
+def test_resyncs_after_garbage():
+    first, first_imu = frames(0, 10)
+    second, second_imu = frames(10, 10, micros=1010000)
+    garbage = b"ESP32 boot\r\n\xa5\x5a\x00\x01junk" + bytes(range(40))
+    decoder = serialframes.FrameDecoder()
+    times, imu = decoder.feed(first + garbage + second, 100.0)
+    np.testing.assert_array_equal(imu, np.concatenate([first_imu, second_imu]))
+    assert decoder.frames == 20
+    assert decoder.dropped == 0
+    assert decoder.skipped_bytes == len(garbage)
+    np.testing.assert_allclose(np.diff(times), 0.001)
+
+
+def test_rejects_bad_crc():
+    data, imu = frames(0, 10)
+    corrupt = bytearray(data)
+    corrupt[5 * serialframes.FRAME_SIZE + 8] ^= 0xFF  # an imu byte of the sixth frame
+    decoder = serialframes.FrameDecoder()
+    _, decoded = decoder.feed(bytes(corrupt), 100.0)
+    np.testing.assert_array_equal(decoded, np.delete(imu, 5, axis=0))
+    assert decoder.crc_errors == 1
+    assert decoder.dropped == 1  # its seq never arrived
+
+
+def test_counts_dropped_frames_across_seq_wrap():
+    data, _ = frames(65530, 4)
+    later, _ = frames(65530 + 7, 3, micros=1007000)  # seq 65537 wraps to 1
+    decoder = serialframes.FrameDecoder()
+    decoder.feed(data, 100.0)
+    decoder.feed(later, 100.1)
+    assert decoder.frames == 7
+    assert decoder.dropped == 3
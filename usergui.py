@@ -6,83 +6,179 @@ from PyQt5.QtWidgets import (
     QProgressDialog
 )
 # 1. IMPORT QTIMER
-from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtCore import Qt, QTimer, QObject, QThread, pyqtSignal
 from PyQt5.QtGui import QPixmap
-import json
 import requests
 import os
+import threading
+import configstore
 
 # Location for files
 CONFIG_FILE = 'config.json'
 logo_path = 'logos/motionblob.png'
 socketport = 1202
+backend_url = f"http://127.0.0.1:{socketport}"
+# (connect, read) seconds, the backend is local so anything slower means it's stuck
+request_timeout = (0.5, 2.0)
 
-# Functions for reading config
-
-def read_config(value):
-    try:
-        with open(CONFIG_FILE, 'r') as f:
-            config = json.load(f)
-        return config[value]
-    except Exception as e:
-        print(f"Error reading config.json: {e}")
-        return None
-
-def write_config(value, new_value):
-    try:
-
-        with open(CONFIG_FILE, 'r') as f:
-            config = json.load(f)
-        config[value] = new_value
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump(config, f, indent=4)
-    except Exception as e:
-        print(f"Error writing config.json: {e}")
+# Config, shared with the backend. It notices changes to config.json by itself
+config = configstore.ConfigStore(CONFIG_FILE)
 
 #Gen Functions
 
-def backend_communication(command):
-    if command == "connection_status":
-        try:
-            if requests.get(f"http://127.0.0.1:{socketport}/status", timeout=1).status_code == 200:
-                return True
-        except requests.exceptions.ConnectionError:
-            return False
-        except requests.exceptions.Timeout:
-            return False
-    elif command == "update_config":
+class BackendClient(QObject):
+    """
+    Talks to the backend from its own thread through one pooled requests.Session,
+    so the window never waits on the network. Results come back to the UI as signals.
+    """
+    summary_ready = pyqtSignal(dict)  # /summary, every poll_interval while the backend is up
+    disconnected = pyqtSignal()
+    command_done = pyqtSignal(str, bool, dict)  # command, succeeded, backend's reply
+
+    commands = {
+        "start_calibration": "/start_calibration",
+        "cancel_calibration": "/cancel_calibration",
+    }
+
+    def __init__(self, poll_interval=1000):
+        super().__init__()
+        self.poll_interval = poll_interval
+        self.session = None
+        self.timer = None
+
+    def start(self):
+        # Runs in the worker thread, so the timer and the session live there too
+        self.session = requests.Session()
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.poll)
+        self.timer.start(self.poll_interval)
+        self.poll()
+
+    def poll(self):
         try:
-            requests.post(f"http://127.0.0.1:{socketport}/refreshconfig")
-            return True
-        except:
-            return False
-    elif command == "state":
+            response = self.session.get(f"{backend_url}/summary", timeout=request_timeout)
+            response.raise_for_status()
+            self.summary_ready.emit(response.json())
+        except (requests.RequestException, ValueError):
+            self.disconnected.emit()
+
+    def send(self, command):
         try:
-            return requests.get(f"http://127.0.0.1:{socketport}/status").json()["status"]
-        except:
-            return "Unknown"
-    elif command == "start_calibration":
+            response = self.session.post(f"{backend_url}{self.commands[command]}", timeout=request_timeout)
+        except requests.RequestException:
+            self.command_done.emit(command, False, {})
+            return
         try:
-            requests.post(f"http://127.0.0.1:{socketport}/start_calibration")
-            return True
-        except:
-            return False
-    elif command == "finish_calibration":
+            reply = response.json()
+        except ValueError:
+            reply = {}
+        self.command_done.emit(command, response.ok, reply)
+
+    def save_setting(self, key, value):
+        # config.set fsyncs under a file lock, that's no job for the UI thread
+        config.set(key, value)
+
+    def stop(self):
+        # Also in the worker thread, the timer has to be stopped where it lives
+        if self.timer is not None:
+            self.timer.stop()
+        if self.session is not None:
+            self.session.close()
+        QThread.currentThread().quit()
+
+
+class CalibrationWatcher(QObject):
+    """
+    Long polls /calibration_status from a thread and a Session of its own, so the summary
+    polls never wait behind it. Each poll is short (long_poll seconds) so stop() gets in soon.
+    """
+    calibration_progress = pyqtSignal(dict)  # /calibration_status, every time it changes
+    long_poll = 1.0
+
+    def __init__(self):
+        super().__init__()
+        self.session = None
+        self.stopping = threading.Event()  # set from the UI thread, stop() itself is queued
+
+    def start(self):
+        self.session = requests.Session()
+
+    def watch(self, version):
+        """One request per call, the next one is queued so stop() can get in between."""
+        if self.stopping.is_set():
+            return
         try:
-            requests.post(f"http://127.0.0.1:{socketport}/stop_calibration")
-            return True
-        except:
-            return False
+            response = self.session.get(f"{backend_url}/calibration_status", params={"after": version, "timeout": self.long_poll},
+                                        timeout=(request_timeout[0], self.long_poll + request_timeout[1]))
+            report = response.json()
+        except (requests.RequestException, ValueError):
+            self.calibration_progress.emit({"state": "failed", "reason": "Lost the connection to the backend"})
+            return
+        self.calibration_progress.emit(report)
+        if report.get("state") == "running":
+            QTimer.singleShot(0, lambda: self.watch(report["version"]))
+
+    def stop(self):
+        if self.session is not None:
+            self.session.close()
+        QThread.currentThread().quit()
 
 
 #frontend
 class Frontendbase(QWidget):
+    # Queued to the BackendClient's thread
+    backend_command = pyqtSignal(str)
+    watch_calibration = pyqtSignal(int)
+    save_setting = pyqtSignal(str, object)
+    stop_backend_client = pyqtSignal()
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle('Motion Blob Settings')
         self.setGeometry(100, 100, 400, 500)
-        self.current_imu_type = read_config('IMU_TYPE')
+        self.current_imu_type = config.current.imu_type
+        self.backend_connected = False
+        self.calibrating = False
+        self.closing = False
         self.init_ui()
+        self.start_backend_client()
+
+    def start_backend_client(self):
+        self.backend_thread = QThread(self)
+        self.backend_client = BackendClient()
+        self.backend_client.moveToThread(self.backend_thread)
+        self.backend_thread.started.connect(self.backend_client.start)
+        self.backend_client.summary_ready.connect(self.show_summary)
+        self.backend_client.disconnected.connect(self.show_disconnected)
+        self.backend_client.command_done.connect(self.command_done)
+        self.backend_command.connect(self.backend_client.send)
+        self.save_setting.connect(self.backend_client.save_setting)
+        self.stop_backend_client.connect(self.backend_client.stop)
+        self.backend_thread.start()
+
+        self.calibration_thread = QThread(self)
+        self.calibration_watcher = CalibrationWatcher()
+        self.calibration_watcher.moveToThread(self.calibration_thread)
+        self.calibration_thread.started.connect(self.calibration_watcher.start)
+        self.watch_calibration.connect(self.calibration_watcher.watch)
+        self.calibration_watcher.calibration_progress.connect(self.show_calibration_progress)
+        self.stop_backend_client.connect(self.calibration_watcher.stop)
+        self.calibration_thread.start()
+
+    def closeEvent(self, event):
+        running = [thread for thread in (self.backend_thread, self.calibration_thread) if thread.isRunning()]
+        if not running:
+            super().closeEvent(event)
+            return
+        # Never wait for a request in flight here: hide now, close for real once the workers are done
+        if not self.closing:
+            self.closing = True
+            self.calibration_watcher.stopping.set()
+            for thread in running:
+                thread.finished.connect(self.close)
+            self.stop_backend_client.emit()
+        self.hide()
+        event.ignore()
 
     def init_ui(self):
         main_layout = QVBoxLayout()
@@ -108,11 +204,13 @@ class Frontendbase(QWidget):
         self.backend_state_label.setAlignment(Qt.AlignCenter)
         main_layout.addWidget(self.backend_state_label)
 
-        self.status_timer = QTimer(self)
-        self.status_timer.timeout.connect(self.update_connection_status)
-        self.status_timer.start(6000)
+        self.source_label = QLabel(" ", self)
+        self.source_label.setAlignment(Qt.AlignCenter)
+        main_layout.addWidget(self.source_label)
 
-        self.update_connection_status()
+        self.health_label = QLabel(" ", self)
+        self.health_label.setAlignment(Qt.AlignCenter)
+        main_layout.addWidget(self.health_label)
 
         imu_settings_groupbox = QGroupBox("IMU Selection", self)
         imu_layout = QVBoxLayout()
@@ -128,7 +226,7 @@ class Frontendbase(QWidget):
         self.phone_ip_input = QLineEdit(self)
         self.phone_ip_input.setPlaceholderText("Enter Phone IP")
 
-        self.phone_ip_input.setText(read_config("PHONE_IP") or "")
+        self.phone_ip_input.setText(config.current.phone_ip)
 
         self.phone_ip_input.editingFinished.connect(self.save_phone_ip)
 
@@ -178,26 +276,42 @@ class Frontendbase(QWidget):
 
         self.setLayout(main_layout)
 
-    def update_connection_status(self):
-        """Checks the backend connection and updates the status label."""
-        if backend_communication("connection_status"):
-            backend_status = "Connected"
-            self.backend_status_label.setStyleSheet("color: green;")
-            self.backend_state_label.setText(f"State: {backend_communication('state')}")
+    def show_summary(self, summary):
+        """Live status from the backend's /summary, called every poll."""
+        self.backend_connected = True
+        self.backend_status_label.setStyleSheet("color: green;")
+        self.backend_status_label.setText("Backend Status: Connected")
+        self.backend_state_label.setText(f"State: {summary['status']}")
+        source = summary["source"]
+        if source is not None:
+            self.source_label.setText(f"Source: {source['name']}, {summary['sample_rate']:.0f} samples/sec")
         else:
-            backend_status = "Disconnected"
-            self.backend_status_label.setStyleSheet("color: red;")
-            self.backend_state_label.setText("")
-        self.backend_status_label.setText(f"Backend Status: {backend_status}")
+            self.source_label.setText("Source: none")
+        health = summary["health"]
+        latency = health["latency_ms_p99"]
+        self.health_label.setText(
+            f"Dropped {health['dropped']}, malformed {health['malformed']}, reconnects {health['reconnects']}"
+            + (f", latency p99 {latency:.1f} ms" if latency is not None else "")
+        )
+
+    def show_disconnected(self):
+        self.backend_connected = False
+        self.backend_status_label.setStyleSheet("color: red;")
+        self.backend_status_label.setText("Backend Status: Disconnected")
+        self.backend_state_label.setText("")
+        self.source_label.setText("")
+        self.health_label.setText("")
+
+    def command_done(self, command, ok, reply):
+        if command == "start_calibration":
+            self.calibration_started(ok, reply)
 
 
     def save_phone_ip(self):
         """Saves the content of the phone IP input field to the config."""
         ip_address = self.phone_ip_input.text()
         print(f"Saving Phone IP: {ip_address}")
-        write_config('PHONE_IP', ip_address)
-        # Notify the backend that the config has changed
-        backend_communication("update_config")
+        self.save_setting.emit('PHONE_IP', ip_address)
 
     def set_imu_type(self, imu_type):
         if self.current_imu_type == imu_type:
@@ -206,61 +320,75 @@ class Frontendbase(QWidget):
         self.current_imu_type = imu_type
         if imu_type == 'Phone':
             print("Phone IMU selected")
-            write_config('IMU_TYPE', 'Phone')
+            self.save_setting.emit('IMU_TYPE', 'Phone')
             self.phone_ip_input.setEnabled(True)
             self.start_calibration_button.setEnabled(False) # Disable calibration button
-            backend_communication("update_config")
 
         elif imu_type == 'ESP32':
             print("ESP32 IMU selected")
-            write_config('IMU_TYPE', 'ESP32')
+            self.save_setting.emit('IMU_TYPE', 'ESP32')
             self.phone_ip_input.setEnabled(False)
             self.start_calibration_button.setEnabled(True) # Enable calibration button
-            backend_communication("update_config")
 
         self.imu_type_display_label.setText(f'Current IMU: {self.current_imu_type}')
 
     def start_calibration_popup(self):
-        if not backend_communication("connection_status"):
+        if not self.backend_connected:
             QMessageBox.warning(self, "Calibration Error", "Cannot start calibration: Backend is disconnected.")
             return
+        self.start_calibration_button.setEnabled(False)
+        self.backend_command.emit("start_calibration")
+
+    def calibration_started(self, ok, reply):
+        self.start_calibration_button.setEnabled(self.current_imu_type == 'ESP32')
+        if not ok:
+            reason = reply.get("reason") or "Failed to send start calibration command to backend."
+            QMessageBox.warning(self, "Calibration Error", f"Cannot start calibration: {reason}")
+            return
+        self.calibrating = True
+        self.calibration_progress_dialog = QProgressDialog("Keep the device still...", "Cancel", 0, 100, self)
+        self.calibration_progress_dialog.setWindowTitle("Calibration in Progress")
+        self.calibration_progress_dialog.setWindowModality(Qt.WindowModal)
+        self.calibration_progress_dialog.setMinimumDuration(0)
+        self.calibration_progress_dialog.setAutoClose(False)
+        self.calibration_progress_dialog.setValue(0)
+        self.calibration_progress_dialog.canceled.connect(self.cancel_calibration)
+        self.calibration_progress_dialog.show()
+        # Progress comes from the backend, it finishes as soon as the estimate has converged
+        self.watch_calibration.emit(reply.get("version", 0))
+
+    def cancel_calibration(self):
+        if self.calibrating:
+            self.calibrating = False
+            self.backend_command.emit("cancel_calibration")
+
+    def show_calibration_progress(self, report):
+        if not self.calibrating and report.get("state") == "running":
+            return
+        state = report.get("state")
+        if state == "running":
+            gyro_error = [e for e in (report.get("standard_error") or [])[3:6] if e is not None]
+            self.calibration_progress_dialog.setValue(int(report.get("progress", 0) * 100))
+            self.calibration_progress_dialog.setLabelText(
+                f"Keep the device still...\n{report.get('still_samples', 0)} still samples"
+                + (f", gyro bias within {max(gyro_error):.2f}" if gyro_error else "")
+            )
+            return
 
-        if backend_communication("start_calibration"):
-            self.calibration_progress_dialog = QProgressDialog("Calibrating...", None, 0, 100, self)
-            self.calibration_progress_dialog.setWindowTitle("Calibration in Progress")
-            self.calibration_progress_dialog.setWindowModality(Qt.WindowModal)
-            self.calibration_progress_dialog.setMinimumDuration(0)
-            self.calibration_progress_dialog.setValue(0)
-            self.calibration_progress_dialog.show()
-
-            self.progress_timer = QTimer(self)
-            self.progress_timer.timeout.connect(self.update_calibration_progress)
-            self.progress_count = 0
-            self.progress_timer.start(100) # Update every 0.1 seconds for 10 seconds total
-
-            QTimer.singleShot(10000, self.finish_calibration_process) # 10 seconds total for calibration
-        else:
-            QMessageBox.critical(self, "Calibration Error", "Failed to send start calibration command to backend.")
-
-    def update_calibration_progress(self):
-        self.progress_count += 1
-        progress = int((self.progress_count / 100.0) * 100) # 100 updates over 10 seconds (100 * 0.1s)
-        self.calibration_progress_dialog.setValue(progress)
-        if self.progress_count >= 100:
-            self.progress_timer.stop()
-
-    def finish_calibration_process(self):
-        self.calibration_progress_dialog.close()
-        if backend_communication("finish_calibration"):
+        self.calibrating = False
+        self.calibration_progress_dialog.hide()
+        if state == "done":
+            result = report.get("result", {})
             msg_box = QMessageBox(self)
             msg_box.setWindowTitle("Calibration Complete")
-            msg_box.setText("Calibration finished successfully!")
+            msg_box.setText(f"Calibration finished in {report.get('elapsed', 0):.1f} s "
+                            f"({report.get('still_samples', 0)} still samples).")
+            msg_box.setDetailedText(f"Gyro bias: {result.get('bias', [])[3:6]}\nAccel scale: {result.get('scale', [])[0:3]}")
             finish_button = msg_box.addButton("Finish", QMessageBox.AcceptRole)
             msg_box.setIcon(QMessageBox.Information)
             msg_box.exec_()
-        else:
-            QMessageBox.critical(self, "Calibration Error", "Failed to send finish calibration command to backend.")
-
+        elif report.get("reason") != "Cancelled":
+            QMessageBox.critical(self, "Calibration Error", f"Calibration failed: {report.get('reason', 'unknown error')}")
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)